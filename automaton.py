@@ -0,0 +1,170 @@
+import numpy as np
+from store import STYLE_CODES
+
+# Graphs with at most this many nodes get a dense (nodes x nodes) weight table; larger ones are looked up
+# in a sorted array of packed arc keys instead
+DENSE_NODES = 2048
+# Padding in encoded input paths: steps after a path's end are skipped
+PAD = -1
+# A name that is not a node of the automaton; paths containing one are rejected
+UNKNOWN = -2
+
+
+class Automaton:
+    # A DSL graph read as a weighted automaton: the states are the nodes, the transitions are the arcs the
+    # edge styles allow (both ways for plain lines), and accepting runs go from a start (=>) to a final (*)
+    # node. Transitions are kept in NumPy arrays so batches of inputs can be run with one array op per step:
+    #
+    #   indptr, targets, weights   CSR of the outgoing arcs of each state, targets ascending
+    #   keys                       source * states + target of every arc, ascending (sparse lookup)
+    #   dense                      (states x states) arc weights, inf where there is no arc, or None
+    #
+    # Parallel arcs between two states (e.g. a --> b and b -- a) collapse to the cheapest one.
+    def __init__(self, nodes, src, dst, weights, starts, finals):
+        self.nodes = list(nodes)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        n = len(self.nodes)
+        self.start = np.zeros(n, dtype=bool)
+        self.start[[self.index[node] for node in starts if node in self.index]] = True
+        self.final = np.zeros(n, dtype=bool)
+        self.final[[self.index[node] for node in finals if node in self.index]] = True
+
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+        # Cheapest arc per (source, target): sort by key, then by weight, and keep the first of each key
+        keys = src * n + dst
+        order = np.lexsort((weights, keys))
+        keys = keys[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        self.keys = keys[first]
+        self.weights = weights[order][first]
+        self.targets = self.keys % max(n, 1)
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.keys // max(n, 1), minlength=n), out=self.indptr[1:])
+
+        self.dense = None
+        if n <= DENSE_NODES:
+            self.dense = np.full((n, n), np.inf)
+            self.dense[self.keys // max(n, 1), self.targets] = self.weights
+
+    @classmethod
+    def from_edge_table(cls, nodes, src, dst, weights, styles, starts=(), finals=()):
+        # styles are store.STYLE_CODES; a right arrow allows a -> b only, a left arrow b -> a only
+        styles = np.asarray(styles)
+        forward = styles != STYLE_CODES['left_arrow']
+        backward = (styles != STYLE_CODES['right_arrow']) & (src != dst)
+        return cls(nodes, np.concatenate([src[forward], dst[backward]]), np.concatenate([dst[forward], src[backward]]),
+                   np.concatenate([weights[forward], weights[backward]]), starts, finals)
+
+    @classmethod
+    def from_graph(cls, graph):
+        # Compiles the graph's current contents; start and final nodes come from its query index
+        if graph.queries is None:
+            raise ValueError("Compiling an automaton needs the graph's start/final index (Graph(queries=True))")
+        nodes, src, dst, weights, styles = graph.store.edge_table()
+        return cls.from_edge_table(nodes, src, dst, weights, styles, graph.queries.starts, graph.queries.finals)
+
+    @classmethod
+    def from_connections(cls, connections):
+        # Compiles a list of connections such as Interpreter.clear_tree returns; destroy commands are skipped
+        index = {}
+        src, dst, weights, styles = [], [], [], []
+        starts, finals = set(), set()
+        for connection in connections:
+            if connection.destroy:
+                continue
+            for name in (connection.name_a, connection.name_b):
+                index.setdefault(name.value, len(index))
+                if name.start:
+                    starts.add(name.value)
+                if name.final:
+                    finals.add(name.value)
+            src.append(index[connection.name_a.value])
+            dst.append(index[connection.name_b.value])
+            weights.append(connection.weight.value)
+            styles.append(connection.left_dir | connection.right_dir << 1)
+        return cls.from_edge_table(list(index), np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64),
+                                   np.array(weights, dtype=np.float64), np.array(styles, dtype=np.uint8),
+                                   starts, finals)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def encode(self, paths):
+        # Sequences of node names -> (paths x longest) int32 state array, padded with PAD
+        width = max((len(path) for path in paths), default=0)
+        encoded = np.full((len(paths), width), PAD, dtype=np.int32)
+        index = self.index
+        for row, path in enumerate(paths):
+            encoded[row, :len(path)] = [index.get(node, UNKNOWN) for node in path]
+        return encoded
+
+    def step_weights(self, current, following):
+        # Weight of the arc current -> following for each pair, inf where there is none
+        if self.dense is not None:
+            return self.dense[current, following]
+        if len(self.keys) == 0:
+            return np.full(len(current), np.inf)
+        keys = current.astype(np.int64) * len(self.nodes) + following
+        found = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[found] == keys, self.weights[found], np.inf)
+
+    def run(self, paths):
+        # Runs a batch of state paths (see encode). A path is accepted if it starts at a start state, every
+        # step follows an arc and it ends at a final state. Returns (accepted, total weight along the path);
+        # the weight is inf for paths that leave the graph.
+        paths = np.asarray(paths)
+        if paths.ndim != 2:
+            raise ValueError("Paths must be a (paths x steps) array")
+        count, width = paths.shape
+        accepted = np.zeros(count, dtype=bool)
+        totals = np.full(count, np.inf)
+        if width == 0 or len(self.nodes) == 0:
+            return accepted, totals
+
+        first = paths[:, 0]
+        alive = first >= 0
+        totals[alive] = 0.0
+        last = first.copy()
+        for step in range(1, width):
+            following = paths[:, step]
+            moving = alive & (following != PAD)
+            # Unknown names make the step fail; the clip only keeps the lookup in bounds
+            weights = self.step_weights(last[moving], np.clip(following[moving], 0, None))
+            weights[following[moving] < 0] = np.inf
+            totals[moving] += weights
+            last[moving] = following[moving]
+            alive &= np.isfinite(totals)
+        accepted[alive] = self.start[first[alive]] & self.final[last[alive]]
+        return accepted, totals
+
+    def walk(self, count, steps, seed=None):
+        # count random walks from uniformly chosen start states, each taking up to `steps` uniformly chosen
+        # arcs and stopping at the first final state or at a state with no way out. Returns (accepted, total
+        # weight, steps taken, end state) arrays.
+        rng = np.random.default_rng(seed)
+        starts = np.flatnonzero(self.start)
+        totals = np.zeros(count)
+        taken = np.zeros(count, dtype=np.int64)
+        if len(starts) == 0:
+            return np.zeros(count, dtype=bool), np.full(count, np.inf), taken, np.full(count, PAD, dtype=np.int64)
+
+        state = starts[rng.integers(len(starts), size=count)]
+        degree = np.diff(self.indptr)
+        accepted = self.final[state]
+        active = ~accepted & (degree[state] > 0)
+        for _ in range(steps):
+            walkers = np.flatnonzero(active)
+            if len(walkers) == 0:
+                break
+            current = state[walkers]
+            arc = self.indptr[current] + (rng.random(len(walkers)) * degree[current]).astype(np.int64)
+            state[walkers] = self.targets[arc]
+            totals[walkers] += self.weights[arc]
+            taken[walkers] += 1
+            arrived = self.final[state[walkers]]
+            accepted[walkers] = arrived
+            active[walkers] = ~arrived & (degree[state[walkers]] > 0)
+        return accepted, totals, taken, state
@@ -0,0 +1,64 @@
+import argparse
+import time
+import numpy as np
+from automaton import Automaton
+from benchmarks.workloads import WORKLOADS
+from interpreter import Interpreter
+from lexer import Lexer
+from parser_ import Parser
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def sample_paths(automaton, count, length, seed=0):
+    # Mostly valid inputs: random walks along the arcs, with one step in ten replaced by a random state
+    rng = np.random.default_rng(seed)
+    degree = np.diff(automaton.indptr)
+    paths = np.empty((count, length), dtype=np.int32)
+    state = rng.integers(len(automaton), size=count)
+    paths[:, 0] = state
+    for step in range(1, length):
+        arc = automaton.indptr[state] + (rng.random(count) * degree[state]).astype(np.int64)
+        state = np.where(degree[state] > 0, automaton.targets[np.minimum(arc, len(automaton.targets) - 1)], state)
+        noise = rng.random(count) < 0.1
+        state[noise] = rng.integers(len(automaton), size=noise.sum())
+        paths[:, step] = state
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Automaton compile time and batch throughput")
+    parser.add_argument('-w', '--workload', default='sparse', choices=sorted(WORKLOADS))
+    parser.add_argument('-n', '--size', type=int, default=5000, help="nodes in the workload")
+    parser.add_argument('--paths', type=int, default=1_000_000)
+    parser.add_argument('--length', type=int, default=8, help="states per input path")
+    parser.add_argument('--steps', type=int, default=32, help="maximum steps per random walk")
+    args = parser.parse_args()
+
+    text = WORKLOADS[args.workload](args.size)
+    connections = Interpreter.clear_tree(list(Parser(Lexer(text, positions=False).generate_tokens()).parse_document()))
+    automaton, seconds = timed(Automaton.from_connections, connections)
+    table = 'dense' if automaton.dense is not None else 'sparse'
+    print(f"compile: {len(automaton)} states, {len(automaton.keys)} arcs ({table}) in {seconds * 1000:.1f}ms")
+
+    # The workloads carry no markers; make every 50th state a start and every 7th a final
+    automaton.start[::50] = True
+    automaton.final[::7] = True
+
+    paths = sample_paths(automaton, args.paths, args.length)
+    (accepted, totals), seconds = timed(automaton.run, paths)
+    print(f"run: {args.paths} paths x {args.length} states in {seconds:.2f}s "
+          f"({args.paths / seconds / 1e6:.2f}M paths/s, {accepted.mean():.1%} accepted)")
+
+    (accepted, totals, taken, end), seconds = timed(automaton.walk, args.paths, args.steps, seed=0)
+    print(f"walk: {args.paths} walks of up to {args.steps} steps in {seconds:.2f}s "
+          f"({args.paths / seconds / 1e6:.2f}M walks/s, {accepted.mean():.1%} accepted, "
+          f"{taken.mean():.1f} steps on average)")
+
+
+if __name__ == "__main__":
+    main()
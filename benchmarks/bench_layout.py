@@ -0,0 +1,55 @@
+import argparse
+import time
+import networkx as nx
+import numpy as np
+from force_layout import force_directed_layout
+
+
+def random_graph(nodes, edges, seed=0):
+    # A connected sparse graph: a random spanning tree plus uniformly random extra edges
+    rng = np.random.default_rng(seed)
+    G = nx.DiGraph()
+    G.add_nodes_from(range(nodes))
+    parents = (rng.random(nodes - 1) * np.arange(1, nodes)).astype(int)
+    G.add_edges_from(zip(parents.tolist(), range(1, nodes)))
+    while G.number_of_edges() < edges:
+        pairs = rng.integers(0, nodes, (edges - G.number_of_edges(), 2))
+        G.add_edges_from((a, b) for a, b in pairs.tolist() if a != b)
+    return G
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Large graph layout timings")
+    parser.add_argument('--nodes', type=int, default=10000)
+    parser.add_argument('--edges', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare-nodes', type=int, default=500,
+                        help="size at which to compare against the networkx layouts")
+    args = parser.parse_args()
+
+    G = random_graph(args.nodes, args.edges, args.seed)
+    pos, seconds = timed(force_directed_layout, G, seed=args.seed)
+    again, _ = timed(force_directed_layout, G, seed=args.seed)
+    deterministic = all(np.array_equal(pos[node], again[node]) for node in G)
+    print(f"force_directed_layout: {args.nodes} nodes, {G.number_of_edges()} edges in {seconds:.2f}s "
+          f"(deterministic: {deterministic})")
+
+    _, seconds = timed(force_directed_layout, G, pos=pos, iterations=10)
+    print(f"warm refinement (10 iterations): {seconds:.2f}s")
+
+    small = random_graph(args.compare_nodes, args.compare_nodes * 5, args.seed)
+    for name, function in (("force_directed_layout", force_directed_layout),
+                           ("kamada_kawai_layout", nx.kamada_kawai_layout),
+                           ("spring_layout", nx.spring_layout)):
+        _, seconds = timed(function, small)
+        print(f"{name}: {args.compare_nodes} nodes in {seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
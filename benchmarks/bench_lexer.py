@@ -0,0 +1,122 @@
+import argparse
+import random
+import sys
+import time
+from collections import deque
+from lexer import Lexer, WHITESPACE, DIGITS, ALPHA
+from tokens import Token, TokenType
+
+# Throughput the buffer lexer has to sustain, with and without positions, as a multiple of the
+# character-iterator lexer it replaced
+TARGET_SPEEDUP = 1.4
+
+OPERATORS = ['--', '-->', '<--', '<-->', '-/-', '-2.5->', '<-10-']
+
+
+class IteratorLexer:
+    # The previous character-at-a-time lexer, kept as the reference point for the throughput target
+    def __init__(self, text):
+        self.text = iter(text)
+        self.advance()
+
+    def advance(self):
+        try:
+            self.current_char = next(self.text)
+        except StopIteration:
+            self.current_char = None
+
+    def generate_tokens(self):
+        while self.current_char is not None:
+            if self.current_char in WHITESPACE:
+                self.advance()
+            elif self.current_char == '-':
+                self.advance()
+                yield Token(TokenType.DASH)
+            elif self.current_char in ALPHA:
+                name_str = self.current_char
+                self.advance()
+                while self.current_char is not None and self.current_char in ALPHA:
+                    name_str += self.current_char
+                    self.advance()
+                yield Token(TokenType.NAME, name_str)
+            elif self.current_char == '<':
+                self.advance()
+                yield Token(TokenType.LEFT)
+            elif self.current_char == '>':
+                self.advance()
+                yield Token(TokenType.RIGHT)
+            elif self.current_char == '.' or self.current_char in DIGITS:
+                number_str = self.current_char
+                self.advance()
+                while self.current_char is not None and (self.current_char == '.' or self.current_char in DIGITS):
+                    number_str += self.current_char
+                    self.advance()
+                yield Token(TokenType.WEIGHT, float(number_str))
+            elif self.current_char == '*':
+                self.advance()
+                yield Token(TokenType.FINAL)
+            elif self.current_char == '/':
+                self.advance()
+                yield Token(TokenType.DESTROY)
+            elif self.current_char == '=':
+                self.advance()
+                self.advance()
+                yield Token(TokenType.START)
+            else:
+                raise Exception(f"Illegal character '{self.current_char}'")
+
+
+def generate_text(size, seed=0):
+    rng = random.Random(seed)
+    names = [''.join(rng.choice(ALPHA) for _ in range(rng.randint(1, 8))) for _ in range(1000)]
+    lines = []
+    length = 0
+    while length < size:
+        line = f"{rng.choice(['', '*', '=>'])}{rng.choice(names)} {rng.choice(OPERATORS)} {rng.choice(names)}"
+        lines.append(line)
+        length += len(line) + 1
+    return '\n'.join(lines)
+
+
+LEXERS = {
+    'buffer lexer': Lexer,
+    'without positions': lambda text: Lexer(text, positions=False),
+    'iterator lexer': IteratorLexer,
+}
+
+
+def throughput(text, repeat):
+    # Best MB/s of each lexer. The runs are interleaved, so a slow spell of the machine does not fall on
+    # one lexer only.
+    best = dict.fromkeys(LEXERS, float('inf'))
+    for _ in range(repeat):
+        for label, lexer_class in LEXERS.items():
+            start = time.perf_counter()
+            deque(lexer_class(text).generate_tokens(), maxlen=0)
+            best[label] = min(best[label], time.perf_counter() - start)
+    return {label: len(text) / 1e6 / seconds for label, seconds in best.items()}
+
+
+def main():
+    # Exits with 1 when the buffer lexer falls short of TARGET_SPEEDUP in either mode
+    parser = argparse.ArgumentParser(description="Lexer throughput in MB/s")
+    parser.add_argument('--size-mb', type=float, default=4.0)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    text = generate_text(int(args.size_mb * 1e6))
+    rates = throughput(text, args.repeat)
+    previous = rates.pop('iterator lexer')
+
+    print(f"iterator lexer:    {previous:.2f} MB/s")
+    passed = True
+    for label, rate in rates.items():
+        speedup = rate / previous
+        passed = passed and speedup >= TARGET_SPEEDUP
+        print(f"{label + ':':18s} {rate:.2f} MB/s, {speedup:.2f}x")
+    print(f"target {TARGET_SPEEDUP:.1f}x: {'met' if passed else 'MISSED'}")
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
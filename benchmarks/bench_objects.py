@@ -0,0 +1,49 @@
+import argparse
+import gc
+import sys
+import tracemalloc
+from benchmarks.bench_lexer import generate_text
+from document import Document
+from lexer import Lexer
+from parser_ import Parser
+
+
+def parse_script(text):
+    return list(Parser(Lexer(text, positions=False).generate_tokens()).parse_document())
+
+
+def edit_script(text):
+    document = Document()
+    document.update(text)
+    return document
+
+
+def measure(stage, text):
+    # Peak traced memory while the stage runs, and the allocated blocks its result keeps alive
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    result = stage(text)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    return result, sys.getallocatedblocks() - blocks, current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Allocations and memory of parsing a large script")
+    parser.add_argument('--lines', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    # generate_text sizes by characters; lines average about 17 characters
+    text = generate_text(args.lines * 17)
+    lines = text.count('\n') + 1
+    for stage in (parse_script, edit_script):
+        result, blocks, current, peak = measure(stage, text)
+        print(f"{stage.__name__:12s} {lines} lines: {blocks / lines:6.2f} blocks/line retained, "
+              f"{current / lines:7.1f} bytes/line retained, {peak / 1e6:7.1f} MB peak")
+        del result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import os
+import random
+import time
+from benchmarks.workloads import WORKLOADS, name
+from interpreter import Interpreter
+from lexer import Lexer
+from parallel import EdgeRecords, parse_parallel, parse_records, split_lines
+from parser_ import Parser
+
+OPERATORS = ['--', '-->', '<--', '<-->', '-2.5->', '<-10-', '-/-', '-0-']
+
+
+def edit_script(n, lines, seed=0):
+    # Re-declarations in both directions, destroys and start/final markers, to exercise the merge semantics
+    rng = random.Random(seed)
+    script = []
+    for _ in range(lines):
+        a = f"{rng.choice(['', '', '*', '=>'])}{name(rng.randrange(n))}"
+        b = f"{rng.choice(['', '', '*', '=>'])}{name(rng.randrange(n))}"
+        script.append(f"{a} {rng.choice(OPERATORS)} {b}")
+    return '\n'.join(script)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def sequential(text):
+    return Interpreter.clear_tree(Parser(Lexer(text, positions=False).generate_tokens()).parse_document())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sequential vs process-pool parsing of one large document")
+    parser.add_argument('-w', '--workload', default='edits', choices=['edits'] + sorted(WORKLOADS))
+    parser.add_argument('-n', '--size', type=int, default=50000, help="nodes in the workload")
+    parser.add_argument('--lines', type=int, default=1_000_000, help="lines of the edits workload")
+    parser.add_argument('-j', '--jobs', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    if args.workload == 'edits':
+        text = edit_script(args.size, args.lines)
+    else:
+        text = WORKLOADS[args.workload](args.size)
+    print(f"{len(text) / 1e6:.1f}MB, {text.count(chr(10)) + 1} lines, {os.cpu_count()} CPUs")
+
+    reference, base = timed(sequential, text)
+    print(f"sequential: {base:.2f}s, {len(reference)} connections")
+
+    # The parent's own share of a parallel parse, which bounds the speedup more jobs can give
+    count = max(2, 4 * (os.cpu_count() or 1))
+    pieces, split = timed(split_lines, text, count)
+    parts = [parse_records(*piece) for piece in pieces]
+    records, merge = timed(lambda: EdgeRecords.concatenate(parts).cleared())
+    _, build = timed(records.connections)
+    serial = split + merge + build
+    print(f"serial part: split {split:.3f}s, merge {merge:.3f}s, connections {build:.3f}s "
+          f"({serial / base:.1%} of sequential, speedup bound {base / serial:.1f}x)")
+
+    for jobs in sorted(set(args.jobs)):
+        connections, seconds = timed(lambda: parse_parallel(text, jobs).connections())
+        same = connections == reference and all(
+            x.name_a is y.name_a and x.name_b is y.name_b and x.weight is y.weight
+            for x, y in zip(connections, reference))
+        print(f"{jobs:3d} jobs: {seconds:.2f}s  speedup {base / seconds:4.2f}x  "
+              f"{'identical' if same else 'DIFFERENT'}")
+
+
+if __name__ == "__main__":
+    main()
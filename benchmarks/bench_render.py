@@ -0,0 +1,155 @@
+import argparse
+import random
+import time
+import networkx as nx
+import numpy as np
+from headless import new_graph
+from renderer import Renderer
+
+STYLES = ['double_arrow', 'left_arrow', 'right_arrow', 'line']
+WEIGHTS = [0, 0, 1.5, 2.0]
+
+
+def per_edge_render(graph, pos):
+    # The previous rendering path: one draw_networkx_edges call per edge. Nodes and edges are drawn in name
+    # order, the order Renderer stacks them in.
+    graph.ax.clear()
+    nodes = sorted(graph.G)
+    nx.draw_networkx_nodes(graph.G, pos, nodelist=nodes, node_color='skyblue', node_size=700, ax=graph.ax)
+    nx.draw_networkx_labels(graph.G, pos, labels={node: node for node in nodes}, font_weight='bold', ax=graph.ax)
+
+    edge_labels = {}
+    for a, b, data in sorted(graph.G.edges(data=True), key=lambda edge: edge[:2]):
+        if data['weight'] > 0:
+            edge_labels[(a, b)] = f"{data['weight']}"
+        style = data.get('style', 'line')
+        if style == 'double_arrow':
+            nx.draw_networkx_edges(graph.G, pos, edgelist=[(a, b)], arrowstyle='<->', arrowsize=20, ax=graph.ax)
+        elif style == 'left_arrow':
+            nx.draw_networkx_edges(graph.G, pos, edgelist=[(a, b)], arrowstyle='<-', arrowsize=20, ax=graph.ax)
+        elif style == 'right_arrow':
+            nx.draw_networkx_edges(graph.G, pos, edgelist=[(a, b)], arrowstyle='->', arrowsize=20, ax=graph.ax)
+        else:
+            nx.draw_networkx_edges(graph.G, pos, edgelist=[(a, b)], arrowstyle='-', ax=graph.ax)
+
+    nx.draw_networkx_edge_labels(graph.G, pos, edge_labels=edge_labels, ax=graph.ax)
+    graph.fig.canvas.draw()
+
+
+def build_graph(nodes, edges, seed=0, compact=False):
+    rng = random.Random(seed)
+    graph = new_graph(compact=compact)
+    while graph.store.number_of_edges() < edges:
+        a, b = rng.randrange(nodes), rng.randrange(nodes)
+        if a != b:
+            graph.store.add_edge(f"n{a}", f"n{b}", rng.choice(WEIGHTS), rng.choice(STYLES))
+    pos = {node: (rng.random(), rng.random()) for node in graph.store.nodes()}
+    return graph, pos
+
+
+def build_grid(edges, seed=0, compact=False, size=None):
+    # A square grid of about the given number of edges in the unit square, so every edge is short
+    rng = random.Random(seed)
+    side = max(2, int((edges / 2) ** 0.5) + 1)
+    graph = new_graph(compact=compact)
+    if size:
+        graph.fig.set_size_inches(size, size)
+    for i in range(side):
+        for j in range(side):
+            if j + 1 < side:
+                graph.store.add_edge(f"n{i}x{j}", f"n{i}x{j + 1}", rng.choice(WEIGHTS), rng.choice(STYLES))
+            if i + 1 < side:
+                graph.store.add_edge(f"n{i}x{j}", f"n{i + 1}x{j}", rng.choice(WEIGHTS), rng.choice(STYLES))
+    pos = {f"n{i}x{j}": (j / (side - 1), i / (side - 1)) for i in range(side) for j in range(side)}
+    return graph, pos
+
+
+def edit(graph, pos, edges, rng):
+    # One random edit through the store, the way Graph makes them: an edge re-weighted or re-styled, removed
+    # (with an end left isolated), or added, to a new node placed near an existing one half of the time
+    store = graph.store
+    roll = rng.random()
+    if roll < 0.4:
+        a, b = rng.choice(edges)
+        store.add_edge(a, b, rng.choice(WEIGHTS), rng.choice(STYLES))
+    elif roll < 0.7 and len(edges) > 1:
+        a, b = edges.pop(rng.randrange(len(edges)))
+        store.remove_edge(a, b)
+        for node in (a, b):
+            if store.degree(node) == 0:
+                store.remove_node(node)
+    else:
+        a = rng.choice(edges)[0]
+        nodes = list(pos)
+        if roll < 0.85:
+            b = f"new{len(pos)}"
+            x, y = pos[a]
+            pos[b] = (min(1.0, max(0.0, x + rng.uniform(-0.05, 0.05))),
+                      min(1.0, max(0.0, y + rng.uniform(-0.05, 0.05))))
+        else:
+            b = rng.choice(nodes)
+            while b not in store or b == a:
+                b = rng.choice(nodes)
+        if not store.has_edge(a, b):
+            edges.append((a, b))
+        store.add_edge(a, b, rng.choice(WEIGHTS), rng.choice(STYLES))
+
+
+def edit_run(graph, pos, count, seed=1):
+    # Seconds per render of count one-edge edits, and how many pixels differ from drawing the result afresh
+    rng = random.Random(seed)
+    edges = [(a, b) for a, b, weight, style in graph.store.edges()]
+    graph.render(pos)
+    times = []
+    for _ in range(count):
+        edit(graph, pos, edges, rng)
+        times.append(timed(graph.render, pos))
+    edited = np.asarray(graph.fig.canvas.buffer_rgba()).astype(int)
+    graph.renderer = Renderer(graph.ax)
+    graph.render(pos)
+    difference = np.abs(edited - np.asarray(graph.fig.canvas.buffer_rgba()))
+    return times, int(difference.any(axis=2).sum()), int(difference.max())
+
+
+def report_edits(label, times, changed, delta):
+    print(f"{label}: {len(times)} one-edge edits, median {np.median(times) * 1000:7.1f}ms  "
+          f"max {max(times) * 1000:7.1f}ms  pixels differing from a fresh render: {changed} "
+          f"(max channel delta {delta})")
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-edge vs style-grouped edge rendering, and one-edge edits")
+    parser.add_argument('--edges', type=int, nargs='+', default=[100, 500, 2000])
+    parser.add_argument('--grid', type=int, default=10000, help="edges of the grid the edits are also timed on")
+    parser.add_argument('--edits', type=int, default=50)
+    parser.add_argument('--compact', action='store_true', help="use the compact store")
+    parser.add_argument('--grid-inches', type=float, default=None,
+                        help="figure size of the grid; the default 5in crowds a 10k-edge grid into 7px per node")
+    args = parser.parse_args()
+
+    for edges in args.edges:
+        graph, pos = build_graph(max(10, edges // 2), edges, compact=args.compact)
+        before = timed(per_edge_render, graph, pos)
+        reference = np.asarray(graph.fig.canvas.buffer_rgba()).copy()
+        after = timed(graph.render, pos)
+        difference = np.abs(reference.astype(int) - np.asarray(graph.fig.canvas.buffer_rgba()))
+        changed = int(difference.any(axis=2).sum())
+        print(f"{edges:6d} edges: per-edge {before:7.2f}s  grouped {after:7.2f}s  speedup {before / after:5.1f}x  "
+              f"pixels differing: {changed} (max channel delta {difference.max()})")
+        report_edits(f"{edges:6d} edges", *edit_run(graph, pos, args.edits))
+
+    if args.grid:
+        graph, pos = build_grid(args.grid, compact=args.compact, size=args.grid_inches)
+        full = timed(graph.render, pos)
+        print(f"{graph.store.number_of_edges():6d}-edge grid: full draw {full:7.2f}s")
+        report_edits(f"{graph.store.number_of_edges():6d}-edge grid", *edit_run(graph, pos, args.edits))
+
+
+if __name__ == "__main__":
+    main()
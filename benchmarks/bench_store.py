@@ -0,0 +1,43 @@
+import argparse
+import gc
+import random
+import tracemalloc
+from store import STYLES, CompactGraphStore, NetworkxStore
+
+
+def edge_list(edges, nodes, seed=0):
+    rng = random.Random(seed)
+    names = [f"n{i}" for i in range(nodes)]
+    return [(rng.choice(names), rng.choice(names), rng.choice([0, 1.5, 2.0]), rng.choice(STYLES))
+            for _ in range(edges)], names
+
+
+def measure(store_class, edges):
+    # Bytes allocated by the store itself; node name strings are created beforehand and shared
+    gc.collect()
+    tracemalloc.start()
+    store = store_class()
+    for a, b, weight, style in edges:
+        store.add_edge(a, b, weight, style)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return store, current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory per edge of the graph stores")
+    parser.add_argument('--edges', type=int, default=1_000_000)
+    parser.add_argument('--nodes', type=int, default=100_000)
+    args = parser.parse_args()
+
+    edges, names = edge_list(args.edges, args.nodes)
+    for store_class in (NetworkxStore, CompactGraphStore):
+        store, current, peak = measure(store_class, edges)
+        count = store.number_of_edges()
+        print(f"{store_class.__name__:18s} {count} edges, {len(store)} nodes: "
+              f"{current / count:7.1f} bytes/edge retained, {peak / count:7.1f} bytes/edge peak")
+        del store
+
+
+if __name__ == "__main__":
+    main()
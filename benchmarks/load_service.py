@@ -0,0 +1,145 @@
+import argparse
+import http.client
+import json
+import random
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+from benchmarks.workloads import name
+from service import RenderServer, RenderService, UnixHTTPConnection
+
+OPERATORS = ['--', '-->', '<--', '<-->', '-2.5->', '<-10-', '-3-']
+
+
+def script(seed, nodes, edges):
+    # A random graph; different seeds almost always give different edge sets
+    rng = random.Random(seed)
+    pairs = {tuple(sorted(rng.sample(range(nodes), 2))) for _ in range(edges)}
+    return [f"{name(a)} {rng.choice(OPERATORS)} {name(b)}" for a, b in sorted(pairs)]
+
+
+def mirror(line):
+    # "a OP b" as "b OP' a", the same edge written the other way round
+    a, operator, b = line.split()
+    core = operator.strip('<>')
+    return f"{b} {'<' if operator.endswith('>') else ''}{core}{'>' if operator.startswith('<') else ''} {a}"
+
+
+def equivalent(lines, rng):
+    # A different text for the same edge set: every edge mirrored, plus an edge that is added and destroyed
+    extra = f"{name(10 ** 6 + rng.randrange(10 ** 6))} -- {name(10 ** 6)}"
+    return [mirror(line) for line in lines] + [extra, extra.replace('--', '-/-')]
+
+
+class Client:
+    # One keep-alive connection to the service
+    def __init__(self, url=None, unix=None):
+        if unix:
+            self.connection = UnixHTTPConnection(unix)
+        else:
+            parts = urlsplit(url)
+            self.connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+
+    def render(self, text, mode='default', fmt='png'):
+        self.connection.request('POST', f'/render?mode={mode}&format={fmt}', text.encode(),
+                                {'Content-Type': 'text/plain'})
+        response = self.connection.getresponse()
+        body = response.read()
+        return response.status, response.getheader('X-Cache'), body
+
+    def stats(self):
+        self.connection.request('GET', '/stats')
+        return json.loads(self.connection.getresponse().read())
+
+
+def run_client(client, requests, args, seed, results):
+    # Each request is a fresh script, or one of the hot scripts sent verbatim or as an equivalent text
+    rng = random.Random(seed)
+    for index in range(requests):
+        roll = rng.random()
+        if roll < args.fresh:
+            kind = 'fresh'
+            text = '\n'.join(script(seed * requests + index + args.hot, args.nodes, args.edges))
+        else:
+            lines = script(rng.randrange(args.hot), args.nodes, args.edges)
+            if roll < args.fresh + args.equivalent:
+                kind = 'equivalent'
+                lines = equivalent(lines, rng)
+            else:
+                kind = 'repeat'
+            text = '\n'.join(lines)
+        start = time.perf_counter()
+        status, cache, body = client.render(text, args.mode, args.format)
+        results.append((kind, status, cache, time.perf_counter() - start, len(body)))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def report(label, rows):
+    if not rows:
+        return
+    latencies = [row[3] * 1000 for row in rows]
+    hits = sum(row[2] == 'hit' for row in rows)
+    print(f"{label:11s}{len(rows):7d}  hit {hits / len(rows):6.1%}  "
+          f"p50 {percentile(latencies, 0.5):8.1f}ms  p95 {percentile(latencies, 0.95):8.1f}ms  "
+          f"p99 {percentile(latencies, 0.99):8.1f}ms  mean {statistics.fmean(latencies):8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the render service")
+    parser.add_argument('--url', help="a running service, e.g. http://127.0.0.1:8765 (default: start one here)")
+    parser.add_argument('--unix', metavar='PATH', help="a running service on a Unix socket")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="render processes of the service started here")
+    parser.add_argument('-c', '--clients', type=int, default=8, help="concurrent client connections")
+    parser.add_argument('-r', '--requests', type=int, default=50, help="requests per client")
+    parser.add_argument('--hot', type=int, default=20, help="distinct scripts that repeat")
+    parser.add_argument('--fresh', type=float, default=0.1, help="share of never-seen scripts")
+    parser.add_argument('--equivalent', type=float, default=0.3,
+                        help="share of hot scripts sent as a different but equivalent text")
+    parser.add_argument('--nodes', type=int, default=40)
+    parser.add_argument('--edges', type=int, default=60)
+    parser.add_argument('--mode', default='default', choices=['default', 'bipartite', 'tree'])
+    parser.add_argument('--format', default='png', choices=['png', 'svg'])
+    args = parser.parse_args()
+
+    server = service = None
+    if not args.url and not args.unix:
+        service = RenderService(args.jobs)
+        start = time.perf_counter()
+        service.start()
+        print(f"{service.jobs} warm workers in {time.perf_counter() - start:.2f}s")
+        server = RenderServer(('127.0.0.1', 0), service)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        args.url = f"http://127.0.0.1:{server.server_port}"
+
+    results = []
+    threads = [threading.Thread(target=run_client, args=(Client(args.url, args.unix), args.requests, args, seed, results))
+               for seed in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    failed = [row for row in results if row[1] != 200]
+    print(f"{len(results)} requests from {args.clients} clients in {elapsed:.2f}s: "
+          f"{len(results) / elapsed:.1f} req/s, {len(failed)} failed")
+    report('all', results)
+    for kind in ('fresh', 'repeat', 'equivalent'):
+        report(kind, [row for row in results if row[0] == kind])
+    report('misses', [row for row in results if row[2] == 'miss'])
+    print(json.dumps(Client(args.url, args.unix).stats()))
+
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
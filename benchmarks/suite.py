@@ -0,0 +1,193 @@
+import argparse
+import contextlib
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from benchmarks.workloads import WORKLOADS, random_edit
+from headless import new_graph
+from interpreter import Interpreter
+from lexer import Lexer
+from parser_ import Parser
+from renderer import Renderer
+from worker import GraphWorker
+
+MODES = ('default', 'bipartite', 'tree')
+
+
+def timed(function, repeat):
+    # Best wall time over `repeat` calls, and the result of the last call
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def populate(connections):
+    graph = new_graph()
+    with graph.batch(draw=False):
+        for connection in connections:
+            graph.add_connection(connection)
+    return graph
+
+
+def cold_render(graph, pos):
+    # A full draw: a renderer that has drawn nothing yet cannot skip or repaint anything, which one that
+    # already drew these positions would (see Renderer.render)
+    graph.renderer = Renderer(graph.ax)
+    graph.render(pos)
+
+
+def pipeline_stages(text, repeat):
+    stages = {}
+    stages['lex'], tokens = timed(lambda: list(Lexer(text, positions=False).generate_tokens()), repeat)
+    stages['parse'], connections = timed(lambda: list(Parser(tokens).parse_document()), repeat)
+    stages['clear_tree'], tree = timed(lambda: Interpreter.clear_tree(connections), repeat)
+    stages['graph_mutation'], graph = timed(lambda: populate(tree), repeat)
+
+    # Each mode is laid out cold and rendered, which is what Graph.draw does after a change
+    for mode in MODES:
+        if mode == 'tree' and not graph.structure.is_forest():
+            continue
+        with graph.batch(draw=False):
+            graph.set_mode(mode)
+
+        def layout():
+            with graph.batch(draw=False):
+                graph.relayout()
+            return graph.layout()
+
+        stages[f'layout.{mode}'], pos = timed(layout, repeat)
+        stages[f'render.{mode}'], _ = timed(lambda: cold_render(graph, pos), repeat)
+
+    return stages, graph
+
+
+def edit_loop(text, n, edits, seed=0):
+    # Drives the GUI's update_graph/poll_results cycle without Tk: each edit is submitted to the worker and
+    # timed until its layout has been rendered. The debounce delay is not included.
+    rng = random.Random(seed)
+    graph = new_graph()
+    worker = GraphWorker(graph)
+    lines = text.split('\n')
+    latencies = []
+    for generation in range(edits + 1):
+        if generation:
+            random_edit(lines, n, rng)
+        start = time.perf_counter()
+        worker.submit(generation, '\n'.join(lines), 'default')
+        result_generation, pos, error = worker.results.get()
+        while result_generation != generation:
+            result_generation, pos, error = worker.results.get()
+        if error is not None:
+            raise error
+        with graph.lock:
+            graph.render(pos)
+        # The first submission parses and lays out the whole text; only the edits after it are reported
+        if generation:
+            latencies.append(time.perf_counter() - start)
+
+    latencies.sort()
+    return {
+        'edit.min': latencies[0] if latencies else 0.0,
+        'edit.mean': statistics.fmean(latencies),
+        'edit.p50': latencies[len(latencies) // 2],
+        'edit.p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(workloads, size, repeat, edits):
+    results = []
+    for workload in workloads:
+        text = WORKLOADS[workload](size)
+        stages, graph = pipeline_stages(text, repeat)
+        if edits:
+            stages.update(edit_loop(text, size, edits))
+        results.append({
+            'workload': workload,
+            'lines': text.count('\n') + 1,
+            'nodes': len(graph.store),
+            'edges': graph.store.number_of_edges(),
+            'seconds': stages,
+        })
+        print(f"{workload:8s} " + ' '.join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in stages.items()),
+              file=sys.stderr)
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'size': size,
+            'repeat': repeat,
+            'edits': edits,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(base_path, new_path, threshold):
+    # Prints new/base time ratios per workload and stage; returns 1 if any ratio is above the threshold
+    with open(base_path) as file:
+        base = {result['workload']: result['seconds'] for result in json.load(file)['results']}
+    with open(new_path) as file:
+        new = {result['workload']: result['seconds'] for result in json.load(file)['results']}
+
+    regressions = 0
+    for workload, stages in new.items():
+        for stage, seconds in stages.items():
+            before = base.get(workload, {}).get(stage)
+            if not before:
+                continue
+            ratio = seconds / before
+            flag = ''
+            if ratio > threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            print(f"{workload:8s} {stage:18s} {before * 1000:10.2f}ms -> {seconds * 1000:10.2f}ms  {ratio:5.2f}x{flag}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage timings of the DSL pipeline on synthetic workloads")
+    parser.add_argument('-w', '--workload', dest='workloads', action='append', choices=sorted(WORKLOADS),
+                        help="workload to run, may be repeated (default: all)")
+    parser.add_argument('-n', '--size', type=int, default=200, help="nodes per workload")
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="runs per stage, the best is reported")
+    parser.add_argument('-e', '--edits', type=int, default=20, help="edits in the editor loop, 0 to skip it")
+    parser.add_argument('-o', '--output', help="write the JSON results here instead of stdout")
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help="compare two JSON result files")
+    parser.add_argument('--threshold', type=float, default=1.2, help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(*args.compare, args.threshold)
+
+    # The pipeline prints progress messages; keep them out of the JSON on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args.workloads or list(WORKLOADS), args.size, args.repeat, args.edits)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
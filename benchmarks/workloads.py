@@ -0,0 +1,104 @@
+import random
+from lexer import ALPHA
+
+LOWER = ALPHA[:26]
+
+
+def name(i):
+    # Node names may only contain letters: 0 -> a, 25 -> z, 26 -> ba, ...
+    letters = []
+    while True:
+        i, digit = divmod(i, 26)
+        letters.append(LOWER[digit])
+        if i == 0:
+            return ''.join(reversed(letters))
+
+
+def connection(a, b, operator='--'):
+    return f"{name(a)} {operator} {name(b)}"
+
+
+def chain(n):
+    return '\n'.join(connection(i, i + 1, '-->') for i in range(n - 1))
+
+
+def star(n):
+    return '\n'.join(connection(0, i) for i in range(1, n))
+
+
+def grid(n):
+    side = max(2, int(n ** 0.5))
+    lines = []
+    for row in range(side):
+        for col in range(side):
+            node = row * side + col
+            if col + 1 < side:
+                lines.append(connection(node, node + 1))
+            if row + 1 < side:
+                lines.append(connection(node, node + side))
+    return '\n'.join(lines)
+
+
+def random_graph(n, edges, seed=0):
+    rng = random.Random(seed)
+    operators = ['--', '-->', '<--', '<-->', '-2.5->', '<-10-']
+    lines = []
+    for _ in range(edges):
+        a = rng.randrange(n)
+        b = rng.randrange(n)
+        lines.append(connection(a, b, rng.choice(operators)))
+    return '\n'.join(lines)
+
+
+def sparse(n, seed=0):
+    return random_graph(n, 2 * n, seed)
+
+
+def dense(n, seed=0):
+    return random_graph(n, n * (n - 1) // 8, seed)
+
+
+def tree(n, seed=0):
+    rng = random.Random(seed)
+    return '\n'.join(connection(rng.randrange(i), i, '-->') for i in range(1, n))
+
+
+def churn(n, rounds=5, seed=0):
+    # Every round connects a random batch of pairs and destroys half of the pairs seen so far with -/-
+    rng = random.Random(seed)
+    lines = []
+    pairs = []
+    for _ in range(rounds):
+        for _ in range(n):
+            pair = (rng.randrange(n), rng.randrange(n))
+            pairs.append(pair)
+            lines.append(connection(*pair))
+        for a, b in rng.sample(pairs, len(pairs) // 2):
+            lines.append(connection(a, b, '-/-'))
+    return '\n'.join(lines)
+
+
+# Workload name -> generator taking the node count
+WORKLOADS = {
+    'chain': chain,
+    'star': star,
+    'grid': grid,
+    'sparse': sparse,
+    'dense': dense,
+    'tree': tree,
+    'churn': churn,
+}
+
+
+def random_edit(lines, n, rng):
+    # One editor change to a list of lines: replace, insert or delete a line
+    kind = rng.choice(('replace', 'insert', 'delete')) if lines else 'insert'
+    line = connection(rng.randrange(n), rng.randrange(n), rng.choice(['--', '-->', '-/-']))
+    i = rng.randrange(len(lines) + (kind == 'insert'))
+    if kind == 'replace':
+        lines[i] = line
+    elif kind == 'insert':
+        lines.insert(i, line)
+    else:
+        del lines[i]
+    return kind
@@ -0,0 +1,116 @@
+from collections import Counter
+from dataclasses import replace
+from itertools import compress, count
+from operator import ne
+import profiling
+from lexer import Lexer
+from parser_ import Parser
+
+
+class Document:
+    # Keeps the parsed state of the editor text so that an edit only re-parses the lines it touched
+    def __init__(self):
+        self.lines = []
+        self.line_connections = []
+        self.line_diagnostics = []  # per line, its syntax errors numbered as line 1
+        self.connection_counts = Counter()
+        self.line_cache = {}
+
+    def parse_line(self, line):
+        # (connection or None, diagnostics) of one line. Lines are cached by content, so undo/redo and
+        # duplicated lines are never parsed twice
+        try:
+            return self.line_cache[line]
+        except KeyError:
+            pass
+
+        diagnostics = []
+        with profiling.stage('lex'):
+            lexer = Lexer(line, diagnostics=diagnostics)
+            tokens = list(lexer.generate_tokens())
+        with profiling.stage('parse'):
+            parser = Parser(tokens, diagnostics, lexer=lexer)
+            connection = parser.parse()
+
+        result = self.line_cache[line] = (connection, tuple(diagnostics))
+        return result
+
+    def changed_range(self, lines):
+        # Returns (start, old_end, new_end): lines[start:new_end] replaced self.lines[start:old_end]. The first and
+        # last differing lines are found by iterators that compare the lists in C, not by a loop over them.
+        old = self.lines
+        limit = min(len(old), len(lines))
+        start = next(compress(count(), map(ne, old, lines)), limit)
+        tail = next(compress(count(), map(ne, reversed(old), reversed(lines))), limit)
+        tail = min(tail, limit - start)
+        return start, len(old) - tail, len(lines) - tail
+
+    def diff(self, text):
+        # The edit (see edit()) that turns the current lines into those of text
+        lines = text.split('\n')
+        start, old_end, new_end = self.changed_range(lines)
+        return start, old_end, lines[start:new_end]
+
+    def update(self, text):
+        # Re-parses only the lines that differ from the last text and returns the (added, removed) connection sets
+        with profiling.stage('diff'):
+            edit = self.diff(text)
+        return self.edit([edit])
+
+    def edit(self, edits):
+        # Applies (start, old_end, lines) edits in order, each replacing self.lines[start:old_end] as they stand
+        # after the ones before it, and returns the (added, removed) connection sets of all of them. Only the
+        # edited lines are looked at.
+        before = {}
+        counts = self.connection_counts
+
+        for start, old_end, lines in edits:
+            with profiling.stage('diff'):
+                for connection in self.line_connections[start:old_end]:
+                    if connection is not None:
+                        before.setdefault(connection, counts[connection])
+                        counts[connection] -= 1
+
+            cached = len(self.line_cache)
+            parsed = [self.parse_line(line) for line in lines]
+            profiling.count('lines_reparsed', len(lines))
+            profiling.count('line_cache_misses', len(self.line_cache) - cached)
+
+            with profiling.stage('diff'):
+                for connection, diagnostics in parsed:
+                    if connection is not None:
+                        before.setdefault(connection, counts[connection])
+                        counts[connection] += 1
+
+                self.line_connections[start:old_end] = [connection for connection, diagnostics in parsed]
+                self.line_diagnostics[start:old_end] = [diagnostics for connection, diagnostics in parsed]
+                self.lines[start:old_end] = lines
+
+        with profiling.stage('diff'):
+            added = set()
+            removed = set()
+            for connection, previous in before.items():
+                after = counts[connection]
+                if after <= 0:
+                    del counts[connection]
+                    if previous > 0:
+                        removed.add(connection)
+                elif previous <= 0:
+                    added.add(connection)
+
+        if len(self.line_cache) > 2 * len(self.lines) + 1024:
+            self.line_cache = dict(zip(self.lines, zip(self.line_connections, self.line_diagnostics)))
+
+        return added, removed
+
+    def diagnostics(self):
+        # Syntax errors of the whole text, numbered by their line in it
+        # Lines without errors are skipped in C, by compress() over the per-line tuples
+        numbers = compress(count(1), self.line_diagnostics)
+        return [replace(diagnostic, line=number)
+                for number, diagnostics in zip(numbers, filter(None, self.line_diagnostics))
+                for diagnostic in diagnostics]
+
+    @property
+    def connections(self):
+        return set(self.connection_counts)
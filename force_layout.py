@@ -0,0 +1,205 @@
+import numpy as np
+
+# Nodes per grid cell the repulsion grid aims for, and the cap on cells per side
+NODES_PER_CELL = 8
+MAX_CELLS_PER_SIDE = 40
+# Graphs are coarsened until they have at most this many nodes or matching stops shrinking them
+COARSEST_SIZE = 50
+
+
+def edge_arrays(n, src, dst):
+    # Undirected, de-duplicated edges without self loops as two int arrays with src < dst
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    low = np.minimum(src, dst)
+    high = np.maximum(src, dst)
+    keep = low != high
+    keys = np.unique(low[keep] * n + high[keep])
+    return keys // n, keys % n
+
+
+def coarsen(n, src, dst, rng):
+    # Collapses a random maximal matching of edges; returns (fine -> coarse mapping, coarse size)
+    match = [-1] * n
+    src_list = src.tolist()
+    dst_list = dst.tolist()
+    for e in rng.permutation(len(src_list)).tolist():
+        a = src_list[e]
+        b = dst_list[e]
+        if match[a] < 0 and match[b] < 0:
+            match[a] = b
+            match[b] = a
+
+    match = np.asarray(match, dtype=np.int64)
+    nodes = np.arange(n)
+    representative = np.where(match < 0, nodes, np.minimum(nodes, match))
+    _, mapping = np.unique(representative, return_inverse=True)
+    return mapping, int(mapping.max()) + 1 if n else 0
+
+
+def repulsion(pos, k):
+    # FR repulsion k^2/d: exact for nodes in neighbouring grid cells, cell centroids for everything further away
+    n = len(pos)
+    mins = pos.min(axis=0)
+    extent = float((pos.max(axis=0) - mins).max()) or 1.0
+    side = int(min(MAX_CELLS_PER_SIDE, max(1, np.sqrt(n / NODES_PER_CELL))))
+    cell_size = extent / side * (1 + 1e-9)
+
+    cxy = np.minimum(((pos - mins) / cell_size).astype(np.int64), side - 1)
+    cell = cxy[:, 0] * side + cxy[:, 1]
+    order = np.argsort(cell, kind='stable')
+    counts = np.bincount(cell, minlength=side * side)
+    starts = np.cumsum(counts) - counts
+
+    force = np.zeros_like(pos)
+    k2 = k * k
+    nodes = np.arange(n)
+
+    # Each pair of neighbouring cells is visited once and the force applied to both ends
+    for dx, dy in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)):
+        nx_ = cxy[:, 0] + dx
+        ny_ = cxy[:, 1] + dy
+        valid = (nx_ >= 0) & (nx_ < side) & (ny_ >= 0) & (ny_ < side)
+        neighbour = np.where(valid, nx_ * side + ny_, 0)
+        count = np.where(valid, counts[neighbour], 0)
+        total = int(count.sum())
+        if total == 0:
+            continue
+
+        block_start = np.cumsum(count) - count
+        i = np.repeat(nodes, count)
+        j = order[np.repeat(starts[neighbour] - block_start, count) + np.arange(total)]
+        keep = i < j if dx == 0 and dy == 0 else slice(None)
+        i = i[keep]
+        j = j[keep]
+
+        delta = pos[i] - pos[j]
+        dist2 = np.maximum((delta * delta).sum(axis=1), 1e-4)
+        scale = k2 / dist2
+        fx = delta[:, 0] * scale
+        fy = delta[:, 1] * scale
+        force[:, 0] += np.bincount(i, weights=fx, minlength=n) - np.bincount(j, weights=fx, minlength=n)
+        force[:, 1] += np.bincount(i, weights=fy, minlength=n) - np.bincount(j, weights=fy, minlength=n)
+
+    occupied = np.flatnonzero(counts)
+    if len(occupied) > 1:
+        mass = counts[occupied].astype(float)
+        centroid = np.empty((len(occupied), 2))
+        centroid[:, 0] = np.bincount(cell, weights=pos[:, 0], minlength=side * side)[occupied] / mass
+        centroid[:, 1] = np.bincount(cell, weights=pos[:, 1], minlength=side * side)[occupied] / mass
+
+        ox = occupied // side
+        oy = occupied % side
+        far = (np.abs(ox[:, None] - ox[None, :]) > 1) | (np.abs(oy[:, None] - oy[None, :]) > 1)
+        delta = centroid[:, None, :] - centroid[None, :, :]
+        dist2 = np.maximum((delta * delta).sum(axis=2), 1e-4)
+        weight = np.where(far, mass[None, :] * k2 / dist2, 0.0)
+        cell_force = (delta * weight[:, :, None]).sum(axis=1)
+
+        cell_index = np.zeros(side * side, dtype=np.int64)
+        cell_index[occupied] = np.arange(len(occupied))
+        force += cell_force[cell_index[cell]]
+
+    return force
+
+
+def fruchterman_reingold(pos, src, dst, iterations, temperature, k=1.0, movable=None):
+    # Runs FR in place on pos (n x 2) with linear cooling from the given temperature.
+    # If given, the boolean mask `movable` selects the nodes allowed to move.
+    n = len(pos)
+    if n < 2:
+        return pos
+
+    for step in range(iterations):
+        disp = repulsion(pos, k)
+
+        delta = pos[src] - pos[dst]
+        dist = np.sqrt(np.maximum((delta * delta).sum(axis=1), 1e-8))
+        pull = delta * (dist / k)[:, None]
+        disp[:, 0] -= np.bincount(src, weights=pull[:, 0], minlength=n)
+        disp[:, 1] -= np.bincount(src, weights=pull[:, 1], minlength=n)
+        disp[:, 0] += np.bincount(dst, weights=pull[:, 0], minlength=n)
+        disp[:, 1] += np.bincount(dst, weights=pull[:, 1], minlength=n)
+
+        length = np.sqrt(np.maximum((disp * disp).sum(axis=1), 1e-12))
+        t = temperature * (1 - step / iterations)
+        step_scale = np.minimum(length, t) / length
+        if movable is not None:
+            step_scale *= movable
+        pos += disp * step_scale[:, None]
+
+    return pos
+
+
+def multilevel_layout(n, src, dst, seed=0, iterations=50):
+    # Lays out the coarsest graph from a random start, then prolongs and refines level by level
+    rng = np.random.default_rng(seed)
+    levels = []
+    size = n
+    while size > COARSEST_SIZE:
+        mapping, coarse_size = coarsen(size, src, dst, rng)
+        if coarse_size > 0.9 * size:
+            break
+        levels.append((size, src, dst, mapping))
+        src, dst = edge_arrays(coarse_size, mapping[src], mapping[dst])
+        size = coarse_size
+
+    pos = rng.uniform(0, np.sqrt(size), (size, 2))
+    fruchterman_reingold(pos, src, dst, iterations * 2, temperature=np.sqrt(size) / 4)
+
+    # Prolonged positions are already close, so the finer levels only need a short, cool refinement
+    for fine_size, fine_src, fine_dst, mapping in reversed(levels):
+        pos = pos[mapping] * np.sqrt(fine_size / size) + rng.uniform(-0.5, 0.5, (fine_size, 2))
+        fruchterman_reingold(pos, fine_src, fine_dst, max(1, iterations // 4), temperature=np.sqrt(fine_size) / 20)
+        size = fine_size
+
+    return pos
+
+
+def rescale(pos, scale=1.0):
+    # Centres positions on the origin and scales the largest coordinate to `scale`, like nx.rescale_layout
+    pos = pos - pos.mean(axis=0)
+    lim = np.abs(pos).max()
+    if lim > 0:
+        pos *= scale / lim
+    return pos
+
+
+def force_directed_layout(G, pos=None, fixed=None, seed=0, iterations=50):
+    # Layout for large graphs. With `pos`, refines those positions in their own frame instead of
+    # starting over, keeping the nodes listed in `fixed` where they are
+    nodes = list(G)
+    index = {node: i for i, node in enumerate(nodes)}
+    src = [index[a] for a, b in G.edges()]
+    dst = [index[b] for a, b in G.edges()]
+    return force_directed_positions(nodes, src, dst, pos=pos, fixed=fixed, seed=seed, iterations=iterations)
+
+
+def force_directed_positions(nodes, src, dst, pos=None, fixed=None, seed=0, iterations=50):
+    # Same as force_directed_layout, for edges given as index arrays into `nodes`
+    n = len(nodes)
+    if n == 0:
+        return {}
+    index = {node: i for i, node in enumerate(nodes)} if fixed else None
+    src, dst = edge_arrays(n, src, dst)
+
+    if pos is None:
+        coords = rescale(multilevel_layout(n, src, dst, seed=seed, iterations=iterations))
+    else:
+        original = np.array([pos[node] for node in nodes], dtype=float)
+        coords = original.copy()
+        # Work in units where the ideal edge length is 1, then map back to the caller's frame
+        extent = coords.max(axis=0) - coords.min(axis=0)
+        unit = np.sqrt(max(extent[0] * extent[1], extent.max() ** 2 / n, 1e-12) / n)
+        offset = coords.mean(axis=0)
+        coords = (coords - offset) / unit
+        movable = None
+        if fixed:
+            movable = np.ones(n)
+            movable[[index[node] for node in fixed]] = 0.0
+        fruchterman_reingold(coords, src, dst, iterations, temperature=1.0, movable=movable)
+        coords = coords * unit + offset
+        if movable is not None:
+            coords[movable == 0] = original[movable == 0]
+
+    return dict(zip(nodes, coords))
@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import profiling
+from importer import read_chunks
+from interpreter import Interpreter
+from lexer import Lexer
+from parallel import parse_parallel
+from parser_ import Parser
+from values import Graph
+
+FORMATS = ('png', 'svg', 'json')
+
+
+def new_graph(mode="default", compact=False):
+    # A Graph drawing into an off-screen Agg canvas, so no display or Tk is needed
+    fig = Figure(figsize=(5, 5), dpi=100)
+    FigureCanvasAgg(fig)
+    graph = Graph(fig, compact=compact)
+    graph.set_mode(mode)
+    return graph
+
+
+def graph_data(graph):
+    return {
+        "mode": graph.mode,
+        "nodes": list(graph.G.nodes),
+        "edges": [{"source": a, "target": b, "weight": data['weight'], "style": data.get('style', 'line')}
+                  for a, b, data in graph.G.edges(data=True)],
+    }
+
+
+def compile_text(text, mode="default", parse_jobs=1):
+    # parse_jobs other than 1 lexes and parses the document across that many processes (None: CPU count)
+    graph = new_graph(mode)
+    if parse_jobs != 1:
+        with profiling.stage('parse'):
+            tree = parse_parallel(text, parse_jobs).connections()
+        Interpreter().apply(tree, graph)
+        return graph
+
+    tokens = Lexer(text, positions=False).generate_tokens()
+    if profiling.enabled:
+        # Streaming interleaves the stages, so they are run one after the other to be timed separately
+        with profiling.stage('lex'):
+            tokens = list(tokens)
+    tree = Parser(tokens).parse_document()
+    if profiling.enabled:
+        with profiling.stage('parse'):
+            tree = list(tree)
+    Interpreter().visit(tree, graph)
+    return graph
+
+
+def export_graph(graph, base_path, formats):
+    outputs = []
+    for fmt in formats:
+        path = f"{base_path}.{fmt}"
+        if fmt == 'json':
+            with open(path, "w") as file:
+                json.dump(graph_data(graph), file)
+        else:
+            graph.fig.savefig(path, format=fmt)
+        outputs.append(path)
+    return outputs
+
+
+def compile_file(path, output_dir, formats, mode="default", profile=False, parse_jobs=1):
+    # Runs one DSL file end to end; errors are reported in the result instead of raised.
+    # With profile=True the result also carries this file's profiling.report()
+    result = {"file": path, "ok": False, "error": None, "nodes": 0, "edges": 0, "outputs": []}
+    if profile:
+        profiling.enable()
+        profiling.reset()
+    start = time.perf_counter()
+    try:
+        with open(path, "r") as file:
+            text = file.read()
+        graph = compile_text(text, mode, parse_jobs)
+        base_name = os.path.splitext(os.path.basename(path))[0]
+        with profiling.stage('export'):
+            result["outputs"] = export_graph(graph, os.path.join(output_dir, base_name), formats)
+        result["nodes"] = graph.G.number_of_nodes()
+        result["edges"] = graph.G.number_of_edges()
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    if profile:
+        result["profile"] = profiling.report()
+    return result
+
+
+def collect_inputs(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".txt")))
+        else:
+            files.append(path)
+    return files
+
+
+def compile_files(files, output_dir, formats, mode="default", jobs=None, profile=False, parse_jobs=1):
+    # Yields results in completion order; jobs=1 keeps everything in this process
+    if jobs == 1 or len(files) <= 1:
+        for path in files:
+            yield compile_file(path, output_dir, formats, mode, profile, parse_jobs)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(compile_file, path, output_dir, formats, mode, profile, parse_jobs)
+                   for path in files]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def lint_text(text, first_line=1):
+    # Syntax errors of a DSL text in line order, found without raising and without building a graph
+    diagnostics = []
+    lexer = Lexer(text, first_line=first_line, diagnostics=diagnostics)
+    deque(Parser(lexer.generate_tokens(), diagnostics, first_line, lexer).parse_document(), maxlen=0)
+    diagnostics.sort(key=lambda diagnostic: (diagnostic.line, diagnostic.column or 0))
+    return diagnostics
+
+
+def lint_file(path):
+    # Checks a file a block of lines at a time, so it need not fit in memory; errors are reported in the result
+    result = {"file": path, "ok": False, "error": None, "diagnostics": [], "bytes": 0}
+    start = time.perf_counter()
+    try:
+        line = 1
+        for data, _ in read_chunks(path):
+            text = data.decode('utf-8')
+            result["diagnostics"].extend(lint_text(text, line))
+            line += text.count('\n')
+            result["bytes"] += len(data)
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def lint_files(files, jobs=None):
+    # Yields results in completion order, like compile_files
+    if jobs == 1 or len(files) <= 1:
+        for path in files:
+            yield lint_file(path)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for future in as_completed([pool.submit(lint_file, path) for path in files]):
+            yield future.result()
+
+
+def lint_main(files, jobs):
+    invalid = 0
+    total = 0
+    size = 0
+    start = time.perf_counter()
+    for result in lint_files(files, jobs):
+        if not result["ok"]:
+            invalid += 1
+            print(f"{result['file']}: {result['error']}")
+            continue
+        for diagnostic in result["diagnostics"]:
+            where = diagnostic.line if diagnostic.column is None else f"{diagnostic.line}:{diagnostic.column}"
+            print(f"{result['file']}:{where}: {diagnostic.message}")
+        invalid += bool(result["diagnostics"])
+        total += len(result["diagnostics"])
+        size += result["bytes"]
+
+    seconds = time.perf_counter() - start
+    print(f"{total} syntax errors in {invalid}/{len(files)} files; {size / 1e6:.1f}MB checked in {seconds:.3f}s "
+          f"({size / 1e6 / max(seconds, 1e-9):.1f}MB/s)")
+    return 1 if invalid else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile DSL graph files without a display")
+    parser.add_argument('inputs', nargs='+', help="DSL files or directories of .txt files")
+    parser.add_argument('-o', '--output-dir', default='.')
+    parser.add_argument('-f', '--format', dest='formats', action='append', choices=FORMATS,
+                        help="output format, may be repeated (default: png)")
+    parser.add_argument('-m', '--mode', default='default', choices=('default', 'bipartite', 'tree'))
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--parse-jobs', type=int, default=1,
+                        help="processes to parse each file with, for single huge files (0: CPU count)")
+    parser.add_argument('--lint', action='store_true', help="only report syntax errors; no graph is built")
+    parser.add_argument('--profile', action='store_true', help="print per-stage timings and counters")
+    parser.add_argument('--profile-json', metavar='PATH', help="write the profile as JSON to PATH")
+    args = parser.parse_args(argv)
+
+    files = collect_inputs(args.inputs)
+    if args.lint:
+        return lint_main(files, args.jobs)
+    formats = args.formats or ['png']
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    failed = 0
+    profiles = []
+    profile = args.profile or args.profile_json is not None
+    start = time.perf_counter()
+    parse_jobs = args.parse_jobs or None
+    for result in compile_files(files, args.output_dir, formats, args.mode, args.jobs, profile, parse_jobs):
+        if "profile" in result:
+            profiles.append(result["profile"])
+        if result["ok"]:
+            print(f"ok    {result['seconds']:8.3f}s  {result['file']} "
+                  f"({result['nodes']} nodes, {result['edges']} edges)")
+        else:
+            failed += 1
+            print(f"error {result['seconds']:8.3f}s  {result['file']}: {result['error']}")
+
+    print(f"{len(files) - failed}/{len(files)} files compiled in {time.perf_counter() - start:.3f}s")
+
+    if profile:
+        merged = profiling.merge(profiles)
+        if args.profile:
+            print(profiling.format_report(merged))
+        if args.profile_json:
+            with open(args.profile_json, "w") as file:
+                json.dump(merged, file, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+from itertools import islice
+import numpy as np
+from lexer import Lexer
+from parser_ import Parser
+
+# Files larger than this are imported in streaming mode instead of being loaded into the editor
+LARGE_FILE_BYTES = 4 * 1024 * 1024
+# Bytes read, parsed and applied to the graph at a time
+CHUNK_BYTES = 1024 * 1024
+# Lines per page of the read-only source view
+PAGE_LINES = 500
+
+
+class PageIndex:
+    # Byte offsets of every PAGE_LINES-th line of a file, so any page of the source can be read on its own.
+    # Filled in by the importer as it streams the file; pages become readable as soon as they are indexed.
+    def __init__(self, path, page_lines=PAGE_LINES):
+        self.path = path
+        self.page_lines = page_lines
+        self.offsets = [0]
+        self.line_count = 0
+
+    def add_chunk(self, data, start):
+        # Records the page starts among the line breaks of data, which begins at byte `start` of the file
+        newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+        # The n-th line break of the file (1-based) ends a page when n is a multiple of page_lines
+        first = (-self.line_count - 1) % self.page_lines
+        self.offsets.extend((newlines[first::self.page_lines] + start + 1).tolist())
+        self.line_count += len(newlines)
+
+    def finish(self, size):
+        # Drops the empty page a final line break at a page boundary would leave
+        if len(self.offsets) > 1 and self.offsets[-1] >= size:
+            self.offsets.pop()
+
+    def page_count(self):
+        return len(self.offsets)
+
+    def page(self, number):
+        # Text of page `number` (0-based); reads only that page's lines
+        with open(self.path, 'rb') as file:
+            file.seek(self.offsets[number])
+            data = b''.join(islice(file, self.page_lines))
+        return data.decode('utf-8', errors='replace').rstrip('\n')
+
+
+def read_chunks(path, chunk_bytes=CHUNK_BYTES):
+    # Yields (data, start offset) for blocks of whole lines; only the last block may lack a final line break
+    with open(path, 'rb') as file:
+        start = 0
+        carry = b''
+        while True:
+            block = file.read(chunk_bytes)
+            if not block:
+                break
+            data = carry + block
+            cut = data.rfind(b'\n') + 1
+            if cut == 0:
+                carry = data
+                continue
+            yield data[:cut], start
+            start += cut
+            carry = data[cut:]
+        if carry:
+            yield carry, start
+
+
+def parse_chunk(text):
+    # Parses a block of lines, skipping invalid ones. Returns (connections, diagnostics); the diagnostics are
+    # numbered by line within the block
+    diagnostics = []
+    tokens = Lexer(text, positions=False, diagnostics=diagnostics).generate_tokens()
+    return list(Parser(tokens, diagnostics).parse_document()), diagnostics
+
+
+def apply_connections(graph, connections):
+    # Applies a block of commands so that, over the whole file, the outcome matches Interpreter.visit:
+    # the last command for a pair of names wins, whichever direction either was written in
+    latest = {}
+    for connection in connections:
+        a = connection.name_a.value
+        b = connection.name_b.value
+        key = (a, b) if a <= b else (b, a)
+        latest.pop(key, None)
+        latest[key] = connection
+
+    for connection in latest.values():
+        graph.set_connection(connection)
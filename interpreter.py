@@ -1,37 +1,40 @@
-from values import Name, Number, Connection
+import profiling
 
 class Interpreter:
     def __init__(self):
         pass
 
     def visit(self, tree, graph):
-        # This method updates the graph based on the parsed tree
-        tree = self.clear_tree(tree)  # Clear redundant or conflicting commands
-        for node in tree:
-            if node.destroy:
-                graph.remove_connection(self.create_connection(node))
-            else:
-                graph.add_connection(self.create_connection(node))
-        return graph
+        # This method updates the graph based on the parsed tree of Connection values
+        with profiling.stage('clear_tree'):
+            tree = self.clear_tree(tree)  # Clear redundant or conflicting commands
+        return self.apply(tree, graph)
 
-    def create_connection(self, node):
-        node_a = Name(node.name_a.value, node.name_a.final, node.name_a.start)
-        node_b = Name(node.name_b.value, node.name_b.final, node.name_b.start)
-        weight = Number(node.weight.value)
-        return Connection(
-            name_a=node_a, name_b=node_b, weight=weight, destroy=node.destroy,
-            left_dir=node.left_dir, right_dir=node.right_dir
-        )
+    def apply(self, tree, graph):
+        # Applies an already cleared list of Connection values, e.g. parallel.parse_parallel(...).connections()
+        with graph.batch():
+            with profiling.stage('mutation'):
+                removed = 0
+                for connection in tree:
+                    if connection.destroy:
+                        graph.remove_connection(connection)
+                        removed += 1
+                    else:
+                        graph.add_connection(connection)
+                profiling.count('connections_added', len(tree) - removed)
+                profiling.count('connections_removed', removed)
+        return graph
 
     @staticmethod
     def clear_tree(tree):
-        # Clears redundant or conflicting commands from the tree, ensuring each connection is unique
-        seen = set()
-        new_tree = []
-        for node in reversed(tree):
-            key = tuple(sorted((node.name_a.value, node.name_b.value)))
-            if key not in seen:
-                seen.add(key)
-                new_tree.append(node)
-        new_tree = [node for node in new_tree if not getattr(node, 'destroy', False)]
+        # Clears redundant or conflicting commands from the tree, ensuring each connection is unique.
+        # The tree may be any iterable (e.g. Parser.parse_document), only the last command per pair is kept.
+        latest = {}
+        for node in tree:
+            a = node.name_a.value
+            b = node.name_b.value
+            key = (a, b) if a <= b else (b, a)
+            latest.pop(key, None)
+            latest[key] = node
+        new_tree = [node for node in reversed(latest.values()) if not getattr(node, 'destroy', False)]
         return new_tree
@@ -1,84 +1,128 @@
-from tokens import Token, TokenType
+import re
+import sys
+from bisect import bisect_right
+from tokens import NEWLINE_TOKEN, PUNCTUATION, Diagnostic, ParseError, Token, TokenType
 
 WHITESPACE = ' \n\t'
 DIGITS = '0123456789'
 ALPHA = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
 
+# Master pattern scanned over the whole buffer; the index of the group that matched selects the token kind.
+# Each punctuation mark has a group of its own, so its shared token is found from the group index alone.
+# Blanks before a token are taken in by its match rather than scanned as failed matches of their own.
+NAME_GROUP, WEIGHT_GROUP = 1, 2
+TOKEN_PATTERN = re.compile(
+    "[ \t]*(?:"
+    f"([{ALPHA}]+)"
+    f"|([{DIGITS}]+\\.?[{DIGITS}]*|\\.[{DIGITS}]*)"
+    "|(-)|(<)|(>)|(\\*)|(/)|(=>)"
+    "|(\n)"
+    f"|([^{re.escape(WHITESPACE)}]))"
+)
+# The token of every group that always yields the same one, by group index; None for names, weights and
+# illegal characters, which are built per match
+FIXED_TOKENS = (None, None, None, PUNCTUATION[TokenType.DASH], PUNCTUATION[TokenType.LEFT],
+                PUNCTUATION[TokenType.RIGHT], PUNCTUATION[TokenType.FINAL], PUNCTUATION[TokenType.DESTROY],
+                PUNCTUATION[TokenType.START], NEWLINE_TOKEN, None)
+LINE_BREAK = re.compile('\n')
 
-class Lexer:
-    def __init__(self, text):
-        self.text = iter(text)
-        self.advance()
 
-    def raise_error(self):
-        raise Exception(f"Illegal character '{self.current_char}'")
-    
-    def advance(self):
-        try:
-            self.current_char = next(self.text)
-        except StopIteration:
-            self.current_char = None
+class Lexer:
+    def __init__(self, text, positions=True, first_line=1, diagnostics=None):
+        # Tokens carry no positions; with positions=True the parser can ask for them through locate() and span(),
+        # which work them out from the text only when a diagnostic or span needs them.
+        # first_line numbers the lines of a text that is a piece of a larger document.
+        # With a diagnostics list, illegal characters are appended to it and become ERROR tokens instead of raising.
+        self.text = text
+        self.positions = positions
+        self.first_line = first_line
+        self.diagnostics = diagnostics
+        self._line_starts = None
 
-    def generate_tokens(self):
-        while self.current_char is not None:
-            if self.current_char in WHITESPACE:
-                self.advance()
-            elif self.current_char == '-':
-                self.advance()
-                yield Token(TokenType.DASH)
-            elif self.current_char in ALPHA:
-                yield self.generate_name()
-            elif self.current_char == '<':
-                self.advance()
-                yield Token(TokenType.LEFT)
-            elif self.current_char == '>':
-                self.advance()
-                yield Token(TokenType.RIGHT)
-            elif self.current_char == '.' or self.current_char in DIGITS:
-                yield self.generate_number()
-            elif self.current_char == '*':
-                self.advance()
-                yield Token(TokenType.FINAL)
-            elif self.current_char == '/':
-                self.advance()
-                yield Token(TokenType.DESTROY)
-            elif self.current_char == '=':
-                self.advance()
-                if self.current_char == '>':
-                    self.advance()
-                    yield Token(TokenType.START)
-                else:
-                    self.raise_error()
-            else:
-                self.raise_error()
+    def line_starts(self):
+        # Offset in the text at which each line starts, built on first use
+        if self._line_starts is None:
+            self._line_starts = [0] + [match.end() for match in LINE_BREAK.finditer(self.text)]
+        return self._line_starts
 
-    def generate_number(self):
-        decimal_point_count = 0
-        number_str = self.current_char
-        self.advance()
+    def position(self, offset):
+        # (line, 1-based column) of an offset in the text
+        starts = self.line_starts()
+        index = bisect_right(starts, offset) - 1
+        return self.first_line + index, offset - starts[index] + 1
 
-        while self.current_char is not None and (self.current_char == '.' or self.current_char in DIGITS):
-            if self.current_char == '.':
-                decimal_point_count += 1
-                if decimal_point_count > 1:
-                    break
+    def line_bounds(self, line):
+        # (start, end) offsets of a line, without its line break
+        starts = self.line_starts()
+        index = line - self.first_line
+        end = starts[index + 1] - 1 if index + 1 < len(starts) else len(self.text)
+        return starts[index], end
 
-            number_str += self.current_char
-            self.advance()
+    def locate(self, line, index):
+        # (column, end column exclusive) of the index-th token on a line, found by scanning that line again;
+        # None if the lexer does not track positions
+        if not self.positions:
+            return None
+        start, end = self.line_bounds(line)
+        for i, match in enumerate(TOKEN_PATTERN.finditer(self.text, start, end)):
+            if i == index:
+                return match.start(match.lastindex) - start + 1, match.end() - start + 1
+        return None
 
-        if number_str.startswith('.'):
-            number_str = '0' + number_str
-        if number_str.endswith('.'):
-            number_str += '0'
+    def span(self, line):
+        # (line, start column, end column exclusive) of all the tokens on a line, or None without positions
+        if not self.positions:
+            return None
+        start, end = self.line_bounds(line)
+        source = self.text[start:end]
+        body = source.lstrip(' \t')
+        indent = len(source) - len(body)
+        return line, indent + 1, indent + len(body.rstrip(' \t')) + 1
 
-        return Token(TokenType.WEIGHT, float(number_str))
+    def error(self, offset):
+        # Raises a ParseError for the illegal character at offset, or records it and returns an ERROR token
+        text = self.text
+        char = text[offset]
+        if char == '=':
+            # '=' is only legal as the start of '=>', so report the character that followed it
+            offset += 1
+            char = text[offset] if offset < len(text) else None
+        line, column = self.position(offset)
+        diagnostic = Diagnostic(line, column, column + 1, f"Illegal character '{char}'")
+        if self.diagnostics is None:
+            raise ParseError(diagnostic)
+        last = self.diagnostics[-1] if self.diagnostics else None
+        # A bad character after '=' is reported for the '=' already
+        if last is None or (last.line, last.column) != (line, column):
+            self.diagnostics.append(diagnostic)
+        return Token(TokenType.ERROR, char)
 
-    def generate_name(self):
-        name_str = self.current_char
-        self.advance()
+    def generate_tokens(self):
+        # One pass over the whole text. Punctuation and line breaks are the shared tokens of FIXED_TOKENS, and
+        # a name is built once per text; only weights are built per match. Each line break yields NEWLINE_TOKEN.
+        fixed = FIXED_TOKENS
+        names = {}  # one shared token per distinct name
+        name_type = TokenType.NAME
+        weight_type = TokenType.WEIGHT
+        intern = sys.intern
 
-        while self.current_char is not None and self.current_char in ALPHA:
-            name_str += self.current_char
-            self.advance()
+        for match in TOKEN_PATTERN.finditer(self.text):
+            token = fixed[match.lastindex]
+            if token is None:
+                group = match.lastindex
+                if group == NAME_GROUP:
+                    name = match[group]
+                    token = names.get(name)
+                    if token is None:
+                        token = names[name] = Token(name_type, intern(name))
+                elif group == WEIGHT_GROUP:
+                    token = Token(weight_type, self.number_value(match[group]))
+                else:
+                    token = self.error(match.start(group))
+            yield token
 
-        return Token(TokenType.NAME, str(name_str))
+    @staticmethod
+    def number_value(number_str):
+        if number_str == '.':
+            return 0.0
+        return float(number_str)
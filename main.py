@@ -1,24 +1,105 @@
+import argparse
+import os
 import tkinter as tk
 from tkinter import filedialog
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
-from interpreter import Interpreter
-from lexer import Lexer
-from parser_ import Parser
+import profiling
+from importer import LARGE_FILE_BYTES, PageIndex
+from snapshot import EXTENSION, Snapshot, save_snapshot
 from values import Graph
+from worker import GraphWorker
+
+DEBOUNCE_MS = 150  # Quiet period after the last keystroke before the text is re-parsed
+POLL_MS = 16  # How often finished layouts are picked up from the worker (~60 fps)
+MAX_HIGHLIGHTS = 500  # Syntax errors highlighted in the editor at most; the rest are only counted
+WHOLE_TEXT = 'whole'  # CodeEditor.edited when the next update must send the whole text
 
 class CodeEditor(tk.Frame):
     def __init__(self, master, **text_options):
         super().__init__(master)
+        # Describes the first syntax error, below the text
+        self.message = tk.Label(self, anchor="w", fg='red')
+        self.message.pack(side=tk.BOTTOM, fill=tk.X)
         self.text = tk.Text(self, **text_options)
         self.text.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
+        self.text.tag_configure('error', underline=True, background='#ffd6d6')
+        self.error_lines = set()
         self.line_numbers = tk.Canvas(self, width=30, bg='lightgray')
         self.line_numbers.pack(side=tk.LEFT, fill=tk.Y)
+        self.line_offset = 0  # Added to the numbers shown, for views of a page of a larger file
+        # Lines edited since take_edit() was last called, as (start, old_end, new_end) of 0-based line numbers:
+        # lines [start:new_end] of the text replaced lines [start:old_end] of the text as it was then. None
+        # without an edit; WHOLE_TEXT before the first call and after changes not seen line by line (undo, redo).
+        self.edited = WHOLE_TEXT
+        # Inserts and deletes are seen by renaming the widget's Tcl command and putting intercept() in its place
+        self.widget = self.text._w + '_widget'
+        self.tk.call('rename', self.text._w, self.widget)
+        self.tk.createcommand(self.text._w, self.intercept)
         
         self.text.bind('<KeyRelease>', self.update_line_numbers)
         self.text.bind('<MouseWheel>', self.update_line_numbers)
         self.update_line_numbers()
 
+    def intercept(self, operation, *args):
+        # Runs a command of the text widget, noting the lines that an insert, delete or replace touched
+        if operation not in ('insert', 'delete', 'replace'):
+            result = self.tk.call(self.widget, operation, *args)
+            if operation == 'edit' and args[:1] in (('undo',), ('redo',)):
+                self.edited = WHOLE_TEXT
+            return result
+        if operation == 'insert':
+            indices = args[:1]
+        elif operation == 'delete':
+            # delete takes (index1, index2) pairs, and a last index1 alone deletes the one character after it.
+            # The deleted range ends on the line that joins the first, so its end is the index that counts.
+            indices = list(args)
+            if len(indices) % 2:
+                indices.append(f"{indices[-1]}+1c")
+        else:
+            indices = args[:2]
+        lines = [self.line_of(index) for index in indices]
+        count = self.line_count()
+        result = self.tk.call(self.widget, operation, *args)
+        first = min(min(lines), count - 1)
+        last = min(max(lines), count - 1) + 1
+        self.note_edit(first, last, self.line_count() - count)
+        return result
+
+    def line_of(self, index):
+        # 0-based line of a Tk text index
+        return int(str(self.tk.call(self.widget, 'index', index)).split('.')[0]) - 1
+
+    def line_count(self):
+        return self.line_of('end-1c') + 1
+
+    def note_edit(self, first, last, delta):
+        # Widens the edited range by lines [first:last] of the text, which an edit turned into delta more lines
+        edited = self.edited
+        if edited is WHOLE_TEXT:
+            return
+        if edited is None:
+            self.edited = (first, last, last + delta)
+            return
+        start, old_end, new_end = edited
+        if last > new_end:
+            # The lines between the two edits are unchanged, and so are where they were in the old text
+            old_end += last - new_end
+            new_end = last
+        self.edited = (min(start, first), old_end, new_end + delta)
+
+    def take_edit(self):
+        # (text, edit) for GraphWorker.submit: the whole text, or the edited lines as (start, old_end, lines),
+        # or neither if nothing changed since the last call
+        edited = self.edited
+        self.edited = None
+        if edited is None:
+            return None, None
+        if edited is WHOLE_TEXT:
+            return self.text.get("1.0", "end-1c"), None
+        start, old_end, new_end = edited
+        return None, (start, old_end, self.text.get(f"{start + 1}.0", f"{new_end}.end").split('\n'))
+
     def update_line_numbers(self, event=None):
         self.line_numbers.delete("all")
         i = self.text.index("@0,0")
@@ -27,12 +108,32 @@ class CodeEditor(tk.Frame):
             if dline is None:
                 break
             y = dline[1]
-            linenum = str(i).split(".")[0]
-            self.line_numbers.create_text(2, y, anchor="nw", text=linenum)
+            linenum = int(str(i).split(".")[0]) + self.line_offset
+            self.line_numbers.create_text(2, y, anchor="nw", text=linenum,
+                                          fill='red' if linenum in self.error_lines else 'black')
             i = self.text.index(f"{i}+1line")
 
+    def show_diagnostics(self, diagnostics):
+        # Highlights the syntax errors in the text and their line numbers
+        self.text.tag_remove('error', "1.0", tk.END)
+        for diagnostic in diagnostics[:MAX_HIGHLIGHTS]:
+            line = diagnostic.line - self.line_offset
+            if diagnostic.column is None:
+                self.text.tag_add('error', f"{line}.0", f"{line}.end")
+            else:
+                self.text.tag_add('error', f"{line}.{diagnostic.column - 1}", f"{line}.{diagnostic.end - 1}")
+        self.error_lines = {diagnostic.line for diagnostic in diagnostics}
+        message = ""
+        if diagnostics:
+            message = str(diagnostics[0])
+            if len(diagnostics) > 1:
+                message += f" (+{len(diagnostics) - 1} more)"
+        self.message.config(text=message)
+        self.update_line_numbers()
+
 class GraphEditorApp:
-    def __init__(self, root):
+    def __init__(self, root, profile=False):
+        # profile=True turns on the stage timers and shows the last edit's breakdown in a status bar
         self.root = root
         self.root.title("GraphExpress")
 
@@ -59,6 +160,9 @@ class GraphEditorApp:
         self.tree_mode_button = tk.Button(self.frame, text="Tree Mode", command=self.set_tree_mode, width=15)
         self.tree_mode_button.grid(row=0, column=2, padx=10, pady=5, sticky="ew")
 
+        self.relayout_button = tk.Button(self.frame, text="Relayout", command=self.relayout, width=15)
+        self.relayout_button.grid(row=1, column=2, padx=10, pady=5, sticky="ew")
+
         self.text_area = CodeEditor(self.frame, wrap=tk.WORD, height=20, width=40)
         self.text_area.grid(row=2, column=0, padx=10, pady=10, rowspan=4, columnspan=2, sticky="nsew")
         self.text_area.text.bind('<<Modified>>', self.on_text_change)
@@ -69,82 +173,209 @@ class GraphEditorApp:
         self.canvas.get_tk_widget().grid(row=2, column=3, rowspan=4, padx=10, pady=10, sticky="nsew")
         self.canvas.draw()
 
-        self.interpreter = Interpreter()
-        self.previous_connections = set()
+        # True while the graph does not come from the editor text: a streamed large file or a snapshot saved
+        # without its text. The editor is read-only then.
+        self.detached = False
+        # Paged, read-only view of the source while a large file is imported (see open_large_file)
+        self.pages = None
+        self.page = 0
+        self.pager = tk.Frame(self.frame)
+        self.previous_page_button = tk.Button(self.pager, text="<", command=lambda: self.show_page(self.page - 1))
+        self.previous_page_button.pack(side=tk.LEFT)
+        self.next_page_button = tk.Button(self.pager, text=">", command=lambda: self.show_page(self.page + 1))
+        self.next_page_button.pack(side=tk.LEFT)
+        self.page_label = tk.Label(self.pager, anchor="w")
+        self.page_label.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.pager.grid(row=6, column=0, columnspan=2, padx=10, sticky="ew")
+        self.pager.grid_remove()
+
+        # Start/final reachability of the current graph, refreshed with every render
+        self.query_bar = tk.Label(self.frame, anchor="w")
+        self.query_bar.grid(row=8, column=0, columnspan=4, padx=10, sticky="ew")
+
+        self.status_bar = None
+        if profile:
+            profiling.enable()
+            self.status_bar = tk.Label(self.frame, anchor="w", relief=tk.SUNKEN, font="TkFixedFont")
+            self.status_bar.grid(row=7, column=0, columnspan=4, sticky="ew")
+
+        self.worker = GraphWorker(self.graph)
+        self.mode = "default"
+        self.generation = 0
+        self.pending_update = None
         self.set_default_mode()
+        self.poll_results()
 
     def set_default_mode(self):
-        self.graph.set_mode("default")
+        self.mode = "default"
         self.update_graph()
         self.default_mode_button.config(relief=tk.SUNKEN, bg='lightblue')
         self.bipartite_mode_button.config(relief=tk.RAISED, bg='SystemButtonFace')
         self.tree_mode_button.config(relief=tk.RAISED, bg='SystemButtonFace')
 
     def set_bipartite_mode(self):
-        self.graph.set_mode("bipartite")
+        self.mode = "bipartite"
         self.update_graph()
         self.bipartite_mode_button.config(relief=tk.SUNKEN, bg='lightblue')
         self.default_mode_button.config(relief=tk.RAISED, bg='SystemButtonFace')
         self.tree_mode_button.config(relief=tk.RAISED, bg='SystemButtonFace')
 
     def set_tree_mode(self):
-        self.graph.set_mode("tree")
+        self.mode = "tree"
         self.update_graph()
         self.tree_mode_button.config(relief=tk.SUNKEN, bg='lightblue')
         self.default_mode_button.config(relief=tk.RAISED, bg='SystemButtonFace')
         self.bipartite_mode_button.config(relief=tk.RAISED, bg='SystemButtonFace')
 
+    def relayout(self):
+        self.update_graph(relayout=True)
+
     def on_text_change(self, event):
         self.text_area.text.edit_modified(0)  # Reset the modified flag
-        self.update_graph()
+        if self.detached:
+            return  # Page changes of the read-only large-file view are not edits
+        # Debounce: restart the quiet period on every edit
+        if self.pending_update is not None:
+            self.root.after_cancel(self.pending_update)
+        self.pending_update = self.root.after(DEBOUNCE_MS, self.update_graph)
 
-    def update_graph(self):
-        text = self.text_area.text.get("1.0", tk.END).strip()
-        lines = text.split('\n')
-
-        current_connections = set()
-
-        for line in lines:
-            try:
-                lexer = Lexer(line)
-                tokens = lexer.generate_tokens()
-                parser = Parser(tokens)
-                branch = parser.parse()
-                if branch:
-                    connection = self.interpreter.create_connection(branch)
-                    current_connections.add(connection)
-            except Exception as e:
-                print(f"Error: {e}")
-
-        # Remove connections that are no longer present
-        for connection in self.previous_connections - current_connections:
-            self.graph.remove_connection(connection)
-
-        # Add new connections
-        for connection in current_connections - self.previous_connections:
-            self.graph.add_connection(connection)
-
-        self.previous_connections = current_connections
-        self.canvas.draw()
+    def update_graph(self, relayout=False):
+        # Hands the current text to the worker; parsing and layout happen off the Tk thread
+        if self.pending_update is not None:
+            self.root.after_cancel(self.pending_update)
+            self.pending_update = None
+        self.generation += 1
+        # A streamed large file is not in the editor; only the mode and layout are updated then
+        text, edit = self.text_area.take_edit() if not self.detached else (None, None)
+        self.worker.submit(self.generation, text, self.mode, relayout, edit)
+
+    def poll_results(self):
+        latest = None
+        while not self.worker.results.empty():
+            latest = self.worker.results.get_nowait()
+
+        # Results of superseded edits are dropped; if the worker holds the lock it is already on a newer edit
+        if latest is not None and latest[0] == self.generation:
+            generation, pos, error = latest
+            self.text_area.show_diagnostics(self.worker.diagnostics)
+            if error is not None:
+                print(f"Error: {error}")
+            elif self.graph.lock.acquire(blocking=False):
+                try:
+                    self.graph.render(pos)
+                    self.query_bar.config(text=self.graph.queries.summary())
+                finally:
+                    self.graph.lock.release()
+                if self.status_bar is not None:
+                    self.status_bar.config(text=profiling.format_last())
+
+        if self.pages is not None:
+            self.update_page_label()
+        self.root.after(POLL_MS, self.poll_results)
 
     def upload_file(self):
-        file_path = filedialog.askopenfilename(filetypes=[("Text Files", "*.txt")])
-        if file_path:
-            with open(file_path, "r") as file:
-                code = file.read()
-                self.text_area.text.delete("1.0", tk.END)
-                self.text_area.text.insert(tk.END, code)
-            self.update_graph()
+        file_path = filedialog.askopenfilename(filetypes=[("Text Files", "*.txt"), ("Graph Snapshots", f"*{EXTENSION}")])
+        if not file_path:
+            return
+        if file_path.endswith(EXTENSION):
+            self.open_snapshot(file_path)
+            return
+        if os.path.getsize(file_path) > LARGE_FILE_BYTES:
+            self.open_large_file(file_path)
+            return
+        self.close_large_file()
+        with open(file_path, "r") as file:
+            code = file.read()
+            self.text_area.text.delete("1.0", tk.END)
+            self.text_area.text.insert(tk.END, code)
+        self.update_graph()
+
+    def open_large_file(self, file_path):
+        # Streams the file into the graph on the worker; the editor becomes a read-only view of one page
+        if self.pending_update is not None:
+            self.root.after_cancel(self.pending_update)
+            self.pending_update = None
+        self.generation += 1
+        self.detached = True
+        self.pages = PageIndex(file_path)
+        self.worker.import_file(self.generation, self.pages, self.mode)
+        self.pager.grid()
+        self.show_page(0)
+
+    def close_large_file(self):
+        # Makes the editor the source of the graph again; the worker has no text to apply edits to, so the next
+        # update sends the whole text
+        self.detached = False
+        self.text_area.edited = WHOLE_TEXT
+        self.text_area.text.config(state=tk.NORMAL)
+        if self.pages is None:
+            return
+        self.pages = None
+        self.pager.grid_remove()
+        self.text_area.line_offset = 0
+
+    def show_page(self, number):
+        pages = self.pages
+        if pages is None or not 0 <= number < pages.page_count():
+            return
+        self.page = number
+        text = self.text_area.text
+        text.config(state=tk.NORMAL)
+        text.delete("1.0", tk.END)
+        text.insert(tk.END, pages.page(number))
+        text.config(state=tk.DISABLED)
+        self.text_area.line_offset = number * pages.page_lines
+        self.text_area.update_line_numbers()
+        self.update_page_label()
+
+    def update_page_label(self):
+        pages = self.pages
+        first = self.page * pages.page_lines + 1
+        label = f"Lines {first}-{first + pages.page_lines - 1}, page {self.page + 1}/{pages.page_count()}"
+        progress = self.worker.progress
+        if progress is not None and progress[0] < progress[1]:
+            label += f"  importing {100 * progress[0] / progress[1]:.0f}%"
+        self.page_label.config(text=label)
+
+    def open_snapshot(self, file_path):
+        # The worker loads the saved graph and layouts and parses the saved text for later edits without
+        # re-adding any edge. A snapshot saved without text leaves the editor empty and read-only.
+        self.close_large_file()
+        if self.pending_update is not None:
+            self.root.after_cancel(self.pending_update)
+            self.pending_update = None
+        with Snapshot(file_path) as snapshot:
+            text = snapshot.text()
+        self.generation += 1
+        self.worker.open_snapshot(self.generation, file_path, self.mode)
+        self.detached = text is None
+        editor = self.text_area.text
+        editor.delete("1.0", tk.END)
+        if text is not None:
+            editor.insert(tk.END, text)
+        else:
+            editor.config(state=tk.DISABLED)
+        self.text_area.edited = None  # Later edits are made against the saved text the worker parses
+        self.text_area.update_line_numbers()
 
     def download_graph(self):
+        # Saves the PNG and, next to it, a compiled snapshot that reopens without re-parsing
         file_path = filedialog.asksaveasfilename(defaultextension=".png", filetypes=[("PNG Files", "*.png")])
         if file_path:
             self.fig.savefig(file_path)
+            # The text is the one the worker last applied, so that it matches the saved graph even with an edit
+            # still pending; a streamed large file has none
+            with self.graph.lock:
+                save_snapshot(os.path.splitext(file_path)[0] + EXTENSION, self.graph, text=self.worker.text)
 
 def main():
+    parser = argparse.ArgumentParser(description="GraphExpress editor")
+    parser.add_argument('--profile', action='store_true', help="show per-stage timings of each edit in a status bar")
+    args = parser.parse_args()
+
     root = tk.Tk()
     root.iconbitmap('icon.ico')  # Set the path to your icon file here
-    app = GraphEditorApp(root)
+    app = GraphEditorApp(root, profile=args.profile)
     root.mainloop()
 
 if __name__ == "__main__":
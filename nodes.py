@@ -1,16 +1,20 @@
-from dataclasses import dataclass
+import sys
+from dataclasses import dataclass, field
 
 
-@dataclass
-class NumberNode:
+# The parser builds these hashable value objects directly; the Graph consumes them unchanged.
+# Names and numbers are interned, so a script that mentions the same node a million times keeps one object.
+
+@dataclass(frozen=True, slots=True)
+class Number:
     value: float
 
     def __repr__(self):
         return f"{self.value}"
 
 
-@dataclass
-class NameNode:
+@dataclass(frozen=True, slots=True)
+class Name:
     value: str
     final: bool
     start: bool
@@ -18,18 +22,43 @@ class NameNode:
     def __repr__(self):
         final_status = "final" if self.final else "not final"
         start_status = "start" if self.start else "not start"
-        return f"NameNode(value='{self.value}', status='{final_status, start_status}')"
+        return f"Name(value='{self.value}', status='{final_status, start_status}')"
 
 
-@dataclass
-class ConnectNode:
-    name_a: NameNode
-    name_b: NameNode
+@dataclass(frozen=True, slots=True)
+class Connection:
+    name_a: Name
+    name_b: Name
+    weight: Number
+    destroy: bool
     left_dir: bool
     right_dir: bool
-    weight: NumberNode
-    destroy: bool
+    span: tuple = field(default=None, compare=False)  # (line, start column, end column exclusive) in the source
 
     def __repr__(self):
-        return f"ConnectNode({self.name_a} {'<-' if self.left_dir else '-'} {self.weight} " \
+        return f"Connection({self.name_a} {'<-' if self.left_dir else '-'} {self.weight} " \
                f"{'->' if self.right_dir else '-'} {self.name_b}) {'status:'} {'destroyed' if self.destroy else 'alive'} "
+
+
+# Intern tables, one per (final, start) combination so a lookup does not allocate a key tuple.
+# Like sys.intern they only grow, bounded by the distinct names and weights ever parsed.
+_names = ({}, {}, {}, {})
+_numbers = {}
+
+ZERO = Number(0)
+
+
+def intern_name(value, final=False, start=False):
+    names = _names[final * 2 + start]
+    name = names.get(value)
+    if name is None:
+        name = names[value] = Name(sys.intern(value), final, start)
+    return name
+
+
+def intern_number(value):
+    number = _numbers.get(value)
+    if number is None:
+        number = _numbers[value] = Number(value)
+    return number
+
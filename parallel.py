@@ -0,0 +1,135 @@
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from lexer import Lexer
+from nodes import ZERO, Connection, intern_name, intern_number
+from parser_ import Parser
+
+# Each job is given about this many pieces of the document, so one slow piece does not hold up the rest
+CHUNKS_PER_JOB = 4
+# Documents are not cut into pieces smaller than this; a document of one piece is parsed in this process
+MIN_CHUNK_CHARS = 256 * 1024
+
+# Bits of EdgeRecords.flags
+DESTROY, LEFT, RIGHT, WEIGHTED, START_A, FINAL_A, START_B, FINAL_B = (1 << bit for bit in range(8))
+
+
+class EdgeRecords:
+    # Parsed commands as parallel arrays instead of Connection objects: a and b index into names, and flags
+    # holds the destroy/direction/marker bits above. A few arrays pickle far faster than a list of dataclasses,
+    # which is what makes sending the parse of a document piece back from a worker process cheap.
+    def __init__(self, names, a, b, weights, flags):
+        self.names = names
+        self.a = a
+        self.b = b
+        self.weights = weights
+        self.flags = flags
+
+    def __len__(self):
+        return len(self.a)
+
+    def take(self, rows):
+        return EdgeRecords(self.names, self.a[rows], self.b[rows], self.weights[rows], self.flags[rows])
+
+    @classmethod
+    def concatenate(cls, parts):
+        # Joins the records of consecutive pieces of one document, renumbering their names into one table
+        index = {}
+        columns = [], [], [], []
+        for part in parts:
+            lookup = np.array([index.setdefault(name, len(index)) for name in part.names], dtype=np.int32)
+            for column, values in zip(columns, (lookup[part.a], lookup[part.b], part.weights, part.flags)):
+                column.append(values)
+        return cls(list(index), *(np.concatenate(column) for column in columns))
+
+    def latest(self):
+        # Only the last record for each pair of names, whichever way round, kept in document order
+        low = np.minimum(self.a, self.b).astype(np.int64)
+        keys = low * max(len(self.names), 1) + np.maximum(self.a, self.b)
+        order = np.lexsort((np.arange(len(keys)), keys))
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = keys[order[1:]] != keys[order[:-1]]
+        return self.take(np.sort(order[last]))
+
+    def cleared(self):
+        # The records Interpreter.clear_tree keeps, in the order it returns them: the last command per pair,
+        # latest first, without the destroys
+        latest = self.latest()
+        return latest.take(np.flatnonzero(latest.flags & DESTROY == 0)[::-1])
+
+    def connections(self):
+        # The records as interned Connection objects, equal to the ones the parser built for them
+        # Names and weights are interned once per distinct value rather than once per record
+        names = self.names
+        flags = self.flags
+        columns = []
+        for index, markers in ((self.a, flags // START_A % 4), (self.b, flags // START_B % 4)):
+            # markers is start + 2 * final, as intern_name numbers its tables
+            codes, inverse = np.unique(index.astype(np.int64) * 4 + markers, return_inverse=True)
+            interned = np.array([intern_name(names[code // 4], code & 2 == 2, code & 1 == 1)
+                                 for code in codes.tolist()], dtype=object)
+            columns.append(interned[inverse.ravel()].tolist())
+        weighted = flags & WEIGHTED != 0
+        values, inverse = np.unique(np.where(weighted, self.weights, 0.0), return_inverse=True)
+        numbers = np.array([intern_number(value) for value in values.tolist()], dtype=object)
+        weights = np.where(weighted, numbers[inverse.ravel()], ZERO)
+        columns.append(weights.tolist())
+        for bit in (DESTROY, LEFT, RIGHT):
+            columns.append((flags & bit != 0).tolist())
+        return list(map(Connection, *columns))
+
+
+def parse_records(text, first_line=1):
+    # Parses a piece of a document that starts at line first_line, keeping the last command per pair.
+    # Syntax errors are raised as by a sequential parse, with line numbers counted from the whole document.
+    index = {}
+    a = array('i')
+    b = array('i')
+    weights = array('d')
+    flags = array('B')
+    tokens = Lexer(text, positions=False, first_line=first_line).generate_tokens()
+    for connection in Parser(tokens, first_line=first_line).parse_document():
+        name_a = connection.name_a
+        name_b = connection.name_b
+        a.append(index.setdefault(name_a.value, len(index)))
+        b.append(index.setdefault(name_b.value, len(index)))
+        weights.append(connection.weight.value)
+        flags.append(connection.destroy * DESTROY | connection.left_dir * LEFT | connection.right_dir * RIGHT
+                     | (connection.weight is not ZERO) * WEIGHTED
+                     | name_a.start * START_A | name_a.final * FINAL_A
+                     | name_b.start * START_B | name_b.final * FINAL_B)
+    records = EdgeRecords(list(index), np.frombuffer(a, dtype=np.intc), np.frombuffer(b, dtype=np.intc),
+                          np.frombuffer(weights, dtype=np.float64), np.frombuffer(flags, dtype=np.uint8))
+    return records.latest()
+
+
+def split_lines(text, count):
+    # Cuts text at line breaks into at most count pieces of similar size: (piece, line number it starts at)
+    size = max(len(text) // count, 1)
+    pieces = []
+    start = 0
+    line = 1
+    while start < len(text):
+        cut = text.find('\n', start + size)
+        end = len(text) if cut < 0 else cut + 1
+        pieces.append((text[start:end], line))
+        line += text.count('\n', start, end)
+        start = end
+    return pieces
+
+
+def parse_parallel(text, jobs=None):
+    # Lexes and parses a whole document across a process pool. The result holds exactly the commands of
+    # Interpreter.clear_tree(Parser(Lexer(text).generate_tokens()).parse_document()), in the same order;
+    # apply its connections() with Interpreter.apply, which does not clear them again.
+    jobs = jobs or os.cpu_count() or 1
+    count = min(jobs * CHUNKS_PER_JOB, len(text) // MIN_CHUNK_CHARS)
+    if jobs == 1 or count <= 1:
+        return parse_records(text).cleared()
+
+    pieces = split_lines(text, count)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        # Results come back in document order, so the first piece with a syntax error raises first
+        parts = list(pool.map(parse_records, *zip(*pieces)))
+    return EdgeRecords.concatenate(parts).cleared()
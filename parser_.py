@@ -1,20 +1,53 @@
-from tokens import TokenType
+from functools import partial
+from itertools import chain, groupby
+from operator import is_
+from tokens import NEWLINE_TOKEN, TOKEN_NAMES, Diagnostic, ParseError, TokenType
 from nodes import *
 
+# What may start a node, for the expected tokens of a diagnostic
+NODE_START = (TokenType.FINAL, TokenType.START, TokenType.NAME)
+
 
 class Parser:
-    def __init__(self, tokens):
+    def __init__(self, tokens, diagnostics=None, first_line=1, lexer=None):
+        # With a diagnostics list, syntax errors are appended to it and the statement is skipped instead of
+        # raising ParseError. first_line numbers the lines. Tokens carry no positions: given the lexer that
+        # produced them, columns of diagnostics and spans of statements are asked from it when needed.
         self.tokens = iter(tokens)
+        self.diagnostics = diagnostics
+        self.lexer = lexer
+        self.line = first_line
+        self.index = -1  # of the current token on its line
+        self.current_token = None
+        self.kind = None  # type of the current token, None at the end of the line
         self.advance()
 
-    def raise_error(self):
-        raise Exception("Invalid syntax")
+    def error(self, expected):
+        # Raises a ParseError for the current token, or records it and returns None so the statement is dropped.
+        # expected are the token types (None for the end of the line) that would have been accepted here.
+        token = self.current_token
+        if self.kind is TokenType.ERROR:
+            return None  # The lexer has reported the illegal character
+        expected = tuple(TOKEN_NAMES[token_type] for token_type in expected)
+        # At the end of the line the last token is pointed at
+        index = self.index if token is not None else self.index - 1
+        located = self.lexer.locate(self.line, index) if self.lexer is not None and index >= 0 else None
+        column, end = located or (None, None)
+        alternatives = ' or '.join(filter(None, [', '.join(expected[:-1]), expected[-1]]))
+        message = f"Invalid syntax: expected {alternatives}, found {TOKEN_NAMES[self.kind]}"
+        diagnostic = Diagnostic(self.line, column, end, message, expected)
+        if self.diagnostics is None:
+            raise ParseError(diagnostic)
+        self.diagnostics.append(diagnostic)
+        return None
 
     def advance(self):
+        self.index += 1
         try:
-            self.current_token = next(self.tokens)
+            token = self.current_token = next(self.tokens)
+            self.kind = token.type
         except StopIteration:
-            self.current_token = None
+            self.current_token = self.kind = None
 
     def parse(self):
         if self.current_token is None:
@@ -22,98 +55,124 @@ class Parser:
 
         result = self.expr()
 
-        if self.current_token is not None:
-            self.raise_error()
+        if result is not None and self.current_token is not None:
+            return self.error((None,))
 
         return result
 
+    def parse_document(self):
+        # Lazily yields one Connection per statement of a whole document; statements end at line breaks
+        if self.current_token is None:
+            return
+        tokens = chain([self.current_token], self.tokens)
+
+        for newline, line_tokens in groupby(tokens, key=partial(is_, NEWLINE_TOKEN)):
+            if newline:
+                self.line += sum(1 for _ in line_tokens)
+                continue
+            self.tokens = line_tokens
+            self.index = -1
+            self.advance()
+
+            result = self.parse()
+            if result:
+                yield result
+
+    def span(self):
+        # (line, start column, end column exclusive) of the statement on the current line, if the lexer
+        # tracks positions; a statement is the whole line
+        return self.lexer.span(self.line) if self.lexer is not None else None
+
     def expr(self):
         start_node = self.node()
+        if start_node is None or self.current_token is None:
+            return None  # An error, or a lone name, which is not a statement
 
         # Initial settings
-        weight = NumberNode(value=0)
+        weight = ZERO
         l_direction = False
         r_direction = False
         destroy = False
+        # Optional tokens still allowed before the end node
+        optional = (TokenType.LEFT, TokenType.DASH, TokenType.RIGHT)
 
-        while self.current_token is not None:
-
-            if self.current_token.type == TokenType.LEFT:
-                self.advance()
-                l_direction = True
-
-            # Look for the dash, which might be part of destroy command
-            if self.current_token.type == TokenType.DASH:
-                self.advance()
-                if self.current_token.type == TokenType.DESTROY:
-                    destroy = True
-                    self.advance()  # Skip the destroy token
-                    if self.current_token.type == TokenType.DASH:
-                        self.advance()  # Skip the final dash in the destroy sequence
-                elif self.current_token.type == TokenType.WEIGHT:
-                    weight = self.weight()
-                    if self.current_token.type == TokenType.DASH:
-                        self.advance()  # Skip the final dash in the destroy sequence
-                elif self.current_token.type == TokenType.DASH:
-                    # This means it was a double dash (--) without destroy
-                    self.advance()
-                else:
-                    self.raise_error("Expected another '-' for connection or '/-' for destroy")
-
-            if self.current_token.type == TokenType.RIGHT:
-                self.advance()
-                r_direction = True
-
-            end_node = self.node()
-
-            return ConnectNode(name_a=start_node, name_b=end_node, left_dir=l_direction, right_dir=r_direction,
-                            weight=weight, destroy=destroy)
-
-
-    def node(self):
-        token = self.current_token
+        if self.kind is TokenType.LEFT:
+            self.advance()
+            l_direction = True
+            optional = (TokenType.DASH, TokenType.RIGHT)
+
+        # Look for the dash, which might be part of destroy command
+        if self.kind is TokenType.DASH:
+            self.advance()
+            optional = (TokenType.DASH, TokenType.RIGHT)
+            if self.kind is TokenType.DESTROY:
+                destroy = True
+                self.advance()  # Skip the destroy token
+            elif self.kind is TokenType.WEIGHT:
+                weight = self.weight()
+            elif self.kind is TokenType.DASH:
+                # This means it was a double dash (--) without destroy
+                optional = (TokenType.RIGHT,)
+            else:
+                return self.error((TokenType.DESTROY, TokenType.WEIGHT, TokenType.DASH))
+            if self.kind is TokenType.DASH:
+                self.advance()  # Skip the final dash of the destroy or weighted sequence, or the second dash
+                optional = (TokenType.RIGHT,)
+
+        if self.kind is TokenType.RIGHT:
+            self.advance()
+            r_direction = True
+            optional = ()
+
+        end_node = self.node(optional)
+        if end_node is None:
+            return None
+
+        return Connection(name_a=start_node, name_b=end_node, weight=weight, destroy=destroy,
+                          left_dir=l_direction, right_dir=r_direction, span=self.span())
+
+    def node(self, optional=()):
+        # optional: the token types that could have come before the node instead, for diagnostics
         start = False
         final = False
 
-        if token.type == TokenType.FINAL:
+        if self.kind is TokenType.FINAL:
             self.advance()
-            token = self.current_token
             final = True
+            optional = None
 
-        if token.type == TokenType.START:
+        if self.kind is TokenType.START:
             self.advance()
-            token = self.current_token
             start = True
+            optional = None
 
-        if token.type == TokenType.NAME:
+        if self.kind is TokenType.NAME:
+            token = self.current_token
             self.advance()
-            return NameNode(value=token.value, final=final, start=start)
+            return intern_name(token.value, final, start)
 
-        self.raise_error()
+        if optional is None:
+            return self.error(NODE_START[1:] if not start else NODE_START[2:])
+        return self.error(optional + NODE_START)
 
     def weight(self):
-        token = self.current_token
-
-        if token.type == TokenType.WEIGHT:
+        if self.kind is TokenType.WEIGHT:
+            token = self.current_token
             self.advance()
-            return NumberNode(value=token.value)
+            return intern_number(token.value)
 
-        self.raise_error()
+        return self.error((TokenType.WEIGHT,))
 
     def dash(self):
-        token = self.current_token
-
-        if token.type == TokenType.DASH:
+        if self.kind is TokenType.DASH:
             self.advance()
-            return
+            return True
 
-        self.raise_error()
+        return self.error((TokenType.DASH,))
 
     def destroy(self):
-        token = self.current_token
-
-        if token.type == TokenType.DESTROY:
+        if self.kind is TokenType.DESTROY:
             self.advance()
             return True
 
-        self.raise_error()
\ No newline at end of file
+        return self.error((TokenType.DESTROY,))
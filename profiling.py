@@ -0,0 +1,112 @@
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+# Stage timers and event counters for the edit pipeline. Everything is a no-op until enable() is called:
+# stage() then hands back a shared null context and count() returns after one flag test.
+enabled = False
+
+totals = Counter()  # stage -> seconds spent in it
+calls = Counter()  # stage -> times it ran
+counters = Counter()  # event -> count, e.g. layouts computed or edges drawn
+last = {}  # stage -> seconds in the most recent edit, see begin_edit()
+
+# Order of the stages in reports; stages not listed here are appended after them
+STAGES = ('lex', 'parse', 'diff', 'clear_tree', 'mutation', 'layout', 'render', 'export')
+
+_disabled = nullcontext()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    totals.clear()
+    calls.clear()
+    counters.clear()
+    last.clear()
+
+
+def stage(name):
+    # with profiling.stage('parse'): ... -- times the block when profiling is enabled
+    if not enabled:
+        return _disabled
+    return _timed(name)
+
+
+@contextmanager
+def _timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        totals[name] += seconds
+        calls[name] += 1
+        last[name] = last.get(name, 0.0) + seconds
+
+
+def count(name, n=1):
+    if enabled:
+        counters[name] += n
+
+
+def begin_edit():
+    # Starts a new per-edit breakdown; stages timed from here on are what last holds
+    if enabled:
+        last.clear()
+
+
+def ordered(names):
+    names = set(names)
+    return [name for name in STAGES if name in names] + sorted(names.difference(STAGES))
+
+
+def report():
+    # Machine-readable totals: {'stages': {name: {'calls', 'seconds'}}, 'counters': {...}, 'last': {...}}
+    return {
+        'stages': {name: {'calls': calls[name], 'seconds': totals[name]} for name in ordered(totals)},
+        'counters': dict(counters),
+        'last': dict(last),
+    }
+
+
+def merge(reports):
+    # Sums reports from several processes into one
+    merged = {'stages': {}, 'counters': Counter(), 'last': {}}
+    for part in reports:
+        for name, data in part['stages'].items():
+            total = merged['stages'].setdefault(name, {'calls': 0, 'seconds': 0.0})
+            total['calls'] += data['calls']
+            total['seconds'] += data['seconds']
+        merged['counters'].update(part['counters'])
+    merged['stages'] = {name: merged['stages'][name] for name in ordered(merged['stages'])}
+    merged['counters'] = dict(merged['counters'])
+    return merged
+
+
+def format_last():
+    # One line for the status bar, e.g. "lex 0.4ms | parse 0.9ms | layout 12.0ms | render 80.3ms | total 93.6ms"
+    breakdown = dict(last)
+    if not breakdown:
+        return ""
+    parts = [f"{name} {breakdown[name] * 1000:.1f}ms" for name in ordered(breakdown)]
+    parts.append(f"total {sum(breakdown.values()) * 1000:.1f}ms")
+    return " | ".join(parts)
+
+
+def format_report(data):
+    lines = [f"{'stage':12s} {'calls':>8s} {'total':>12s} {'mean':>12s}"]
+    for name, stats in data['stages'].items():
+        mean = stats['seconds'] / stats['calls'] if stats['calls'] else 0.0
+        lines.append(f"{name:12s} {stats['calls']:8d} {stats['seconds'] * 1000:10.2f}ms {mean * 1000:10.3f}ms")
+    for name, value in sorted(data['counters'].items()):
+        lines.append(f"{name:30s} {value:10d}")
+    return "\n".join(lines)
@@ -0,0 +1,245 @@
+import heapq
+from itertools import count
+from nodes import intern_name
+
+# Directions an edge of each style can be walked in: (a -> b, b -> a)
+ARCS = {
+    'line': (True, True),
+    'right_arrow': (True, False),
+    'left_arrow': (False, True),
+    'double_arrow': (True, True),
+}
+INFINITY = float('inf')
+
+
+def other_end(key, node):
+    a, b = key
+    return b if node == a else a
+
+
+class ShortestPathTree:
+    # Multi-source shortest paths kept up to date under arc and source insertions and deletions.
+    # Insertions relax outwards from the improved node only. Deleting a tree arc invalidates just the subtree
+    # hanging below it, which is re-seeded from its remaining in-arcs and settled again with Dijkstra.
+    # The arcs live in GraphQueries: out[u] and into[v] map the key (a, b) of each DSL edge to its weight,
+    # so a tree over the reversed graph simply swaps the two tables.
+    def __init__(self, out, into):
+        self.out = out
+        self.into = into
+        self.sources = set()
+        self.dist = {}
+        self.parent = {}  # v -> key of the edge it is reached through, or None for a source
+        self.children = {}  # u -> set of v whose parent edge leaves u
+        self._tiebreak = count()
+
+    def arc_added(self, u, v, key, weight):
+        # Called after the arc u -> v has been added to the tables
+        if u in self.dist and self.dist[u] + weight < self.dist.get(v, INFINITY):
+            self._settle(v, key, self.dist[u] + weight)
+            self._propagate([v])
+
+    def arc_removed(self, u, v, key):
+        # Called after the arc u -> v has been removed from the tables
+        if self.parent.get(v) == key and v in self.children.get(u, ()):
+            self._repair(v)
+
+    def add_source(self, node):
+        self.sources.add(node)
+        if self.dist.get(node, INFINITY) > 0:
+            self._settle(node, None, 0)
+            self._propagate([node])
+        else:
+            self._set_parent(node, None)
+
+    def remove_source(self, node):
+        self.sources.discard(node)
+        if node in self.dist and self.parent[node] is None:
+            self._repair(node)
+
+    def path(self, node):
+        # Nodes from the nearest source to node, or None if node is unreachable
+        if node not in self.dist:
+            return None
+        path = [node]
+        while self.parent[node] is not None:
+            node = other_end(self.parent[node], node)
+            path.append(node)
+        path.reverse()
+        return path
+
+    def _set_parent(self, node, key):
+        old = self.parent.get(node)
+        if old is not None:
+            tail = other_end(old, node)
+            siblings = self.children[tail]
+            siblings.discard(node)
+            if not siblings:
+                del self.children[tail]
+        self.parent[node] = key
+        if key is not None:
+            self.children.setdefault(other_end(key, node), set()).add(node)
+
+    def _settle(self, node, key, distance):
+        self._set_parent(node, key)
+        self.dist[node] = distance
+
+    def _propagate(self, seeds):
+        # Dijkstra from nodes whose distance just dropped
+        heap = [(self.dist[node], next(self._tiebreak), node) for node in seeds]
+        heapq.heapify(heap)
+        while heap:
+            distance, _, u = heapq.heappop(heap)
+            if distance > self.dist.get(u, INFINITY):
+                continue
+            for key, weight in self.out.get(u, {}).items():
+                v = other_end(key, u)
+                candidate = distance + weight
+                if candidate < self.dist.get(v, INFINITY):
+                    self._settle(v, key, candidate)
+                    heapq.heappush(heap, (candidate, next(self._tiebreak), v))
+
+    def _repair(self, root):
+        # Distances outside root's subtree did not depend on the lost arc; only the subtree is recomputed
+        affected = [root]
+        for node in affected:
+            affected.extend(self.children.get(node, ()))
+        for node in affected:
+            self._set_parent(node, None)
+            del self.parent[node]
+            del self.dist[node]
+
+        seeds = []
+        for node in affected:
+            best = 0 if node in self.sources else INFINITY
+            best_key = None
+            for key, weight in self.into.get(node, {}).items():
+                u = other_end(key, node)
+                if u in self.dist and self.dist[u] + weight < best:
+                    best = self.dist[u] + weight
+                    best_key = key
+            if best < INFINITY:
+                self._settle(node, best_key, best)
+                seeds.append(node)
+        self._propagate(seeds)
+
+
+class GraphQueries:
+    # Start/final queries over a Graph, maintained edge by edge: `forward` holds shortest paths from the start
+    # nodes along the arrows, `backward` the same from the final nodes against them. A node is unreachable if
+    # no start reaches it and dead if it cannot reach any final.
+    def __init__(self):
+        self.edges = {}  # (a, b) -> (weight, style, name_a, name_b) as added
+        self.nodes = {}  # node -> incident edges
+        self.starts = {}  # node -> edges that mark it as a start
+        self.finals = {}
+        self.out = {}  # u -> {edge key: weight} for the arcs leaving u
+        self.into = {}  # v -> {edge key: weight} for the arcs entering v
+        self.forward = ShortestPathTree(self.out, self.into)
+        self.backward = ShortestPathTree(self.into, self.out)
+
+    @classmethod
+    def from_store(cls, store, markers=None):
+        # Builds the index for an existing graph. The store keeps bare node names; markers maps the key (a, b)
+        # of each edge that marked an end as start or final to its (name_a, name_b), as Graph.markers does.
+        markers = markers or {}
+        queries = cls()
+        for a, b, weight, style in store.edges():
+            names = markers.get((a, b))
+            if names is None:
+                names = intern_name(a), intern_name(b)
+            queries.add_edge(*names, weight, style)
+        return queries
+
+    def arcs(self, key, style):
+        a, b = key
+        forward, backward = ARCS.get(style, ARCS['line'])
+        if forward:
+            yield a, b
+        if backward and a != b:
+            yield b, a
+
+    def add_edge(self, name_a, name_b, weight, style):
+        key = (name_a.value, name_b.value)
+        if key in self.edges:
+            self.remove_edge(*key)
+        self.edges[key] = (weight, style, name_a, name_b)
+        for node in key:
+            self.nodes[node] = self.nodes.get(node, 0) + 1
+
+        for u, v in self.arcs(key, style):
+            self.out.setdefault(u, {})[key] = weight
+            self.into.setdefault(v, {})[key] = weight
+            self.forward.arc_added(u, v, key, weight)
+            self.backward.arc_added(v, u, key, weight)
+
+        for name in (name_a, name_b):
+            if name.start:
+                self._mark(self.starts, self.forward, name.value)
+            if name.final:
+                self._mark(self.finals, self.backward, name.value)
+
+    def remove_edge(self, a, b):
+        key = (a, b)
+        weight, style, name_a, name_b = self.edges.pop(key)
+        for node in key:
+            self.nodes[node] -= 1
+            if not self.nodes[node]:
+                del self.nodes[node]
+
+        for name in (name_a, name_b):
+            if name.start:
+                self._unmark(self.starts, self.forward, name.value)
+            if name.final:
+                self._unmark(self.finals, self.backward, name.value)
+
+        for u, v in self.arcs(key, style):
+            del self.out[u][key]
+            if not self.out[u]:
+                del self.out[u]
+            del self.into[v][key]
+            if not self.into[v]:
+                del self.into[v]
+            self.forward.arc_removed(u, v, key)
+            self.backward.arc_removed(v, u, key)
+
+    @staticmethod
+    def _mark(counts, tree, node):
+        counts[node] = counts.get(node, 0) + 1
+        if counts[node] == 1:
+            tree.add_source(node)
+
+    @staticmethod
+    def _unmark(counts, tree, node):
+        counts[node] -= 1
+        if not counts[node]:
+            del counts[node]
+            tree.remove_source(node)
+
+    def reachable_finals(self):
+        return [node for node in self.finals if node in self.forward.dist]
+
+    def shortest_paths(self):
+        # final -> (distance, path from the nearest start) for every reachable final
+        return {node: (self.forward.dist[node], self.forward.path(node)) for node in self.reachable_finals()}
+
+    def unreachable_nodes(self):
+        return [node for node in self.nodes if node not in self.forward.dist]
+
+    def dead_nodes(self):
+        return [node for node in self.nodes if node not in self.backward.dist]
+
+    def summary(self):
+        # One line for the GUI
+        if not self.starts and not self.finals:
+            return "No start (=>) or final (*) nodes"
+        reached = self.reachable_finals()
+        parts = [f"{len(reached)}/{len(self.finals)} finals reachable from {len(self.starts)} starts"]
+        if reached:
+            final = min(reached, key=self.forward.dist.get)
+            path = self.forward.path(final)
+            if len(path) > 8:
+                path = path[:3] + ['...'] + path[-3:]
+            parts.append(f"shortest {self.forward.dist[final]:g}: {' -> '.join(path)}")
+        parts.append(f"{len(self.unreachable_nodes())} unreachable")
+        parts.append(f"{len(self.dead_nodes())} dead")
+        return " | ".join(parts)
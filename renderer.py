@@ -0,0 +1,687 @@
+import math
+from bisect import bisect_left
+import networkx as nx
+import numpy as np
+import profiling
+from matplotlib.path import Path
+from matplotlib.text import Text
+from matplotlib.transforms import Bbox, IdentityTransform
+from store import STYLE_CODES
+
+NODE_SIZE = 700
+NODE_COLOR = 'skyblue'
+FONT_SIZE = 12
+# networkx's font size for the weight labels
+EDGE_FONT_SIZE = 10
+EDGE_STYLES = {
+    'double_arrow': {'arrowstyle': '<->', 'arrowsize': 20},
+    'left_arrow': {'arrowstyle': '<-', 'arrowsize': 20},
+    'right_arrow': {'arrowstyle': '->', 'arrowsize': 20},
+    'line': {'arrowstyle': '-'},
+}
+# Room around an edge's straight segment for its arrow heads and the box of its weight label
+EDGE_PAD_POINTS = 24
+# Repainting more than this fraction of the axes is left to a full draw
+FULL_REPAINT_AREA = 0.5
+# Long edges are damaged as a chain of boxes about this many pads long rather than one big box
+TILE_PADS = 4
+# zorders of the artists drawn one per element: arrows above the line collection (1) and below their weight
+# labels, which sit below the nodes (2); node labels on top of everything
+ARROW_ZORDERS = (1, 1.5)
+EDGE_LABEL_ZORDERS = (1.5, 2)
+LABEL_ZORDERS = (3, 3.5)
+# Columns of an edge row: both ends, the style code and the weight
+EDGE_COLUMNS = 6
+
+
+def sketch(nodes=(), edges=()):
+    # A networkx graph of just the nodes and edges about to be drawn. The drawing functions only read those,
+    # while graph.G would copy the whole compact store after every edit.
+    G = nx.DiGraph()
+    G.add_nodes_from(nodes)
+    G.add_edges_from(edges)
+    return G
+
+
+class DrawOrder:
+    # Distinct zorders in the open interval (low, high) that stack one artist per key in key order, whatever
+    # order the artists were made in, so an edited drawing stacks exactly like one drawn from scratch.
+    # A new key takes the midpoint of its neighbours; once a gap is too narrow to split, all are spaced again.
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+        self.keys = []
+        self.zorders = []
+
+    def assign(self, keys):
+        # Spaces the keys out evenly; returns {key: zorder}
+        self.keys = sorted(keys)
+        step = (self.high - self.low) / (len(self.keys) + 1)
+        self.zorders = [self.low + step * (i + 1) for i in range(len(self.keys))]
+        return dict(zip(self.keys, self.zorders))
+
+    def add(self, key):
+        # zorder of a new key, or None if there was no room and all keys have to be spaced again with assign()
+        i = bisect_left(self.keys, key)
+        below = self.zorders[i - 1] if i else self.low
+        above = self.zorders[i] if i < len(self.zorders) else self.high
+        zorder = (below + above) / 2
+        self.keys.insert(i, key)
+        self.zorders.insert(i, zorder)
+        return zorder if below < zorder < above else None
+
+    def remove(self, key):
+        i = bisect_left(self.keys, key)
+        del self.keys[i]
+        del self.zorders[i]
+
+
+class SortedRows:
+    # Keys in sorted order, each with a row of a float array: node positions, or edge ends, style and weight.
+    # Collections are drawn in this order, and damaged regions are hit-tested against the rows in NumPy.
+    def __init__(self, width):
+        self.keys = []
+        self.rows = np.empty((0, width))
+
+    def assign(self, keys, rows):
+        # keys must be sorted, rows in the same order
+        self.keys = list(keys)
+        self.rows = np.array(rows, dtype=float).reshape(len(self.keys), -1)
+
+    def index(self, key):
+        return bisect_left(self.keys, key)
+
+    def insert(self, key, row):
+        i = bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.rows = np.insert(self.rows, i, row, axis=0)
+
+    def remove(self, key):
+        i = bisect_left(self.keys, key)
+        del self.keys[i]
+        self.rows = np.delete(self.rows, i, axis=0)
+
+    def set(self, key, row):
+        self.rows[bisect_left(self.keys, key)] = row
+
+
+class Renderer:
+    # Retained-mode drawing of a Graph: the node, label, edge and weight-label artists stay on the axes
+    # between renders. Each render takes the store's ChangeSet and diffs only the nodes and edges in it (and
+    # those of nodes the layout moved), so an edit costs about as much as the artists it touches. Artists
+    # are stacked in name order (see DrawOrder), so an edited drawing matches one drawn from scratch pixel
+    # for pixel. If the view is unchanged only the screen regions the changed elements cover (before and
+    # after) are repainted: the empty axes are restored there from a saved background, the artists
+    # overlapping the region are redrawn clipped to it, and the result is blitted.
+    def __init__(self, ax):
+        self.ax = ax
+        # The clip path of the last repaint. Agg knows its last clip path by address only, so one left to be
+        # freed could be taken for the next one when that is allocated in its place.
+        self.clip = None
+        self.reset()
+
+    def reset(self):
+        self.store = None  # the store drawn, whose ChangeSet is diffed
+        self.source = None  # the positions mapping drawn; while it is the same, only changed nodes can move
+        self.positions = {}  # node -> (x, y) as drawn
+        self.edges = {}  # (a, b) -> (style, weight) as drawn
+        self.node_rows = SortedRows(2)
+        self.edge_rows = SortedRows(EDGE_COLUMNS)
+        self.node_collection = None
+        self.labels = {}  # node -> Text
+        self.label_order = DrawOrder(*LABEL_ZORDERS)
+        self.line_collection = None
+        self.lines = []  # sorted (a, b) of the 'line' edges, matching the paths of line_collection
+        self.arrows = {}  # (a, b) -> FancyArrowPatch
+        self.arrow_order = DrawOrder(*ARROW_ZORDERS)
+        self.edge_labels = {}  # (a, b) -> Text
+        self.edge_label_order = DrawOrder(*EDGE_LABEL_ZORDERS)
+        self.longest_weight = 0  # characters in the longest weight label drawn
+        self.loops = set()  # self-loops drawn, and the extents networkx sized them by
+        self.loop_extents = None
+        self.loop_reach = {}  # self-loop -> how far above its node the loop and its weight label reach
+        self.background = None  # the axes without the graph, for repainting damaged regions
+        self.view = None  # view limits and figure size the background was saved for
+
+    def render(self, graph, pos):
+        ax = self.ax
+        canvas = ax.figure.canvas
+        store = graph.store
+        changes = store.changes.take()
+        if (changes is None or store is not self.store or len(store) == 0 or self.node_collection is None
+                or self.node_collection.axes is not ax):
+            # Nothing to diff against: the first render, a new or bulk-loaded store, more changes than a
+            # ChangeSet lists, or the axes cleared by someone else
+            self.draw_all(store, pos)
+            return
+
+        nodes, edges = changes
+        if pos is not self.source:
+            # A new layout may have moved any node; with the same positions only added nodes have one
+            nodes = nodes | set(store.nodes())
+        moved = {}
+        removed = []
+        for node in nodes:
+            if node in store:
+                xy = (float(pos[node][0]), float(pos[node][1]))
+                if self.positions.get(node) != xy:
+                    moved[node] = xy
+            elif node in self.positions:
+                removed.append(node)
+        shifted = {node for node in moved if node in self.positions}
+        if shifted:
+            edges = edges | {edge for edge in self.edges if edge[0] in shifted or edge[1] in shifted}
+        stale = []
+        fresh = {}
+        for edge in edges:
+            now = store.edge(*edge)
+            if now is not None:
+                now = (now[1], now[0])
+            drawn = self.edges.get(edge)
+            ends_moved = edge[0] in moved or edge[1] in moved
+            if drawn is not None and (now != drawn or ends_moved):
+                stale.append(edge)
+            if now is not None and (now != drawn or ends_moved):
+                fresh[edge] = now
+        self.source = pos
+        if not moved and not removed and not stale and not fresh and self.background is not None:
+            return
+        if any(a == b for a, b in stale) or any(a == b for a, b in fresh):
+            # networkx sizes self-loops from the other edges drawn with them, so they are only drawn with all
+            self.draw_all(store, pos)
+            return
+
+        # Regions covered by what is about to change, and its data extent, while both still match the screen
+        damage = []
+        if self.background is not None:
+            damage += self.node_boxes(list(shifted) + removed, self.positions)
+            damage += self.edge_boxes(stale, self.positions)
+        limits = ax.dataLim.get_points().copy()
+        shrunk = [self.positions[node] for node in list(shifted) + removed]
+        shrunk_rows = self.edge_rows.rows[[self.edge_rows.index(edge) for edge in stale]]
+
+        # networkx rescales the view after every call; the limits are set once below instead
+        ax.set_autoscale_on(False)
+        try:
+            self.update_artists(moved, removed, stale, fresh)
+        finally:
+            ax.set_autoscale_on(True)
+        if self.loops and self.extents_of_loops() != self.loop_extents:
+            self.draw_all(store, pos)
+            return
+        self.update_limits(limits, shrunk, shrunk_rows, list(moved.values()),
+                           self.edge_rows.rows[[self.edge_rows.index(edge) for edge in fresh]])
+
+        view = (tuple(ax.viewLim.bounds), tuple(ax.figure.bbox.bounds))
+        if self.background is not None and view == self.view and canvas.supports_blit:
+            damage = self.clip_boxes(damage + self.node_boxes(list(moved), self.positions)
+                                     + self.edge_boxes(list(fresh), self.positions))
+            if sum(box.width * box.height for box in damage) <= FULL_REPAINT_AREA * ax.bbox.width * ax.bbox.height:
+                if damage:
+                    self.repaint(damage)
+                profiling.count('renders_partial')
+                return
+
+        self.full_draw(view)
+        profiling.count('renders_full')
+        profiling.count('nodes_drawn', len(self.positions))
+        profiling.count('edges_drawn', len(self.edges))
+
+    def draw_all(self, store, pos):
+        # Draws the whole graph on a clean axes
+        ax = self.ax
+        ax.clear()
+        self.reset()
+        self.store = store
+        self.source = pos
+        if len(store) == 0:
+            ax.figure.canvas.draw()
+            return
+        self.positions = {node: (float(pos[node][0]), float(pos[node][1])) for node in store.nodes()}
+        self.edges = {(a, b): (style, weight) for a, b, weight, style in store.edges()}
+        self.build_artists()
+        if self.edges:
+            ax.dataLim.set_points(self.data_limits())
+            ax.autoscale_view()
+        self.full_draw((tuple(ax.viewLim.bounds), tuple(ax.figure.bbox.bounds)))
+        profiling.count('renders_full')
+        profiling.count('nodes_drawn', len(self.positions))
+        profiling.count('edges_drawn', len(self.edges))
+
+    def build_artists(self):
+        ax = self.ax
+        positions = self.positions
+        nodes = sorted(positions)
+        self.node_rows.assign(nodes, [positions[node] for node in nodes])
+        self.node_collection = nx.draw_networkx_nodes(sketch(nodes), positions, nodelist=nodes,
+                                                      node_color=NODE_COLOR, node_size=NODE_SIZE, ax=ax)
+        self.labels = nx.draw_networkx_labels(sketch(nodes), positions, labels={node: node for node in nodes},
+                                              font_size=FONT_SIZE, font_weight='bold', ax=ax)
+        self.set_zorders(self.labels, self.label_order.assign(nodes))
+
+        keys = sorted(self.edges)
+        self.edge_rows.assign(keys, [self.edge_row(edge) for edge in keys])
+        groups = {}
+        for edge in keys:
+            groups.setdefault(self.edges[edge][0], []).append(edge)
+        lines = groups.pop('line', [])
+        if lines:
+            # networkx adds the self-loops of a line collection as arrows of their own, in the order their nodes
+            # are in the graph, so the loops go in first
+            loops = [edge for edge in lines if edge[0] == edge[1]]
+            self.line_collection = nx.draw_networkx_edges(sketch(edges=loops + lines), positions, edgelist=lines,
+                                                          arrows=False, ax=ax)
+            self.lines = lines
+            if loops:
+                self.arrows.update(zip(loops, ax.patches[-len(loops):]))
+        for style, edgelist in groups.items():
+            patches = nx.draw_networkx_edges(sketch(edges=edgelist), positions, edgelist=edgelist, ax=ax,
+                                             **EDGE_STYLES.get(style, EDGE_STYLES['line']))
+            self.arrows.update(zip(edgelist, patches))
+        self.set_zorders(self.arrows, self.arrow_order.assign(self.arrows))
+
+        weighted = {edge: f"{self.edges[edge][1]}" for edge in keys if self.edges[edge][1] > 0}
+        if weighted:
+            self.edge_labels = nx.draw_networkx_edge_labels(sketch(edges=weighted), positions,
+                                                            edge_labels=weighted, ax=ax)
+            self.longest_weight = max(map(len, weighted.values()))
+            self.set_zorders(self.edge_labels, self.edge_label_order.assign(self.edge_labels))
+        self.loops = {edge for edge in keys if edge[0] == edge[1]}
+        self.loop_extents = self.extents_of_loops()
+        self.loop_reach = self.reach_of_loops()
+
+    def update_artists(self, moved, removed, stale, fresh):
+        # Removes the artists of stale edges and removed nodes, moves or adds those of moved nodes and adds
+        # those of fresh edges, keeping every family in its stacking order
+        ax = self.ax
+        positions = self.positions
+        for edge in stale:
+            style, weight = self.edges.pop(edge)
+            self.edge_rows.remove(edge)
+            arrow = self.arrows.pop(edge, None)
+            if arrow is not None:
+                arrow.remove()
+                self.arrow_order.remove(edge)
+            else:
+                i = bisect_left(self.lines, edge)
+                del self.lines[i]
+                # get_paths() is the collection's own list, so one path is dropped without rebuilding the rest
+                del self.line_collection.get_paths()[i]
+                self.line_collection.stale = True
+            label = self.edge_labels.pop(edge, None)
+            if label is not None:
+                label.remove()
+                self.edge_label_order.remove(edge)
+
+        for node in removed:
+            del positions[node]
+            self.node_rows.remove(node)
+            self.labels.pop(node).remove()
+            self.label_order.remove(node)
+        new_nodes = []
+        for node, xy in moved.items():
+            if node in positions:
+                self.node_rows.set(node, xy)
+                self.labels[node].set_position(xy)
+            else:
+                self.node_rows.insert(node, xy)
+                new_nodes.append(node)
+            positions[node] = xy
+        if moved or removed:
+            self.node_collection.set_offsets(self.node_rows.rows)
+        if new_nodes:
+            labels = nx.draw_networkx_labels(sketch(new_nodes), positions, labels={node: node for node in new_nodes},
+                                             font_size=FONT_SIZE, font_weight='bold', ax=ax)
+            self.add_zorders(self.labels, self.label_order, labels)
+
+        groups = {}
+        for edge, data in fresh.items():
+            self.edges[edge] = data
+            self.edge_rows.insert(edge, self.edge_row(edge))
+            groups.setdefault(data[0], []).append(edge)
+        lines = sorted(groups.pop('line', []))
+        if lines and self.line_collection is None:
+            self.line_collection = nx.draw_networkx_edges(sketch(edges=lines), positions, edgelist=lines,
+                                                          arrows=False, ax=ax)
+            self.lines = lines
+        elif lines:
+            paths = self.line_collection.get_paths()
+            for a, b in lines:
+                i = bisect_left(self.lines, (a, b))
+                self.lines.insert(i, (a, b))
+                paths.insert(i, Path(np.array([positions[a], positions[b]], dtype=float)))
+            self.line_collection.stale = True
+        for style, edgelist in groups.items():
+            patches = nx.draw_networkx_edges(sketch(edges=edgelist), positions, edgelist=edgelist, ax=ax,
+                                             **EDGE_STYLES.get(style, EDGE_STYLES['line']))
+            self.add_zorders(self.arrows, self.arrow_order, dict(zip(edgelist, patches)))
+
+        weighted = {edge: f"{data[1]}" for edge, data in fresh.items() if data[1] > 0}
+        if weighted:
+            labels = nx.draw_networkx_edge_labels(sketch(edges=weighted), positions, edge_labels=weighted, ax=ax)
+            self.longest_weight = max(self.longest_weight, *map(len, weighted.values()))
+            self.add_zorders(self.edge_labels, self.edge_label_order, labels)
+
+    @staticmethod
+    def set_zorders(artists, zorders):
+        for key, artist in artists.items():
+            artist.set_zorder(zorders[key])
+
+    def add_zorders(self, artists, order, new):
+        # Adds new artists to a family, giving each its place in the family's stacking order
+        artists.update(new)
+        spaced = True
+        for key, artist in new.items():
+            zorder = order.add(key)
+            if zorder is None:
+                spaced = False
+            else:
+                artist.set_zorder(zorder)
+        if not spaced:
+            self.set_zorders(artists, order.assign(order.keys))
+
+    def edge_row(self, edge):
+        style, weight = self.edges[edge]
+        (x0, y0), (x1, y1) = self.positions[edge[0]], self.positions[edge[1]]
+        return x0, y0, x1, y1, STYLE_CODES.get(style, 0), weight
+
+    def extents_of_loops(self):
+        # What networkx sized the self-loops by: the vertical extent of the edges drawn in the same call, i.e.
+        # of each style's edges, and of the weighted edges for the loops' weight labels
+        if not self.loops:
+            return None
+        rows = self.edge_rows.rows
+        ys = rows[:, [1, 3]]
+        extents = []
+        for code in sorted({STYLE_CODES.get(self.edges[loop][0], 0) for loop in self.loops}):
+            group = ys[rows[:, 4] == code]
+            extents.append((code, group.min(), group.max()))
+        if any(self.edges[loop][1] > 0 for loop in self.loops):
+            group = ys[rows[:, 5] > 0]
+            extents.append(('weights', group.min(), group.max()))
+        return extents
+
+    def reach_of_loops(self):
+        # A self-loop rises above its node by a tenth of the height it was sized by, or of a fixed height if
+        # that was zero; the phantom loop its weight label sits on is sized by the weighted edges' extent
+        heights = {key: high - low or 0.005 * NODE_SIZE for key, low, high in self.loop_extents or ()}
+        reach = {}
+        for loop in self.loops:
+            style, weight = self.edges[loop]
+            height = heights[STYLE_CODES.get(style, 0)]
+            if weight > 0:
+                height = max(height, heights['weights'])
+            reach[loop] = 0.1 * height
+        return reach
+
+    @staticmethod
+    def padded_extents(rows):
+        # (low, high) corners of each edge row's segment, padded by 5% of its extent as networkx pads the view
+        ends = rows[:, :4].reshape(-1, 2, 2)
+        low = ends.min(axis=1)
+        high = ends.max(axis=1)
+        pad = (high - low) * 0.05
+        return low - pad, high + pad
+
+    def data_limits(self):
+        # networkx pads the data limits by 5% of the extent of each call's edges. Drawn one edge per call,
+        # that is a small pad around every edge; those are the limits, so grouping edges does not rescale the view
+        low, high = self.padded_extents(self.edge_rows.rows)
+        points = self.node_rows.rows
+        return np.array([np.minimum(low.min(axis=0), points.min(axis=0)),
+                         np.maximum(high.max(axis=0), points.max(axis=0))])
+
+    def update_limits(self, limits, shrunk, shrunk_rows, grown, grown_rows):
+        # Sets the data limits after an edit from the previous ones. Nodes and edges that were removed or
+        # moved only matter if they reached the limits, and then the limits are worked out from every row.
+        ax = self.ax
+        if not self.edges:
+            return
+        low, high = self.padded_extents(shrunk_rows)
+        points = np.array(shrunk, dtype=float).reshape(-1, 2)
+        if ((low <= limits[0]).any() or (high >= limits[1]).any()
+                or (points <= limits[0]).any() or (points >= limits[1]).any()):
+            updated = self.data_limits()
+        else:
+            low, high = self.padded_extents(grown_rows)
+            points = np.array(grown, dtype=float).reshape(-1, 2)
+            updated = np.array([np.minimum.reduce([limits[0], *low, *points]),
+                                np.maximum.reduce([limits[1], *high, *points])])
+        ax.dataLim.set_points(updated)
+        if not np.array_equal(updated, limits):
+            ax.autoscale_view()
+
+    def artists(self):
+        artists = list(self.labels.values()) + list(self.arrows.values()) + list(self.edge_labels.values())
+        for collection in (self.node_collection, self.line_collection):
+            if collection is not None:
+                artists.append(collection)
+        return artists
+
+    def full_draw(self, view):
+        canvas = self.ax.figure.canvas
+        if canvas.supports_blit:
+            # The spines are left out of the background too: repaint draws them over the graph, and drawing
+            # them over a copy of themselves would darken their antialiased edges
+            artists = self.artists() + list(self.ax.spines.values())
+            for artist in artists:
+                artist.set_visible(False)
+            canvas.draw()
+            self.background = canvas.copy_from_bbox(self.ax.bbox)
+            for artist in artists:
+                artist.set_visible(True)
+        canvas.draw()
+        canvas.flush_events()
+        self.view = view
+
+    def points(self, value):
+        return value * self.ax.figure.dpi / 72
+
+    def label_pad(self, characters):
+        # Reach of a weight label of so many characters from its middle, whichever way it is turned
+        return self.points(0.35 * EDGE_FONT_SIZE * characters + 8)
+
+    def node_boxes(self, nodes, positions):
+        # Display boxes around node markers and their labels
+        if not nodes:
+            return []
+        centres = self.ax.transData.transform([positions[node] for node in nodes])
+        radius = self.points(math.sqrt(NODE_SIZE) / 2 + 2)
+        boxes = []
+        for node, (x, y) in zip(nodes, centres.tolist()):
+            # Bold labels are at most about 0.7em per character wide
+            half_width = max(radius, self.points(0.35 * FONT_SIZE * len(str(node)) + 2))
+            boxes.append(Bbox.from_extents(x - half_width, y - radius, x + half_width, y + radius))
+        return boxes
+
+    def edge_boxes(self, edges, positions):
+        # Display boxes along edge segments, padded for arrow heads, and around weight labels
+        if not edges:
+            return []
+        ends = self.ax.transData.transform([positions[node] for edge in edges for node in edge]).reshape(-1, 2, 2)
+        pad = self.points(EDGE_PAD_POINTS)
+        boxes = []
+        for edge, ((x0, y0), (x1, y1)) in zip(edges, ends.tolist()):
+            weight = self.edges[edge][1]
+            if weight > 0:
+                label_pad = self.label_pad(len(f"{weight}"))
+                x, y = (x0 + x1) / 2, (y0 + y1) / 2
+                boxes.append(Bbox.from_extents(x - label_pad, y - label_pad, x + label_pad, y + label_pad))
+            tiles = max(1, math.ceil(math.hypot(x1 - x0, y1 - y0) / (TILE_PADS * pad)))
+            for i in range(tiles):
+                ax0 = x0 + (x1 - x0) * i / tiles
+                ay0 = y0 + (y1 - y0) * i / tiles
+                ax1 = x0 + (x1 - x0) * (i + 1) / tiles
+                ay1 = y0 + (y1 - y0) * (i + 1) / tiles
+                boxes.append(Bbox.from_extents(min(ax0, ax1) - pad, min(ay0, ay1) - pad,
+                                               max(ax0, ax1) + pad, max(ay0, ay1) + pad))
+        return boxes
+
+    def clip_boxes(self, boxes):
+        # Disjoint whole-pixel boxes inside the axes covering the given ones; overlapping boxes are merged
+        clipped = []
+        for box in boxes:
+            box = Bbox.intersection(box, self.ax.bbox)
+            if box is not None and box.width > 0 and box.height > 0:
+                clipped.append(Bbox.from_extents(math.floor(box.x0), math.floor(box.y0),
+                                                 math.ceil(box.x1), math.ceil(box.y1)))
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(clipped)):
+                for j in range(i + 1, len(clipped)):
+                    a, b = clipped[i], clipped[j]
+                    if a.x0 < b.x1 and b.x0 < a.x1 and a.y0 < b.y1 and b.y0 < a.y1:
+                        clipped[i] = Bbox.union([a, b])
+                        del clipped[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return clipped
+
+    def repaint(self, boxes):
+        ax = self.ax
+        canvas = ax.figure.canvas
+        extents = np.array([box.extents for box in boxes])  # (boxes, 4): x0, y0, x1, y1
+        height = int(ax.figure.bbox.height)
+        for x0, y0, x1, y1 in extents.astype(int).tolist():
+            # The saved region's sub-box is given in buffer pixels, top row first, inclusive of both ends
+            canvas.restore_region(self.background, bbox=(x0, height - y1, x1 - 1, height - y0 - 1),
+                                  xy=self.background.get_extents()[:2])
+
+        # Only the nodes and edges near the boxes are drawn, collections included. Texts are drawn into the
+        # boxes they are near only, so each hit test is kept per box: (elements, boxes).
+        nodes = self.node_rows
+        centres = ax.transData.transform(nodes.rows)
+        node_pad = max(self.points(math.sqrt(NODE_SIZE) / 2 + 2),
+                       self.points(0.35 * FONT_SIZE * max(map(len, map(str, nodes.keys))) + 2))
+        near = points_near_boxes(centres, extents, node_pad)
+        rows = self.edge_rows.rows
+        ends = ax.transData.transform(rows[:, :4].reshape(-1, 2)).reshape(-1, 2, 2)
+        pad = self.points(EDGE_PAD_POINTS)
+        crossing = segments_near_boxes(ends, extents, pad)
+        # A weight label sits at the middle of its edge
+        labelled = points_near_boxes(ends.mean(axis=1), extents, self.label_pad(self.longest_weight))
+        labelled &= (rows[:, 5] > 0)[:, None]
+        for loop, reach in self.loop_reach.items():
+            # A self-loop's segment is a point; the loop and its label rise above the node, half as wide
+            x, y = self.positions[loop[0]]
+            (x0, y0), (x1, y1) = ax.transData.transform([(x - reach / 2, y), (x + reach / 2, y + reach)])
+            hit = ((extents[:, 0] < max(x0, x1) + pad) & (extents[:, 2] > min(x0, x1) - pad)
+                   & (extents[:, 1] < max(y0, y1) + pad) & (extents[:, 3] > min(y0, y1) - pad))
+            i = self.edge_rows.index(loop)
+            crossing[i] |= hit
+            labelled[i] |= hit & (rows[i, 5] > 0)
+        near_any = near.any(axis=1)
+        crossing_any = crossing.any(axis=1)
+
+        # (artist, indices of the boxes it is drawn into, or None for once under the clip path)
+        artists = [(self.labels[nodes.keys[i]], np.flatnonzero(near[i]).tolist())
+                   for i in np.flatnonzero(near_any).tolist()]
+        lines = []
+        for i in np.flatnonzero(crossing_any).tolist():
+            edge = self.edge_rows.keys[i]
+            arrow = self.arrows.get(edge)
+            if arrow is not None:
+                artists.append((arrow, None))
+            else:
+                lines.append(bisect_left(self.lines, edge))
+        for i in np.flatnonzero(labelled.any(axis=1)).tolist():
+            artists.append((self.edge_labels[self.edge_rows.keys[i]], np.flatnonzero(labelled[i]).tolist()))
+        self.node_collection.set_offsets(nodes.rows[near_any])
+        artists.append((self.node_collection, None))
+        if self.line_collection is not None:
+            paths = self.line_collection.get_paths()
+            every = paths[:]
+            paths[:] = [every[i] for i in sorted(lines)]
+            artists.append((self.line_collection, None))
+        # The spines run along the edges of the axes, which only some boxes reach
+        bounds = ax.bbox.extents
+        bordering = np.flatnonzero((extents[:, :2] <= bounds[:2] + 2).any(axis=1)
+                                    | (extents[:, 2:] >= bounds[2:] - 2).any(axis=1)).tolist()
+        if bordering:
+            artists.extend((spine, bordering) for spine in ax.spines.values())
+        # Each family has zorders of its own, so the zorder alone gives the stacking of a full draw
+        artists.sort(key=lambda item: item[0].get_zorder())
+
+        # Shapes are drawn once, clipped to the union of the boxes as a full draw clips them to the axes patch,
+        # so they are antialiased the same way. Agg clips text to rectangles only, and the spines, which nothing
+        # clips in a full draw, come out as drawn only under a rectangle too, so those are drawn once per box;
+        # the boxes are disjoint, so no pixel is drawn twice.
+        vertices = []
+        for x0, y0, x1, y1 in extents.tolist():
+            vertices += [(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)]
+        clip = Path(vertices, [Path.MOVETO, Path.LINETO, Path.LINETO, Path.LINETO, Path.CLOSEPOLY] * len(boxes))
+        self.clip = clip
+        renderer = canvas.get_renderer()
+        for artist, indices in artists:
+            clip_box = artist.get_clip_box()
+            clip_path = artist.get_clip_path()
+            clip_on = artist.get_clip_on()
+            artist.set_clip_on(True)
+            if indices is None:
+                artist.set_clip_path(clip, IdentityTransform())
+                ax.draw_artist(artist)
+            else:
+                patch = None
+                if isinstance(artist, Text):
+                    artist.set_clip_path(clip, IdentityTransform())
+                    patch = artist.get_bbox_patch()
+                else:
+                    artist.set_clip_path(None)
+                if patch is not None:
+                    # A weight label's box is a shape, which a rectangle would clip a shade differently at the
+                    # box's edges: it is drawn first under the clip path, with the text made transparent
+                    color = artist.get_color()
+                    artist.set_color('none')
+                    ax.draw_artist(artist)
+                    artist.set_color(color)
+                    patch.set_visible(False)
+                for i in indices:
+                    artist.set_clip_box(boxes[i])
+                    if patch is not None:
+                        # Placed by the pass above, which networkx's draw would work out again
+                        Text.draw(artist, renderer)
+                    else:
+                        ax.draw_artist(artist)
+                if patch is not None:
+                    patch.set_visible(True)
+            artist.set_clip_box(clip_box)
+            artist.set_clip_path(clip_path)
+            artist.set_clip_on(clip_on)
+        self.node_collection.set_offsets(nodes.rows)
+        if self.line_collection is not None:
+            paths[:] = every
+        profiling.count('nodes_drawn', int(near_any.sum()))
+        profiling.count('edges_drawn', int(crossing_any.sum()))
+
+        # Only the damaged region goes to the screen, not the whole axes
+        canvas.blit(Bbox.union(boxes))
+        canvas.flush_events()
+
+
+def points_near_boxes(points, extents, pad):
+    # For (points, 2) display coordinates: whether each point is within pad of each box, as (points, boxes)
+    return ((points[:, None, 0] > extents[None, :, 0] - pad) & (points[:, None, 0] < extents[None, :, 2] + pad)
+            & (points[:, None, 1] > extents[None, :, 1] - pad) & (points[:, None, 1] < extents[None, :, 3] + pad))
+
+
+def segments_near_boxes(ends, extents, pad):
+    # For (segments, 2, 2) display coordinates: whether each segment passes within pad of each box, as
+    # (segments, boxes)
+    if len(ends) == 0 or len(extents) == 0:
+        return np.zeros((len(ends), len(extents)), dtype=bool)
+    p = ends[:, None, 0, :]
+    q = ends[:, None, 1, :]
+    low = extents[None, :, :2] - pad
+    high = extents[None, :, 2:] + pad
+    overlap = ((np.minimum(p, q) < high) & (np.maximum(p, q) > low)).all(axis=2)
+    # The segment's line must also separate the padded box's corners, or miss it entirely
+    direction = q - p
+    corners = [(low[..., 0], low[..., 1]), (low[..., 0], high[..., 1]),
+               (high[..., 0], low[..., 1]), (high[..., 0], high[..., 1])]
+    sides = np.stack([direction[..., 0] * (y - p[..., 1]) - direction[..., 1] * (x - p[..., 0])
+                      for x, y in corners])
+    straddle = (sides.min(axis=0) <= 0) & (sides.max(axis=0) >= 0)
+    return overlap & straddle
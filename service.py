@@ -0,0 +1,318 @@
+import argparse
+import hashlib
+import http.client
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from urllib.parse import parse_qs, urlsplit
+from headless import new_graph
+from interpreter import Interpreter
+from lexer import Lexer
+from nodes import ZERO, Connection, intern_name, intern_number
+from parser_ import Parser
+
+MODES = ('default', 'bipartite', 'tree')
+CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+# Rendered images kept, by total size
+CACHE_BYTES = 256 * 1024 * 1024
+# Script texts remembered with the digest of their edge set, so a repeated script is not even parsed
+ALIASES = 4096
+# Largest script accepted
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# Syntax errors returned with a rejected script at most
+MAX_ERRORS = 100
+
+
+class LRUCache:
+    # Least recently used entries are evicted once the total size of the values exceeds capacity
+    def __init__(self, capacity, size=len):
+        self.capacity = capacity
+        self.size = size
+        self.entries = OrderedDict()
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total -= self.size(old)
+            self.entries[key] = value
+            self.total += self.size(value)
+            while self.total > self.capacity and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.total -= self.size(evicted)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "size": self.total, "hits": self.hits, "misses": self.misses}
+
+
+class ScriptError(Exception):
+    # A script with syntax errors; carries its diagnostics
+    def __init__(self, diagnostics):
+        super().__init__(str(diagnostics[0]))
+        self.diagnostics = diagnostics
+
+
+def canonical_edges(text):
+    # The edge set a script leaves behind, normalised so that equivalent scripts give the same list: each
+    # pair of names is written in sorted order with its arrow turned to match, and the list is sorted.
+    # Start/final markers are not drawn, so they are left out.
+    diagnostics = []
+    tokens = Lexer(text, positions=False, diagnostics=diagnostics).generate_tokens()
+    connections = Interpreter.clear_tree(Parser(tokens, diagnostics).parse_document())
+    if diagnostics:
+        raise ScriptError(diagnostics)
+    edges = []
+    for connection in connections:
+        a = connection.name_a.value
+        b = connection.name_b.value
+        left = connection.left_dir
+        right = connection.right_dir
+        if b < a:
+            a, b, left, right = b, a, right, left
+        edges.append((a, b, float(connection.weight.value), left, right))
+    edges.sort()
+    return edges
+
+
+def edge_digest(edges, mode):
+    return hashlib.sha256(json.dumps([mode, edges], separators=(',', ':')).encode()).hexdigest()
+
+
+def render_edges(edges, mode, fmt):
+    # Runs in a worker process: draws a canonical edge list into a fresh off-screen graph
+    graph = new_graph(mode)
+    with graph.batch(draw=False):
+        for a, b, weight, left, right in edges:
+            graph.add_connection(Connection(intern_name(a), intern_name(b), intern_number(weight) if weight else ZERO,
+                                            False, left, right))
+    graph.draw()
+    buffer = io.BytesIO()
+    graph.fig.savefig(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def warm_up():
+    # Pool initializer: the first drawing pays for font loading and the like, not the first request
+    render_edges([('a', 'b', 1.0, False, True)], 'default', 'png')
+
+
+def ready():
+    return os.getpid()
+
+
+class RenderService:
+    # DSL text -> PNG/SVG. Rendering runs in a pool of warm worker processes, so Matplotlib and networkx are
+    # imported once per worker. Images are cached by the digest of the canonical edge set and layout mode,
+    # so a repeated or equivalent script is answered from memory, and concurrent requests for the same image
+    # share one render.
+    def __init__(self, jobs=None, cache_bytes=CACHE_BYTES):
+        self.jobs = jobs or os.cpu_count() or 1
+        # Spawned rather than forked, as the server is multi-threaded by the time workers are started
+        self.pool = ProcessPoolExecutor(max_workers=self.jobs, mp_context=get_context('spawn'), initializer=warm_up)
+        self.images = LRUCache(cache_bytes)
+        self.aliases = LRUCache(ALIASES, size=lambda digest: 1)
+        self.pending = {}  # (digest, format) -> Future of a render in progress
+        self.lock = threading.Lock()
+
+    def start(self):
+        # Starts every worker up front; each submission finding no idle worker starts another one
+        return set(future.result() for future in [self.pool.submit(ready) for _ in range(self.jobs)])
+
+    def close(self):
+        self.pool.shutdown()
+
+    def render(self, text, mode='default', fmt='png'):
+        # (digest, image, whether it came from the cache); raises ScriptError for invalid scripts
+        script = hashlib.sha256(f"{mode}\n".encode() + text.encode()).hexdigest()
+        digest = self.aliases.get(script)
+        if digest is not None:
+            image = self.images.get((digest, fmt))
+            if image is not None:
+                return digest, image, True
+
+        edges = canonical_edges(text)
+        digest = edge_digest(edges, mode)
+        self.aliases.put(script, digest)
+        key = (digest, fmt)
+        image = self.images.get(key)
+        if image is not None:
+            return digest, image, True
+
+        with self.lock:
+            future = self.pending.get(key)
+            if future is None:
+                future = self.pending[key] = self.pool.submit(render_edges, edges, mode, fmt)
+                future.add_done_callback(lambda done: self.finished(key, done))
+        return digest, future.result(), False
+
+    def finished(self, key, future):
+        with self.lock:
+            self.pending.pop(key, None)
+        if future.exception() is None:
+            self.images.put(key, future.result())
+
+    def stats(self):
+        return {"workers": self.jobs, "images": self.images.stats(), "aliases": self.aliases.stats(),
+                "rendering": len(self.pending)}
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    # POST /render?mode=default&format=png with the script as the body; GET /stats for the cache counters.
+    # Images carry their digest as ETag, so clients can revalidate with If-None-Match.
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if urlsplit(self.path).path == '/stats':
+            self.reply(200, 'application/json', json.dumps(self.server.service.stats()).encode())
+        else:
+            self.reply(404, 'text/plain', b"Not found\n")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/render':
+            self.reply(404, 'text/plain', b"Not found\n")
+            return
+        query = parse_qs(url.query)
+        mode = query.get('mode', ['default'])[0]
+        fmt = query.get('format', ['png'])[0]
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            # Without a usable length the body cannot be told apart from the next request
+            self.reply(400, 'text/plain', b"Content-Length must be a non-negative integer\n")
+            self.close_connection = True
+            return
+        if mode not in MODES or fmt not in CONTENT_TYPES:
+            self.reply(400, 'text/plain', f"mode must be one of {MODES}, format one of {tuple(CONTENT_TYPES)}\n".encode())
+            return
+        if length > MAX_BODY_BYTES:
+            self.reply(413, 'text/plain', b"Script too large\n")
+            self.close_connection = True
+            return
+
+        text = self.rfile.read(length).decode('utf-8', errors='replace')
+        try:
+            digest, image, hit = self.server.service.render(text, mode, fmt)
+        except ScriptError as e:
+            errors = [str(diagnostic) for diagnostic in e.diagnostics[:MAX_ERRORS]]
+            self.reply(400, 'application/json', json.dumps({"errors": errors, "count": len(e.diagnostics)}).encode())
+            return
+        except Exception as e:
+            self.reply(500, 'text/plain', f"{type(e).__name__}: {e}\n".encode())
+            return
+
+        if self.headers.get('If-None-Match') == f'"{digest}"':
+            self.reply(304, None, b"", digest, hit)
+        else:
+            self.reply(200, CONTENT_TYPES[fmt], image, digest, hit)
+
+    def reply(self, status, content_type, body, digest=None, hit=None):
+        self.send_response(status)
+        if content_type is not None:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if digest is not None:
+            self.send_header('ETag', f'"{digest}"')
+            self.send_header('X-Cache', 'hit' if hit else 'miss')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class RenderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, verbose=False):
+        super().__init__(address, RenderHandler)
+        self.service = service
+        self.verbose = verbose
+
+
+if hasattr(socket, 'AF_UNIX'):
+    # Not every platform has Unix sockets; there the service listens on TCP only
+    class UnixRenderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, path, service, verbose=False):
+            if os.path.exists(path):
+                os.unlink(path)
+            super().__init__(path, RenderHandler)
+            self.service = service
+            self.verbose = verbose
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    # http.client over a Unix socket, for clients of UnixRenderServer
+    def __init__(self, path, timeout=60):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local DSL -> PNG/SVG render service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=8765)
+    if hasattr(socket, 'AF_UNIX'):
+        parser.add_argument('--unix', metavar='PATH', help="listen on a Unix socket instead of TCP")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="render processes (default: CPU count)")
+    parser.add_argument('--cache-mb', type=float, default=CACHE_BYTES / 1024 / 1024)
+    parser.add_argument('-v', '--verbose', action='store_true', help="log every request")
+    args = parser.parse_args(argv)
+
+    service = RenderService(args.jobs, int(args.cache_mb * 1024 * 1024))
+    service.start()
+    if getattr(args, 'unix', None):
+        server = UnixRenderServer(args.unix, service, args.verbose)
+        print(f"Rendering on {args.unix} with {service.jobs} workers")
+    else:
+        server = RenderServer((args.host, args.port), service, args.verbose)
+        print(f"Rendering on http://{args.host}:{server.server_port} with {service.jobs} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import json
+import mmap
+import struct
+import numpy as np
+from nodes import intern_name
+
+# Compiled graph snapshot (.dslg): a fixed header, a JSON manifest and 8-byte aligned binary sections.
+# The sections are read straight out of a memory map, so reopening a graph skips lexing, parsing and layout.
+#
+#   header     magic b'DSLG', format version (u32), manifest length (u64)
+#   manifest   JSON: node/edge counts, saved layout modes, and {section: [offset, length, dtype]}
+#   sections   name_offsets  u64 (nodes + 1)   byte offsets of each name in `names`
+#              names         u8                UTF-8 node names, concatenated
+#              node_flags    u8 (nodes)        bit 0 final, bit 1 start
+#              src, dst      u32 (edges)       edge endpoints as node indices
+#              weight        f64 (edges)
+#              style         u8 (edges)        index into store.STYLES (bit 0 left arrow, bit 1 right arrow)
+#              layout.<mode> f64 (nodes x 2)   cached positions for each saved layout mode
+#              text          u8                UTF-8 source text
+MAGIC = b'DSLG'
+VERSION = 1
+HEADER = struct.Struct('<4sIQ')
+ALIGNMENT = 8
+EXTENSION = '.dslg'
+
+FINAL = 0x01
+START = 0x02
+
+
+def node_flags(nodes, markers):
+    # Start/final markers per node, taken from the marked edges of the graph (Graph.markers)
+    flags = np.zeros(len(nodes), dtype=np.uint8)
+    if markers:
+        index = {node: i for i, node in enumerate(nodes)}
+        for names in markers.values():
+            for name in names:
+                flags[index[name.value]] |= (FINAL if name.final else 0) | (START if name.start else 0)
+    return flags
+
+
+def edge_markers(nodes, src, dst, flags):
+    # Graph.markers for a loaded edge table: every edge touching a start or final node marks that end
+    touched = np.flatnonzero(flags[src] | flags[dst])
+    flags = flags.tolist()
+    markers = {}
+    for a, b in zip(src[touched].tolist(), dst[touched].tolist()):
+        markers[nodes[a], nodes[b]] = (intern_name(nodes[a], bool(flags[a] & FINAL), bool(flags[a] & START)),
+                                       intern_name(nodes[b], bool(flags[b] & FINAL), bool(flags[b] & START)))
+    return markers
+
+
+def save_snapshot(path, graph, text=None):
+    # Writes the graph, its up-to-date cached layouts and optionally the source text to `path`
+    with graph.lock:
+        nodes, src, dst, weights, styles = graph.store.edge_table()
+        flags = node_flags(nodes, graph.markers)
+        layouts = {mode: pos for mode, pos in graph.layouts.items()
+                   if graph.layout_versions.get(mode) == graph.version and pos}
+        layouts = {mode: np.array([pos[node] for node in nodes], dtype=np.float64).reshape(-1, 2)
+                   for mode, pos in layouts.items()}
+        mode = graph.mode
+
+    encoded = [node.encode('utf-8') for node in nodes]
+    name_offsets = np.zeros(len(nodes) + 1, dtype=np.uint64)
+    np.cumsum([len(name) for name in encoded], out=name_offsets[1:])
+
+    sections = {
+        'name_offsets': name_offsets,
+        'names': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'node_flags': flags,
+        'src': np.asarray(src, dtype=np.uint32),
+        'dst': np.asarray(dst, dtype=np.uint32),
+        'weight': np.asarray(weights, dtype=np.float64),
+        'style': np.asarray(styles, dtype=np.uint8),
+    }
+    for layout_mode, coords in layouts.items():
+        sections[f'layout.{layout_mode}'] = coords
+    if text is not None:
+        sections['text'] = np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+
+    # Offsets are relative to the end of the manifest, so the manifest can describe its own sections
+    table = {}
+    offset = 0
+    for name, data in sections.items():
+        offset += -offset % ALIGNMENT
+        table[name] = [offset, data.size, data.dtype.str]
+        offset += data.nbytes
+    manifest = json.dumps({
+        'nodes': len(nodes),
+        'edges': len(src),
+        'mode': mode,
+        'layouts': sorted(layouts),
+        'sections': table,
+    }).encode('utf-8')
+    manifest += b' ' * (-(HEADER.size + len(manifest)) % ALIGNMENT)
+
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(manifest)))
+        file.write(manifest)
+        position = 0
+        for name, data in sections.items():
+            start = table[name][0]
+            file.write(b'\0' * (start - position))
+            file.write(data.tobytes())
+            position = start + data.nbytes
+
+
+class Snapshot:
+    # A memory-mapped .dslg file; sections are zero-copy NumPy views into the map
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, manifest_length = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a graph snapshot")
+        if version != VERSION:
+            raise ValueError(f"Unsupported snapshot version {version} in {path}")
+        self.manifest = json.loads(bytes(self.map[HEADER.size:HEADER.size + manifest_length]))
+        self.base = HEADER.size + manifest_length
+
+    def section(self, name):
+        offset, count, dtype = self.manifest['sections'][name]
+        return np.frombuffer(self.map, dtype=np.dtype(dtype), count=count, offset=self.base + offset)
+
+    @property
+    def mode(self):
+        return self.manifest['mode']
+
+    @property
+    def layout_modes(self):
+        return self.manifest['layouts']
+
+    def nodes(self):
+        names = bytes(self.section('names'))
+        offsets = self.section('name_offsets').tolist()
+        return [names[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+
+    def node_flags(self):
+        return self.section('node_flags')
+
+    def layout(self, mode):
+        # Positions of `mode` as an (nodes x 2) array, or None if the snapshot has none for that mode
+        if mode not in self.manifest['layouts']:
+            return None
+        return self.section(f'layout.{mode}').reshape(-1, 2)
+
+    def text(self):
+        if 'text' not in self.manifest['sections']:
+            return None
+        return bytes(self.section('text')).decode('utf-8')
+
+    def close(self):
+        # Unmaps the file, which also releases the handle the map holds (the file object itself is closed once
+        # mapped). Section views must have been copied or released by then; mmap raises BufferError otherwise.
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_snapshot(path, graph):
+    # Replaces the graph's contents with the snapshot and primes its layout caches; returns the Snapshot, which
+    # the caller closes. Everything kept from it is copied out of the map.
+    snapshot = Snapshot(path)
+    nodes = snapshot.nodes()
+    with graph.lock:
+        src = snapshot.section('src').astype(np.int64)
+        dst = snapshot.section('dst').astype(np.int64)
+        graph.store.load(nodes, src, dst, snapshot.section('weight'), snapshot.section('style'))
+        graph.markers = edge_markers(nodes, src, dst, snapshot.node_flags())
+        graph.reset_indexes()
+        graph.version += 1
+        graph.layouts.clear()
+        graph.layout_versions.clear()
+        for mode in snapshot.layout_modes:
+            graph.layouts[mode] = dict(zip(nodes, snapshot.layout(mode).tolist()))
+            graph.layout_versions[mode] = graph.version
+    return snapshot
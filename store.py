@@ -0,0 +1,446 @@
+from array import array
+import networkx as nx
+import numpy as np
+
+# Edge styles packed into the low bits of an edge's flag byte: bit 0 = left arrow, bit 1 = right arrow
+STYLES = ('line', 'left_arrow', 'right_arrow', 'double_arrow')
+STYLE_CODES = {style: code for code, style in enumerate(STYLES)}
+DIRECTION_MASK = 0x03
+ALIVE = 0x80
+
+EMPTY = -1
+DELETED = -2
+# Multiplicative hash of a packed edge key, taken modulo 2**64 so NumPy can compute the same probe start
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+HASH_BITS = (1 << 64) - 1
+# Nodes and edges a ChangeSet lists at most before it only records that everything changed
+CHANGE_LIMIT = 4096
+
+
+class ChangeSet:
+    # The nodes and edges a store added, removed or modified since the renderer last took them, so a render
+    # only diffs those (see Renderer.render). A bulk load, or more changes than CHANGE_LIMIT, only sets
+    # everything rather than keeping a second copy of the graph. node_version counts node additions and
+    # removals, so a layout can tell that its node set is unchanged.
+    def __init__(self):
+        self.nodes = set()
+        self.edges = set()
+        self.everything = True  # nothing of a new store has been drawn yet
+        self.node_version = 0
+
+    def node(self, node):
+        self.node_version += 1
+        if not self.everything:
+            self.nodes.add(node)
+            if len(self.nodes) + len(self.edges) > CHANGE_LIMIT:
+                self.reset()
+
+    def edge(self, a, b):
+        if not self.everything:
+            self.edges.add((a, b))
+            if len(self.nodes) + len(self.edges) > CHANGE_LIMIT:
+                self.reset()
+
+    def reset(self):
+        # Anything may have changed
+        self.node_version += 1
+        self.nodes = set()
+        self.edges = set()
+        self.everything = True
+
+    def take(self):
+        # (nodes, edges) changed since the last call, or None if anything may have; starts a new change set
+        changed = None if self.everything else (self.nodes, self.edges)
+        self.nodes = set()
+        self.edges = set()
+        self.everything = False
+        return changed
+
+
+class EdgeIndex:
+    # Open-addressing hash table from packed (source id, target id) keys to edge slots, kept in two flat
+    # arrays instead of a dict so an edge costs a few machine words rather than a boxed int and a dict entry
+    def __init__(self, capacity=64):
+        self.keys = array('q', [EMPTY]) * capacity
+        self.slots = array('i', [0]) * capacity
+        self.mask = capacity - 1
+        self.count = 0
+        self.used = 0
+
+    def __len__(self):
+        return self.count
+
+    def _probe(self, key):
+        # Index of the key, or of the first free position on its probe sequence if the key is absent
+        keys = self.keys
+        i = ((key * HASH_MULTIPLIER) & HASH_BITS) >> 17 & self.mask
+        free = -1
+        while True:
+            found = keys[i]
+            if found == key:
+                return i
+            if found == EMPTY:
+                return i if free < 0 else free
+            if found == DELETED and free < 0:
+                free = i
+            i = (i + 1) & self.mask
+
+    def get(self, key):
+        i = self._probe(key)
+        return self.slots[i] if self.keys[i] == key else None
+
+    def __contains__(self, key):
+        return self.keys[self._probe(key)] == key
+
+    def put(self, key, slot):
+        i = self._probe(key)
+        if self.keys[i] != key:
+            if self.keys[i] == EMPTY:
+                self.used += 1
+            self.count += 1
+            self.keys[i] = key
+        self.slots[i] = slot
+        if self.used * 2 > len(self.keys):
+            self._resize(max(64, self.count * 4))
+
+    def pop(self, key):
+        i = self._probe(key)
+        if self.keys[i] != key:
+            raise KeyError(key)
+        self.keys[i] = DELETED
+        self.count -= 1
+        return self.slots[i]
+
+    def values(self):
+        return (slot for key, slot in zip(self.keys, self.slots) if key >= 0)
+
+    @classmethod
+    def from_keys(cls, keys, slots):
+        # Bulk-builds the table from distinct keys with NumPy: every round, each key still waiting tries its
+        # current probe position, the first claimant of an empty position takes it and the rest move on
+        keys = np.asarray(keys, dtype=np.int64)
+        slots = np.asarray(slots, dtype=np.int32)
+        capacity = 64
+        while capacity < 4 * len(keys):
+            capacity *= 2
+        index = cls(capacity)
+        table_keys = np.full(capacity, EMPTY, dtype=np.int64)
+        table_slots = np.zeros(capacity, dtype=np.int32)
+
+        mask = np.uint64(capacity - 1)
+        probe = ((keys.astype(np.uint64) * np.uint64(HASH_MULTIPLIER)) >> np.uint64(17)) & mask
+        probe = probe.astype(np.int64)
+        waiting = np.arange(len(keys))
+        while len(waiting):
+            positions = probe[waiting]
+            free = table_keys[positions] == EMPTY
+            claimed, first = np.unique(positions[free], return_index=True)
+            winners = waiting[free][first]
+            table_keys[claimed] = keys[winners]
+            table_slots[claimed] = slots[winners]
+            placed = np.zeros(len(keys), dtype=bool)
+            placed[winners] = True
+            waiting = waiting[~placed[waiting]]
+            probe[waiting] = (probe[waiting] + 1) & (capacity - 1)
+
+        index.keys = array('q', table_keys.tobytes())
+        index.slots = array('i', table_slots.tobytes())
+        index.count = index.used = len(keys)
+        return index
+
+    def _resize(self, minimum):
+        capacity = 64
+        while capacity < minimum:
+            capacity *= 2
+        items = [(key, slot) for key, slot in zip(self.keys, self.slots) if key >= 0]
+        self.keys = array('q', [EMPTY]) * capacity
+        self.slots = array('i', [0]) * capacity
+        self.mask = capacity - 1
+        self.count = 0
+        self.used = 0
+        for key, slot in items:
+            self.put(key, slot)
+
+
+class NetworkxStore:
+    # The original storage: a networkx.DiGraph with per-edge attribute dicts
+    def __init__(self):
+        self.G = nx.DiGraph()
+        self.changes = ChangeSet()
+
+    def __len__(self):
+        return len(self.G)
+
+    def __contains__(self, node):
+        return node in self.G
+
+    def nodes(self):
+        return iter(self.G)
+
+    def number_of_edges(self):
+        return self.G.number_of_edges()
+
+    def edges(self):
+        # Yields (a, b, weight, style)
+        for a, b, data in self.G.edges(data=True):
+            yield a, b, data['weight'], data.get('style', 'line')
+
+    def add_edge(self, a, b, weight, style):
+        for node in (a, b):
+            if node not in self.G:
+                self.changes.node(node)
+        self.G.add_edge(a, b, weight=weight, style=style)
+        self.changes.edge(a, b)
+
+    def has_edge(self, a, b):
+        return self.G.has_edge(a, b)
+
+    def edge(self, a, b):
+        # (weight, style) of the edge a -> b, or None if there is none
+        data = self.G.adj.get(a, {}).get(b)
+        return None if data is None else (data['weight'], data.get('style', 'line'))
+
+    def remove_edge(self, a, b):
+        self.G.remove_edge(a, b)
+        self.changes.edge(a, b)
+
+    def degree(self, node):
+        return self.G.degree(node) if node in self.G else None
+
+    def remove_node(self, node):
+        self.G.remove_node(node)
+        self.changes.node(node)
+
+    def neighbors(self, node):
+        return list(self.G.successors(node)) + list(self.G.predecessors(node))
+
+    def edge_arrays(self):
+        # (nodes, src, dst): edge endpoints as indices into the node list
+        nodes = list(self.G)
+        index = {node: i for i, node in enumerate(nodes)}
+        src = np.fromiter((index[a] for a, b in self.G.edges()), dtype=np.int64, count=self.G.number_of_edges())
+        dst = np.fromiter((index[b] for a, b in self.G.edges()), dtype=np.int64, count=self.G.number_of_edges())
+        return nodes, src, dst
+
+    def edge_table(self):
+        # (nodes, src, dst, weights, style codes) as NumPy arrays, the layout used by snapshot.py
+        nodes, src, dst = self.edge_arrays()
+        weights = np.fromiter((data['weight'] for a, b, data in self.G.edges(data=True)), dtype=np.float64,
+                              count=len(src))
+        styles = np.fromiter((STYLE_CODES.get(data.get('style', 'line'), 0) for a, b, data in self.G.edges(data=True)),
+                             dtype=np.uint8, count=len(src))
+        return nodes, src, dst, weights, styles
+
+    def load(self, nodes, src, dst, weights, styles):
+        # Replaces the contents with the given edge table
+        G = nx.DiGraph()
+        G.add_nodes_from(nodes)
+        G.add_edges_from((nodes[a], nodes[b], {'weight': weight, 'style': STYLES[style]})
+                         for a, b, weight, style in zip(src.tolist(), dst.tolist(), weights.tolist(), styles.tolist()))
+        self.G = G
+        self.changes.reset()
+
+    def to_networkx(self):
+        return self.G
+
+
+class CompactGraphStore:
+    # Interned integer node ids and flat edge tables: source, target, weight and a flag byte holding the
+    # style/direction bits and a liveness bit. Freed node ids and edge slots are reused. The CSR adjacency
+    # and the networkx view are built on demand and dropped on the next mutation.
+    def __init__(self):
+        self.node_ids = {}
+        self.node_names = []
+        self.degrees = array('i')
+        self.free_nodes = []
+
+        self.src = array('i')
+        self.dst = array('i')
+        self.weights = array('d')
+        self.flags = array('B')
+        self.edge_slots = EdgeIndex()
+        self.free_edges = []
+
+        self._csr = None
+        self._networkx = None
+        self.changes = ChangeSet()
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __contains__(self, node):
+        return node in self.node_ids
+
+    def nodes(self):
+        return iter(self.node_ids)
+
+    def number_of_edges(self):
+        return len(self.edge_slots)
+
+    def _invalidate(self):
+        self._csr = None
+        self._networkx = None
+
+    def _key(self, a, b):
+        return (a << 32) | b
+
+    def intern(self, node):
+        node_id = self.node_ids.get(node)
+        if node_id is None:
+            if self.free_nodes:
+                node_id = self.free_nodes.pop()
+                self.node_names[node_id] = node
+                self.degrees[node_id] = 0
+            else:
+                node_id = len(self.node_names)
+                self.node_names.append(node)
+                self.degrees.append(0)
+            self.node_ids[node] = node_id
+            self.changes.node(node)
+        return node_id
+
+    def add_edge(self, a, b, weight, style):
+        ia = self.intern(a)
+        ib = self.intern(b)
+        key = self._key(ia, ib)
+        flags = STYLE_CODES.get(style, 0) | ALIVE
+        slot = self.edge_slots.get(key)
+
+        if slot is None:
+            self.degrees[ia] += 1
+            self.degrees[ib] += 1
+            if self.free_edges:
+                slot = self.free_edges.pop()
+                self.src[slot] = ia
+                self.dst[slot] = ib
+                self.weights[slot] = weight
+                self.flags[slot] = flags
+            else:
+                slot = len(self.src)
+                self.src.append(ia)
+                self.dst.append(ib)
+                self.weights.append(weight)
+                self.flags.append(flags)
+            self.edge_slots.put(key, slot)
+        else:
+            self.weights[slot] = weight
+            self.flags[slot] = flags
+        self.changes.edge(a, b)
+        self._invalidate()
+
+    def has_edge(self, a, b):
+        ia = self.node_ids.get(a)
+        ib = self.node_ids.get(b)
+        return ia is not None and ib is not None and self._key(ia, ib) in self.edge_slots
+
+    def edge(self, a, b):
+        # (weight, style) of the edge a -> b, or None if there is none
+        ia = self.node_ids.get(a)
+        ib = self.node_ids.get(b)
+        slot = None if ia is None or ib is None else self.edge_slots.get(self._key(ia, ib))
+        return None if slot is None else (self.weights[slot], STYLES[self.flags[slot] & DIRECTION_MASK])
+
+    def remove_edge(self, a, b):
+        ia = self.node_ids[a]
+        ib = self.node_ids[b]
+        slot = self.edge_slots.pop(self._key(ia, ib))
+        self.flags[slot] = 0
+        self.free_edges.append(slot)
+        self.degrees[ia] -= 1
+        self.degrees[ib] -= 1
+        self.changes.edge(a, b)
+        self._invalidate()
+
+    def degree(self, node):
+        node_id = self.node_ids.get(node)
+        return None if node_id is None else self.degrees[node_id]
+
+    def remove_node(self, node):
+        # Only isolated nodes are ever removed by Graph, so no edges need to be dropped here
+        node_id = self.node_ids[node]
+        if self.degrees[node_id]:
+            raise ValueError(f"Cannot remove node {node!r} while it still has edges")
+        del self.node_ids[node]
+        self.node_names[node_id] = None
+        self.free_nodes.append(node_id)
+        self.changes.node(node)
+        self._invalidate()
+
+    def live_edges(self):
+        # Slots of the edges currently in the graph, as a NumPy index array
+        flags = np.frombuffer(self.flags, dtype=np.uint8)
+        return np.flatnonzero(flags & ALIVE)
+
+    def edges(self):
+        names = self.node_names
+        for slot in self.edge_slots.values():
+            yield (names[self.src[slot]], names[self.dst[slot]], self.weights[slot],
+                   STYLES[self.flags[slot] & DIRECTION_MASK])
+
+    def csr(self):
+        # Undirected CSR adjacency over node ids: neighbours of id i are indices[indptr[i]:indptr[i + 1]]
+        if self._csr is None:
+            live = self.live_edges()
+            src = np.frombuffer(self.src, dtype=np.int32)[live]
+            dst = np.frombuffer(self.dst, dtype=np.int32)[live]
+            ends = np.concatenate([src, dst])
+            others = np.concatenate([dst, src])
+            order = np.argsort(ends, kind='stable')
+            counts = np.bincount(ends, minlength=len(self.node_names))
+            indptr = np.zeros(len(self.node_names) + 1, dtype=np.int64)
+            np.cumsum(counts, out=indptr[1:])
+            self._csr = (indptr, others[order])
+        return self._csr
+
+    def neighbors(self, node):
+        indptr, indices = self.csr()
+        node_id = self.node_ids[node]
+        names = self.node_names
+        return [names[i] for i in indices[indptr[node_id]:indptr[node_id + 1]].tolist()]
+
+    def edge_arrays(self):
+        # (nodes, src, dst) with ids renumbered densely over the live nodes
+        ids = np.fromiter(self.node_ids.values(), dtype=np.int64, count=len(self.node_ids))
+        dense = np.full(len(self.node_names), -1, dtype=np.int64)
+        dense[ids] = np.arange(len(ids))
+        live = self.live_edges()
+        src = dense[np.frombuffer(self.src, dtype=np.int32)[live]]
+        dst = dense[np.frombuffer(self.dst, dtype=np.int32)[live]]
+        return list(self.node_ids), src, dst
+
+    def edge_table(self):
+        nodes, src, dst = self.edge_arrays()
+        live = self.live_edges()
+        weights = np.frombuffer(self.weights, dtype=np.float64)[live]
+        styles = np.frombuffer(self.flags, dtype=np.uint8)[live] & DIRECTION_MASK
+        return nodes, src, dst, weights, styles
+
+    def load(self, nodes, src, dst, weights, styles):
+        # Replaces the contents with the given edge table without going through add_edge
+        n = len(nodes)
+        self.node_names = list(nodes)
+        self.node_ids = dict(zip(self.node_names, range(n)))
+        degrees = np.bincount(src, minlength=n) + np.bincount(dst, minlength=n)
+        self.degrees = array('i', degrees.astype(np.int32).tobytes())
+        self.free_nodes = []
+
+        src = np.asarray(src, dtype=np.int32)
+        dst = np.asarray(dst, dtype=np.int32)
+        self.src = array('i', src.tobytes())
+        self.dst = array('i', dst.tobytes())
+        self.weights = array('d', np.asarray(weights, dtype=np.float64).tobytes())
+        self.flags = array('B', (np.asarray(styles, dtype=np.uint8) | ALIVE).tobytes())
+        keys = (src.astype(np.int64) << 32) | dst
+        self.edge_slots = EdgeIndex.from_keys(keys, np.arange(len(src), dtype=np.int32))
+        self.free_edges = []
+        self.changes.reset()
+        self._invalidate()
+
+    def to_networkx(self):
+        # Materialised only when a networkx algorithm or drawing function needs it
+        if self._networkx is None:
+            G = nx.DiGraph()
+            G.add_nodes_from(self.node_ids)
+            G.add_edges_from((a, b, {'weight': weight, 'style': style}) for a, b, weight, style in self.edges())
+            self._networkx = G
+        return self._networkx
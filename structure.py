@@ -0,0 +1,132 @@
+class StructureIndex:
+    # Connectivity, cycle and 2-colouring facts about the graph, with edges taken as undirected (a --> b and
+    # b --> a are two edges, so they form a cycle, as nx.is_forest counts them).
+    #
+    # A union-find with parity bits is updated on every insert: an edge joining two components is a spanning
+    # forest edge, and an edge inside one component closes a cycle, an odd one if both ends have the same
+    # colour. Removing a non-forest edge from a bipartite component changes none of that. Any other removal
+    # marks the component dirty; dirty components are re-explored by BFS when a property is next read.
+    def __init__(self):
+        self.adjacency = {}  # node -> {edge key: neighbour}
+        self.edges = 0
+        self.parent = {}
+        self.parity = {}  # node -> colour relative to its parent; 0 for roots
+        self.members = {}  # component root -> nodes in the component
+        self.forest_edges = set()  # keys of the edges that joined two components
+        self.odd = set()  # roots of components with an odd cycle
+        self.dirty = set()  # roots of components to re-explore
+
+    @classmethod
+    def from_store(cls, store):
+        structure = cls()
+        for a, b, weight, style in store.edges():
+            structure.add_edge(a, b)
+        return structure
+
+    def find(self, node):
+        # (component root, colour of node) with path compression
+        path = []
+        root = node
+        while self.parent[root] != root:
+            path.append(root)
+            root = self.parent[root]
+        # Nearest the root first, so each parent already points at the root when its child is relinked
+        for step in reversed(path):
+            parent = self.parent[step]
+            if parent != root:
+                self.parity[step] ^= self.parity[parent]
+                self.parent[step] = root
+        return root, self.parity[node]
+
+    def add_edge(self, a, b):
+        key = (a, b)
+        for node in key:
+            if node not in self.parent:
+                self.parent[node] = node
+                self.parity[node] = 0
+                self.members[node] = [node]
+            self.adjacency.setdefault(node, {})
+        self.adjacency[a][key] = b
+        self.adjacency[b][key] = a
+        self.edges += 1
+
+        root_a, colour_a = self.find(a)
+        root_b, colour_b = self.find(b)
+        if root_a == root_b:
+            if colour_a == colour_b:
+                self.odd.add(root_a)
+            return
+        if len(self.members[root_a]) < len(self.members[root_b]):
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.parity[root_b] = colour_a ^ colour_b ^ 1
+        self.members[root_a].extend(self.members.pop(root_b))
+        self.forest_edges.add(key)
+        for flags in (self.odd, self.dirty):
+            if root_b in flags:
+                flags.discard(root_b)
+                flags.add(root_a)
+
+    def remove_edge(self, a, b):
+        key = (a, b)
+        for node in key:
+            self.adjacency[node].pop(key, None)
+        self.edges -= 1
+
+        root, _ = self.find(a)
+        if key in self.forest_edges or root in self.odd:
+            self.forest_edges.discard(key)
+            self.dirty.add(root)
+        for node in key:
+            if node in self.adjacency and not self.adjacency[node]:
+                del self.adjacency[node]
+
+    def repair(self):
+        if not self.dirty:
+            return
+        stale = []
+        for root in self.dirty:
+            stale.extend(self.members.pop(root))
+            self.odd.discard(root)
+        self.dirty.clear()
+        for node in stale:
+            del self.parent[node]
+            del self.parity[node]
+            for key in self.adjacency.get(node, ()):
+                self.forest_edges.discard(key)
+
+        # Union-find components only ever over-approximate the real ones, so the BFS stays within `stale`
+        for start in stale:
+            if start in self.parent or start not in self.adjacency:
+                continue
+            self.parent[start] = start
+            self.parity[start] = 0
+            component = [start]
+            for node in component:
+                colour = self.parity[node]
+                for key, neighbour in self.adjacency[node].items():
+                    if neighbour not in self.parent:
+                        self.parent[neighbour] = start
+                        self.parity[neighbour] = colour ^ 1
+                        self.forest_edges.add(key)
+                        component.append(neighbour)
+                    elif self.parity[neighbour] == colour:
+                        self.odd.add(start)
+            self.members[start] = component
+
+    def components(self):
+        self.repair()
+        return len(self.members)
+
+    def is_forest(self):
+        self.repair()
+        return self.edges == len(self.adjacency) - len(self.members)
+
+    def is_bipartite(self):
+        self.repair()
+        return not self.odd
+
+    def colouring(self):
+        # node -> (component root, colour); a proper 2-colouring of every bipartite component
+        self.repair()
+        return {node: self.find(node) for node in self.adjacency}
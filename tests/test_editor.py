@@ -0,0 +1,128 @@
+import re
+import unittest
+from document import Document
+from main import CodeEditor
+
+INDEX = re.compile(r'(end|insert|\d+\.(?:\d+|end))((?:[+-]\d+c)*)$')
+
+
+class TextModel:
+    # The index, insert, delete and replace commands of a Tk text widget over a string, enough for
+    # CodeEditor.intercept to run without a display. Like Tk's, the text always ends in a newline that
+    # nothing deletes, and the insert mark is a fixed index.
+    def __init__(self, text, insert='1.0'):
+        self.text = text + '\n'
+        self.insert = insert
+
+    def offset(self, index):
+        base, moves = INDEX.match(index).groups()
+        if base == 'end':
+            offset = len(self.text)
+        else:
+            if base == 'insert':
+                base = self.insert
+            line, column = base.split('.')
+            starts = [0] + [match.end() for match in re.finditer('\n', self.text)]
+            start = starts[min(int(line), len(starts)) - 1]
+            length = self.text.index('\n', start) - start
+            offset = start + (length if column == 'end' else min(int(column), length))
+        for move in re.findall(r'[+-]\d+', moves):
+            offset += int(move)
+        return max(0, min(offset, len(self.text)))
+
+    def position(self, offset):
+        before = self.text[:offset]
+        return f"{before.count(chr(10)) + 1}.{offset - before.rfind(chr(10)) - 1}"
+
+    def call(self, widget, operation, *args):
+        if operation == 'index':
+            return self.position(self.offset(args[0]))
+        last = len(self.text) - 1  # the final newline stays
+        if operation == 'insert':
+            offset = min(self.offset(args[0]), last)
+            self.text = self.text[:offset] + args[1] + self.text[offset:]
+        elif operation == 'delete':
+            start = min(self.offset(args[0]), last)
+            end = min(self.offset(args[1]) if len(args) > 1 else start + 1, last)
+            self.text = self.text[:start] + self.text[max(start, end):]
+        elif operation == 'replace':
+            start = min(self.offset(args[0]), last)
+            end = min(self.offset(args[1]), last)
+            self.text = self.text[:start] + args[2] + self.text[max(start, end):]
+        return ''
+
+    def lines(self):
+        return self.text[:-1].split('\n')
+
+
+def editor(text, insert='1.0'):
+    # A CodeEditor without its widgets, whose Tcl command is the model
+    code_editor = CodeEditor.__new__(CodeEditor)
+    code_editor.tk = TextModel(text, insert)
+    code_editor.widget = 'text'
+    code_editor.edited = None
+    return code_editor
+
+
+class InterceptTest(unittest.TestCase):
+    def edit(self, text, operation, *args, insert='1.0'):
+        # (edited range, lines after the edit); the range is also checked by applying it to a Document
+        code_editor = editor(text, insert)
+        code_editor.intercept(operation, *args)
+        start, old_end, new_end = code_editor.edited
+        lines = code_editor.tk.lines()
+        document = Document()
+        document.update(text)
+        document.edit([(start, old_end, lines[start:new_end])])
+        self.assertEqual(document.lines, lines)
+        return code_editor.edited, lines
+
+    def test_backspace_at_line_start_joins_lines(self):
+        edited, lines = self.edit("a--b\nc--d", 'delete', 'insert-1c', insert='2.0')
+        self.assertEqual(edited, (0, 2, 1))
+        self.assertEqual(lines, ["a--bc--d"])
+
+    def test_delete_at_line_end_joins_lines(self):
+        edited, lines = self.edit("a--b\nc--d\ne--f", 'delete', 'insert', insert='2.4')
+        self.assertEqual(edited, (1, 3, 2))
+        self.assertEqual(lines, ["a--b", "c--de--f"])
+
+    def test_delete_of_a_range_across_lines(self):
+        edited, lines = self.edit("a--b\nc--d\ne--f", 'delete', '1.2', '3.1')
+        self.assertEqual(edited, (0, 3, 1))
+        self.assertEqual(lines, ["a---f"])
+
+    def test_delete_within_a_line(self):
+        edited, lines = self.edit("a--b\nc--d", 'delete', '2.1', '2.3')
+        self.assertEqual(edited, (1, 2, 2))
+
+    def test_insert_of_multi_line_text(self):
+        edited, lines = self.edit("a--b\nc--d\ne--f", 'insert', '2.1', 'x--y\nz--w\n')
+        self.assertEqual(edited, (1, 2, 4))
+        self.assertEqual(lines, ["a--b", "cx--y", "z--w", "--d", "e--f"])
+
+    def test_insert_at_end(self):
+        edited, lines = self.edit("a--b", 'insert', 'end', '\nc--d')
+        self.assertEqual(edited, (0, 1, 2))
+
+    def test_replace(self):
+        edited, lines = self.edit("a--b\nc--d\ne--f", 'replace', '1.3', '3.0', 'c\ng--h\n')
+        self.assertEqual(edited, (0, 3, 3))
+        self.assertEqual(lines, ["a--c", "g--h", "e--f"])
+
+    def test_edits_are_merged(self):
+        code_editor = editor("a--b\nc--d\ne--f\ng--h", insert='2.0')
+        text = code_editor.tk.text[:-1]
+        code_editor.intercept('delete', 'insert-1c')
+        code_editor.intercept('insert', '3.0', 'x--y\n')
+        code_editor.intercept('delete', '1.0', '1.1')
+        start, old_end, new_end = code_editor.edited
+        lines = code_editor.tk.lines()
+        document = Document()
+        document.update(text)
+        document.edit([(start, old_end, lines[start:new_end])])
+        self.assertEqual(document.lines, lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
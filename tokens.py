@@ -11,12 +11,57 @@ class TokenType(Enum):
     WEIGHT = 5
     DESTROY = 6
     START = 7
+    NEWLINE = 8
+    ERROR = 9  # an illegal character, when the lexer is collecting diagnostics instead of raising
 
 
-@dataclass
+@dataclass(slots=True)
 class Token:
     type: TokenType
     value: any = None
 
     def __repr__(self):
         return self.type.name + (f":{self.value}" if self.value is not None else "")
+
+
+# Shared tokens for the fixed punctuation. Tokens carry no positions and nothing mutates a token once it is
+# yielded, so one instance per type is enough.
+PUNCTUATION = {token_type: Token(token_type) for token_type in (
+    TokenType.DASH, TokenType.LEFT, TokenType.RIGHT, TokenType.FINAL, TokenType.DESTROY, TokenType.START)}
+NEWLINE_TOKEN = Token(TokenType.NEWLINE)
+
+# How token types are named in diagnostics; None stands for the end of the line
+TOKEN_NAMES = {
+    TokenType.DASH: "'-'",
+    TokenType.NAME: "name",
+    TokenType.LEFT: "'<'",
+    TokenType.RIGHT: "'>'",
+    TokenType.FINAL: "'*'",
+    TokenType.WEIGHT: "weight",
+    TokenType.DESTROY: "'/'",
+    TokenType.START: "'=>'",
+    TokenType.ERROR: "illegal character",
+    None: "end of line",
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Diagnostic:
+    # A syntax error: 1-based line and columns (end exclusive; None where the tokens carried no positions),
+    # the message, and the names of the tokens that would have been accepted there
+    line: int
+    column: int
+    end: int
+    message: str
+    expected: tuple = ()
+
+    def __str__(self):
+        where = f"line {self.line}" if self.column is None else f"line {self.line}, column {self.column}"
+        return f"{self.message} at {where}"
+
+
+class ParseError(Exception):
+    # Raised for the first syntax error when no diagnostics list is given to the Lexer or Parser
+    def __init__(self, diagnostic):
+        super().__init__(str(diagnostic))
+        self.diagnostic = diagnostic
@@ -0,0 +1,170 @@
+import networkx as nx
+
+# Minimum horizontal distance between neighbouring subtrees, in the units of the unscaled layout
+DISTANCE = 1.0
+
+
+def tree_roots(G):
+    # One root per tree of the forest: a node without incoming edges if the tree has one
+    roots = []
+    for component in nx.weakly_connected_components(G) if G.is_directed() else nx.connected_components(G):
+        sources = [node for node in component if G.is_directed() and G.in_degree(node) == 0]
+        roots.append(sources[0] if sources else next(iter(component)))
+    return roots
+
+
+def build_tree(G, root, index, parent, children):
+    # Breadth-first over the undirected structure, so edge direction does not hide any branch
+    index[root] = len(parent)
+    parent.append(-1)
+    children.append([])
+    order = [root]
+    for node in order:
+        neighbors = list(G.successors(node)) + list(G.predecessors(node)) if G.is_directed() else G.neighbors(node)
+        for neighbor in neighbors:
+            if neighbor not in index:
+                index[neighbor] = len(parent)
+                parent.append(index[node])
+                children.append([])
+                children[index[node]].append(index[neighbor])
+                order.append(neighbor)
+    return order
+
+
+def tidy_tree_layout(G, roots=None, width=1., vert_gap=0.2, vert_loc=0, xcenter=0.5):
+    # Reingold-Tilford tidy drawing in Buchheim/Junger/Leipert's linear-time form, run with explicit
+    # stacks instead of recursion. Each tree of a forest is laid out on its own and placed side by side.
+    if roots is None:
+        roots = tree_roots(G)
+
+    index = {}
+    parent = []
+    children = []
+    nodes = []
+    for root in roots:
+        nodes.extend(build_tree(G, root, index, parent, children))
+
+    n = len(nodes)
+    number = [0] * n
+    for kids in children:
+        for i, child in enumerate(kids):
+            number[child] = i
+    prelim = [0.0] * n
+    mod = [0.0] * n
+    shift = [0.0] * n
+    change = [0.0] * n
+    thread = [-1] * n
+    ancestor = list(range(n))
+    default_ancestor = [kids[0] if kids else -1 for kids in children]
+
+    def left_sibling(v):
+        return children[parent[v]][number[v] - 1] if parent[v] >= 0 and number[v] > 0 else -1
+
+    def next_left(v):
+        return children[v][0] if children[v] else thread[v]
+
+    def next_right(v):
+        return children[v][-1] if children[v] else thread[v]
+
+    def move_subtree(wl, wr, amount):
+        subtrees = number[wr] - number[wl]
+        change[wr] -= amount / subtrees
+        shift[wr] += amount
+        change[wl] += amount / subtrees
+        prelim[wr] += amount
+        mod[wr] += amount
+
+    def apportion(v, default):
+        w = left_sibling(v)
+        if w < 0:
+            return default
+        vir = vor = v
+        vil = w
+        vol = children[parent[v]][0]
+        sir = sor = mod[v]
+        sil = mod[vil]
+        sol = mod[vol]
+        while next_right(vil) >= 0 and next_left(vir) >= 0:
+            vil = next_right(vil)
+            vir = next_left(vir)
+            vol = next_left(vol)
+            vor = next_right(vor)
+            ancestor[vor] = v
+            amount = (prelim[vil] + sil) - (prelim[vir] + sir) + DISTANCE
+            if amount > 0:
+                left = ancestor[vil] if parent[ancestor[vil]] == parent[v] else default
+                move_subtree(left, v, amount)
+                sir += amount
+                sor += amount
+            sil += mod[vil]
+            sir += mod[vir]
+            sol += mod[vol]
+            sor += mod[vor]
+        if next_right(vil) >= 0 and next_right(vor) < 0:
+            thread[vor] = next_right(vil)
+            mod[vor] += sil - sor
+        if next_left(vir) >= 0 and next_left(vol) < 0:
+            thread[vol] = next_left(vir)
+            mod[vol] += sir - sol
+            default = v
+        return default
+
+    def finish(v):
+        # The tail of Buchheim's first walk, run once all children of v are placed
+        kids = children[v]
+        w = left_sibling(v)
+        if not kids:
+            prelim[v] = prelim[w] + DISTANCE if w >= 0 else 0.0
+        else:
+            total_shift = total_change = 0.0
+            for child in reversed(kids):
+                prelim[child] += total_shift
+                mod[child] += total_shift
+                total_change += change[child]
+                total_shift += shift[child] + total_change
+            midpoint = (prelim[kids[0]] + prelim[kids[-1]]) / 2
+            if w >= 0:
+                prelim[v] = prelim[w] + DISTANCE
+                mod[v] = prelim[v] - midpoint
+            else:
+                prelim[v] = midpoint
+        if parent[v] >= 0:
+            default_ancestor[parent[v]] = apportion(v, default_ancestor[parent[v]])
+
+    # First walk: post-order with an explicit stack of (node, next child position)
+    tree_roots_index = [index[root] for root in roots]
+    for root in tree_roots_index:
+        stack = [(root, 0)]
+        while stack:
+            v, i = stack.pop()
+            if i < len(children[v]):
+                stack.append((v, i + 1))
+                stack.append((children[v][i], 0))
+            else:
+                finish(v)
+
+    # Second walk: pre-order accumulation of the modifiers; trees are offset to sit side by side
+    x = [0.0] * n
+    depth = [0] * n
+    offset = 0.0
+    for root in tree_roots_index:
+        stack = [(root, 0.0)]
+        members = []
+        while stack:
+            v, m = stack.pop()
+            x[v] = prelim[v] + m
+            members.append(v)
+            for child in children[v]:
+                depth[child] = depth[v] + 1
+                stack.append((child, m + mod[v]))
+        low = min(x[v] for v in members)
+        high = max(x[v] for v in members)
+        for v in members:
+            x[v] += offset - low
+        offset += high - low + DISTANCE
+
+    low = min(x) if x else 0.0
+    high = max(x) if x else 0.0
+    scale = width / (high - low) if high > low else 0.0
+    return {node: (xcenter - width / 2 + (x[i] - low) * scale if scale else xcenter, vert_loc - depth[i] * vert_gap)
+            for i, node in enumerate(nodes)}
@@ -1,36 +1,131 @@
-import matplotlib.pyplot as plt
+import random
+import threading
 import networkx as nx
-from dataclasses import dataclass
+import profiling
+from contextlib import contextmanager
 from matplotlib.figure import Figure
-
-@dataclass(frozen=True)
-class Number:
-    value: float
-
-@dataclass(frozen=True)
-class Name:
-    value: str
-    final: bool
-    start: bool
-
-@dataclass(frozen=True)
-class Connection:
-    name_a: Name
-    name_b: Name
-    weight: Number
-    destroy: bool
-    left_dir: bool  
-    right_dir: bool  
+from automaton import Automaton
+from force_layout import force_directed_positions
+from nodes import Connection, Name, Number  # re-exported: the value objects live with the parser
+from queries import GraphQueries
+from renderer import EDGE_STYLES, Renderer  # EDGE_STYLES re-exported
+from store import CompactGraphStore, NetworkxStore
+from structure import StructureIndex
+from tree_layout import tidy_tree_layout
 
 class Graph:
-    def __init__(self, fig: Figure):
-        self.G = nx.DiGraph()
+    def __init__(self, fig: Figure, compact=False, queries=True):
+        # compact=True keeps the graph in array-backed edge tables (see store.py) instead of a networkx.DiGraph.
+        # queries=False disables the start/final index (see queries.py); otherwise it is built on first use.
+        self.store = CompactGraphStore() if compact else NetworkxStore()
+        self.track_queries = queries
+        self._queries = None
+        # (a, b) -> (name_a, name_b) for the edges that mark an end as start or final, which the store does not keep
+        self.markers = {}
+        # Components, cycles and a 2-colouring for the tree and bipartite modes; see the structure property
+        self._structure = None
         self.fig = fig
         self.ax = self.fig.add_subplot(111)
+        # Keeps the artists of the drawn graph between renders (see renderer.py)
+        self.renderer = Renderer(self.ax)
         self.mode = "default"
+        self._batch_depth = 0
+        self._dirty = False
+        # Held while the graph is mutated or read from more than one thread (see GraphWorker)
+        self.lock = threading.RLock()
+
+        # Positions computed per layout mode, and the graph version and store node_version they were computed for
+        self.layouts = {}
+        self.layout_versions = {}
+        self.layout_nodes = {}
+        self.version = 0
+        self.refine_iterations = 10
+        self.rng = random.Random(0)
+        # Above this many nodes the default layout switches to the NumPy force-directed engine
+        self.large_graph_threshold = 1000
+        self.layout_seed = 0
+        # (version, Automaton) compiled by automaton(), recompiled once the graph has changed
+        self._automaton = None
+
+    @property
+    def queries(self):
+        # The start/final index, or None with queries=False. Built from the store the first time it is read
+        # and maintained edge by edge after that, so graphs that are never queried do not pay for it.
+        if self._queries is None and self.track_queries:
+            self._queries = GraphQueries.from_store(self.store, self.markers)
+        return self._queries
+
+    @property
+    def structure(self):
+        # The StructureIndex (see structure.py), built from the store when the tree or bipartite mode first
+        # needs it and maintained edge by edge after that; its adjacency costs more per edge than the store
+        if self._structure is None:
+            self._structure = StructureIndex.from_store(self.store)
+        return self._structure
+
+    @property
+    def G(self):
+        # networkx view of the graph; with the compact store it is built on first use after a mutation
+        return self.store.to_networkx()
 
     def set_mode(self, mode):
+        changed = mode != self.mode
         self.mode = mode
+        if changed and len(self.store):
+            self.request_draw()
+
+    def relayout(self):
+        # Drops the cached positions of the current mode and lays the graph out from scratch
+        self.layouts.pop(self.mode, None)
+        self.layout_versions.pop(self.mode, None)
+        self.request_draw()
+
+    def automaton(self):
+        # Transition tables of the graph as a weighted automaton (see automaton.py), cached per graph version
+        if self._automaton is None or self._automaton[0] != self.version:
+            self._automaton = (self.version, Automaton.from_graph(self))
+        return self._automaton[1]
+
+    def clear(self):
+        # Empties the graph, keeping the kind of store it uses
+        self.store = type(self.store)()
+        self.markers = {}
+        self.reset_indexes()
+        self.version += 1
+        self.layouts.clear()
+        self.layout_versions.clear()
+        self.layout_nodes.clear()
+        self.request_draw()
+
+    def reset_indexes(self):
+        # Resets the indexes derived from the store, after it was replaced as a whole (see snapshot.load_snapshot)
+        self._structure = None
+        self._queries = None
+
+    @contextmanager
+    def batch(self, draw=True):
+        # Mutations inside the block only mark the graph dirty; it is laid out and drawn once on exit.
+        # With draw=False the caller takes care of layout and rendering (e.g. off the GUI thread).
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._dirty and draw:
+                self.draw()
+
+    def apply_delta(self, added=(), removed=()):
+        with self.batch():
+            for connection in removed:
+                self.remove_connection(connection)
+            for connection in added:
+                self.add_connection(connection)
+
+    def request_draw(self):
+        if self._batch_depth:
+            self._dirty = True
+        else:
+            self.draw()
 
     def add_connection(self, connection):
         if not connection.destroy:
@@ -44,107 +139,182 @@ class Graph:
             else:
                 style = 'line'  
 
-            self.G.add_edge(connection.name_a.value, connection.name_b.value,
-                            weight=connection.weight.value, style=style)
-        self.draw()
+            name_a = connection.name_a
+            name_b = connection.name_b
+            key = (name_a.value, name_b.value)
+            # Only a new edge changes the structure; a re-declared one keeps its place in it
+            track = self._structure is not None and not self.store.has_edge(*key)
+            self.store.add_edge(name_a.value, name_b.value, connection.weight.value, style)
+            if track:
+                self._structure.add_edge(*key)
+            if name_a.start or name_a.final or name_b.start or name_b.final:
+                self.markers[key] = (name_a, name_b)
+            elif self.markers:
+                self.markers.pop(key, None)
+            if self._queries is not None:
+                self._queries.add_edge(name_a, name_b, connection.weight.value, style)
+            self.version += 1
+        self.request_draw()
 
     def draw(self):
-        self.ax.clear()
-        if len(self.G) == 0:
-            self.fig.canvas.draw()
-            return
+        self._dirty = False
+        self.render(self.layout())
+
+    def render(self, pos):
+        # Draws the graph at the given positions, updating only what changed since the last render
+        with profiling.stage('render'):
+            self.renderer.render(self, pos)
 
-        if self.mode == "default":
-            pos = nx.kamada_kawai_layout(self.G)  # Using a layout that better handles overlaps
-        elif self.mode == "bipartite":
-            top_nodes, bottom_nodes = self.get_bipartite_nodes()
-            pos = nx.bipartite_layout(self.G, top_nodes)
-        elif self.mode == "tree":
-            if not nx.is_tree(self.G):
-                print("Cannot use tree layout on a graph that is not a tree. Falling back to default layout.")
-                pos = nx.kamada_kawai_layout(self.G)
+    def layout(self):
+        # Returns cached positions for the current mode, recomputing them only if the graph changed since
+        mode = self.mode
+        if len(self.store) == 0:
+            return {}
+        if self.layout_versions.get(mode) == self.version:
+            profiling.count('layout_cache_hits')
+            return self.layouts[mode]
+
+        with profiling.stage('layout'):
+            if mode == "bipartite" and self.structure.is_bipartite():
+                top_nodes, bottom_nodes = self.get_bipartite_nodes()
+                pos = nx.bipartite_layout(self.G, top_nodes)
+            elif mode == "tree" and self.structure.is_forest():
+                pos = tidy_tree_layout(self.G)
+            else:
+                if mode == "tree":
+                    print("Cannot use tree layout on a graph that is not a forest. Falling back to default layout.")
+                elif mode == "bipartite":
+                    print("Cannot use bipartite layout on a graph with an odd cycle. Falling back to default layout.")
+                pos = self.default_layout()
+        profiling.count(f'layouts_computed.{mode}')
+
+        self.layouts[mode] = pos
+        self.layout_versions[mode] = self.version
+        return pos
+
+    def default_layout(self):
+        # Warm-starts from the previous default positions: only new nodes and their neighbours move
+        previous = self.layouts.get("default")
+        if self.layout_versions.get("default") == self.version:
+            return previous
+        if not previous:
+            if len(self.store) > self.large_graph_threshold:
+                pos = force_directed_positions(*self.store.edge_arrays(), seed=self.layout_seed)
             else:
-                pos = self.hierarchy_pos(self.G)
-
-        nx.draw_networkx_nodes(self.G, pos, node_color='skyblue', node_size=700, ax=self.ax)
-        nx.draw_networkx_labels(self.G, pos, font_weight='bold', ax=self.ax)
-
-        edge_labels = {}
-        for edge in self.G.edges(data=True):
-            style = edge[2].get('style', 'line')
-            weight = edge[2]['weight']
-            if weight > 0:
-                edge_labels[(edge[0], edge[1])] = f"{weight}"
-
-            if style == 'double_arrow':
-                nx.draw_networkx_edges(self.G, pos, edgelist=[(edge[0], edge[1])],
-                                       arrowstyle='<->', arrowsize=20, ax=self.ax)
-            elif style == 'left_arrow':
-                nx.draw_networkx_edges(self.G, pos, edgelist=[(edge[0], edge[1])],
-                                       arrowstyle='<-', arrowsize=20, ax=self.ax)
-            elif style == 'right_arrow':
-                nx.draw_networkx_edges(self.G, pos, edgelist=[(edge[0], edge[1])],
-                                       arrowstyle='->', arrowsize=20, ax=self.ax)
+                pos = nx.kamada_kawai_layout(self.G)  # Using a layout that better handles overlaps
+        elif self.layout_nodes.get("default") == self.store.changes.node_version:
+            # No node was added or removed, so every node keeps its place. Handing back the same mapping also
+            # tells the renderer that no node has moved.
+            pos = previous
+        else:
+            pos = {node: previous[node] for node in self.store.nodes() if node in previous}
+            new_nodes = [node for node in self.store.nodes() if node not in pos]
+            if new_nodes:
+                pos = self.place_new_nodes(pos, new_nodes)
+
+        self.layouts["default"] = pos
+        self.layout_versions["default"] = self.version
+        self.layout_nodes["default"] = self.store.changes.node_version
+        return pos
+
+    def place_new_nodes(self, pos, new_nodes):
+        # Seeds each new node next to its already placed neighbours, then refines around the new nodes
+        neighbors = {node: self.store.neighbors(node) for node in new_nodes}
+        xs = [x for x, y in pos.values()] or [0.0]
+        ys = [y for x, y in pos.values()] or [0.0]
+        spread = max(max(xs) - min(xs), max(ys) - min(ys), 1.0) * 0.05
+
+        for node in new_nodes:
+            placed = [pos[neighbor] for neighbor in neighbors[node] if neighbor in pos]
+            if placed:
+                cx = sum(x for x, y in placed) / len(placed)
+                cy = sum(y for x, y in placed) / len(placed)
             else:
-                nx.draw_networkx_edges(self.G, pos, edgelist=[(edge[0], edge[1])],
-                                       arrowstyle='-', ax=self.ax)
+                cx = self.rng.uniform(min(xs), max(xs))
+                cy = self.rng.uniform(min(ys), max(ys))
+            pos[node] = (cx + self.rng.uniform(-spread, spread), cy + self.rng.uniform(-spread, spread))
 
-        nx.draw_networkx_edge_labels(self.G, pos, edge_labels=edge_labels, ax=self.ax)
+        movable = set(new_nodes)
+        for node in new_nodes:
+            movable.update(neighbors[node])
+        fixed = [node for node in self.store.nodes() if node not in movable]
 
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
+        if len(self.store) > self.large_graph_threshold:
+            return force_directed_positions(*self.store.edge_arrays(), pos=pos, fixed=fixed,
+                                            iterations=self.refine_iterations)
+        return nx.spring_layout(self.G, pos=pos, fixed=fixed or None, iterations=self.refine_iterations,
+                                seed=self.rng.randrange(2 ** 32))
 
     def get_bipartite_nodes(self):
-        top_nodes = {n for n in self.G if n.islower()}
-        bottom_nodes = {n for n in self.G if n.isupper()}
+        # The two colour classes of the graph. Each component may be flipped freely, so it is turned to put
+        # most of its lowercase names on top, the split this mode used to assume.
+        colouring = self.structure.colouring()
+        votes = {}
+        for node, (root, colour) in colouring.items():
+            if node.islower() or node.isupper():
+                votes[root] = votes.get(root, 0) + (1 if node.islower() != bool(colour) else -1)
+        top_nodes = set()
+        bottom_nodes = set()
+        for node, (root, colour) in colouring.items():
+            if bool(colour) == (votes.get(root, 0) < 0):
+                top_nodes.add(node)
+            else:
+                bottom_nodes.add(node)
         return top_nodes, bottom_nodes
 
     def remove_connection(self, connection):
         # This method checks if an edge between name_a and name_b exists and removes it.
-        if self.G.has_edge(connection.name_a.value, connection.name_b.value):
-            self.G.remove_edge(connection.name_a.value, connection.name_b.value)
-            print(f"Removed edge from {connection.name_a.value} to {connection.name_b.value}")
-        elif self.G.has_edge(connection.name_b.value, connection.name_a.value):
+        a = connection.name_a.value
+        b = connection.name_b.value
+        if self.store.has_edge(a, b):
+            self.remove_edge(a, b)
+            print(f"Removed edge from {a} to {b}")
+        elif self.store.has_edge(b, a):
             # Check the other direction as well, in case the edge is bidirectional or reversed
-            self.G.remove_edge(connection.name_b.value, connection.name_a.value)
-            print(f"Removed edge from {connection.name_b.value} to {connection.name_a.value}")
+            self.remove_edge(b, a)
+            print(f"Removed edge from {b} to {a}")
 
         # Check if either node is now isolated and remove it if so
-        if self.G.degree(connection.name_a.value) == 0:
-            self.G.remove_node(connection.name_a.value)
-            print(f"Removed isolated node: {connection.name_a.value}")
+        for node in (a, b):
+            if self.store.degree(node) == 0:
+                self.store.remove_node(node)
+                print(f"Removed isolated node: {node}")
+
+        self.version += 1
+        self.request_draw()
 
-        if self.G.degree(connection.name_b.value) == 0:
-            self.G.remove_node(connection.name_b.value)
-            print(f"Removed isolated node: {connection.name_b.value}")
+    def remove_edge(self, a, b):
+        # Removes the edge a -> b from the store and the indexes, leaving both nodes in place
+        self.store.remove_edge(a, b)
+        if self._structure is not None:
+            self._structure.remove_edge(a, b)
+        self.markers.pop((a, b), None)
+        if self._queries is not None:
+            self._queries.remove_edge(a, b)
 
-        self.draw()
+    def set_connection(self, connection):
+        # Makes the connection the only command in effect for its pair of names, whichever way round either
+        # was written: an edge is overwritten in place, or reversed, and a destroy removes it. This is the bulk
+        # path of importer.apply_connections, so nothing is printed and a node is only removed once isolated.
+        a = connection.name_a.value
+        b = connection.name_b.value
+        if a != b and self.store.has_edge(b, a):
+            self.remove_edge(b, a)
+            self.version += 1
+        if not connection.destroy:
+            self.add_connection(connection)
+            return
+        if self.store.has_edge(a, b):
+            self.remove_edge(a, b)
+            self.version += 1
+        for node in (a, b):
+            if self.store.degree(node) == 0:
+                self.store.remove_node(node)
+        self.request_draw()
 
     def hierarchy_pos(self, G, root=None, width=1., vert_gap=0.2, vert_loc=0, xcenter=0.5):
-        if not nx.is_tree(G):
+        if not (self.structure.is_forest() if G is self.G else nx.is_forest(G)):
             raise TypeError('Cannot use hierarchy_pos on a graph that is not a tree')
 
-        if root is None:
-            if isinstance(G, nx.DiGraph):
-                root = next(iter(nx.topological_sort(G)))  # allows for ordering of DAGs
-            else:
-                root = next(iter(G.nodes))  # otherwise choose arbitrary node
-
-        def _hierarchy_pos(G, root, width=1., vert_gap=0.2, vert_loc=0, xcenter=0.5, pos=None, parent=None, parsed=[]):
-            if pos is None:
-                pos = {root: (xcenter, vert_loc)}
-            else:
-                pos[root] = (xcenter, vert_loc)
-            children = list(G.neighbors(root))
-            if not isinstance(G, nx.DiGraph) and parent is not None:
-                children.remove(parent)
-            if len(children) != 0:
-                dx = width / len(children)
-                nextx = xcenter - width / 2 - dx / 2
-                for child in children:
-                    nextx += dx
-                    pos = _hierarchy_pos(G, child, width=dx, vert_gap=vert_gap, vert_loc=vert_loc - vert_gap, xcenter=nextx,
-                                         pos=pos, parent=root, parsed=parsed)
-            return pos
-
-        return _hierarchy_pos(G, root, width, vert_gap, vert_loc, xcenter)
+        return tidy_tree_layout(G, roots=[root] if root is not None else None, width=width,
+                                vert_gap=vert_gap, vert_loc=vert_loc, xcenter=xcenter)
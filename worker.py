@@ -0,0 +1,166 @@
+import os
+import queue
+import threading
+import profiling
+from document import Document
+from importer import apply_connections, parse_chunk, read_chunks
+from snapshot import load_snapshot
+
+
+class GraphWorker:
+    # Parses edits and computes layouts on a background thread. Only the newest pending job is kept, and
+    # results carry the generation of the job that produced them so the GUI can drop stale ones.
+    def __init__(self, graph):
+        self.graph = graph
+        self.document = Document()
+        # Lines of the editor text the graph currently shows (see the text property), or None if it came from a
+        # streamed file or a snapshot without text. The document changes them in place, under graph.lock.
+        self.lines = self.document.lines
+        # (bytes done, total bytes) of the file being streamed in by import_file
+        self.progress = None
+        # Syntax errors of the editor text as of the last processed edit
+        self.diagnostics = []
+        self.results = queue.Queue()
+        self._condition = threading.Condition()
+        self._job = None
+        self._thread = threading.Thread(target=self._run, name="graph-worker", daemon=True)
+        self._thread.start()
+
+    @property
+    def text(self):
+        # The editor text the graph currently shows, joined on demand; read it under graph.lock
+        return None if self.lines is None else '\n'.join(self.lines)
+
+    def submit(self, generation, text, mode, relayout=False, edit=None):
+        # The editor text is given whole as text, or as the edit (start, old_end, lines) of the lines changed since
+        # the last submission (see Document.edit). Neither keeps the current graph and only applies the mode and
+        # relayout (e.g. after import_file).
+        edits = (edit,) if edit is not None else ()
+        with self._condition:
+            job = self._job
+            if job is not None and job[5] is not None and text is None and not edits:
+                # A mode change before an import has started is folded into the import
+                self._job = (generation, None, (), mode, False, job[5], None)
+            else:
+                if job is not None and job[5] is None:
+                    # An unstarted edit or snapshot load is superseded. New text replaces its text and edits;
+                    # new edits follow them, as they were made against its text. Keep any relayout.
+                    if text is None:
+                        text, edits = job[1], job[2] + edits
+                    relayout = relayout or job[4]
+                self._job = (generation, text, edits, mode, relayout, None, job[6] if job is not None else None)
+            self._condition.notify()
+
+    def import_file(self, generation, pages, mode):
+        # Streams the file of a PageIndex into an emptied graph, indexing its pages on the way.
+        # New editor text or another import submitted meanwhile cancels it.
+        with self._condition:
+            self._job = (generation, None, (), mode, False, pages, None)
+            self._condition.notify()
+
+    def open_snapshot(self, generation, path, mode):
+        # Replaces the graph with a snapshot file (see snapshot.py) and its saved text
+        with self._condition:
+            self._job = (generation, None, (), mode, False, None, path)
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._job is None:
+                    self._condition.wait()
+                generation, text, edits, mode, relayout, pages, snapshot = self._job
+                self._job = None
+
+            try:
+                if pages is not None:
+                    pos = self.stream(pages, mode)
+                elif snapshot is not None:
+                    pos = self.load(snapshot, mode)
+                    if text is not None or edits or relayout:
+                        pos = self.process(text, edits, mode, relayout)
+                else:
+                    pos = self.process(text, edits, mode, relayout)
+                self.results.put((generation, pos, None))
+            except Exception as e:
+                self.results.put((generation, None, e))
+
+    def stream(self, pages, mode):
+        path = pages.path
+        total = os.path.getsize(path)
+        self.progress = (0, total)
+        # The editor text no longer describes the graph; see process()
+        self.document = None
+        self.diagnostics = []
+        with self.graph.lock:
+            self.lines = None
+            with self.graph.batch(draw=False):
+                self.graph.clear()
+                self.graph.set_mode(mode)
+
+        errors = 0
+        for data, start in read_chunks(path):
+            pages.add_chunk(data, start)
+            with profiling.stage('parse'):
+                connections, chunk_errors = parse_chunk(data.decode('utf-8'))
+            errors += len({diagnostic.line for diagnostic in chunk_errors})
+            with self.graph.lock:
+                with profiling.stage('mutation'), self.graph.batch(draw=False):
+                    apply_connections(self.graph, connections)
+            self.progress = (start + len(data), total)
+            job = self._job
+            if job is not None and (job[1] is not None or job[2] or job[5] is not None or job[6] is not None):
+                return None  # New text or another file replaces this one; mode changes wait for the import
+
+        pages.finish(total)
+        if errors:
+            print(f"Skipped {errors} invalid lines while importing {path}")
+        with self.graph.lock:
+            return self.graph.layout()
+
+    def process(self, text, edits, mode, relayout=False):
+        profiling.begin_edit()
+        # After import_file the graph came from a file, not the editor; new editor text replaces it
+        replace = text is not None and self.document is None
+        if replace:
+            self.document = Document()
+        changed = text is not None or bool(edits)
+        if text is not None:
+            with profiling.stage('diff'):
+                edits = (self.document.diff(text),) + edits
+        with self.graph.lock:
+            # Only the edited lines are parsed, so the text and the graph are changed together under the lock
+            added, removed = self.document.edit(edits) if changed else ((), ())
+            if changed:
+                self.diagnostics = self.document.diagnostics()
+            with profiling.stage('mutation'), self.graph.batch(draw=False):
+                if replace:
+                    self.graph.clear()
+                self.graph.set_mode(mode)
+                if relayout:
+                    self.graph.relayout()
+                self.graph.apply_delta(added, removed)
+            if changed:
+                self.lines = self.document.lines
+            profiling.count('connections_added', len(added))
+            profiling.count('connections_removed', len(removed))
+            return self.graph.layout()
+
+    def load(self, path, mode):
+        # The snapshot's edges are the parse of its saved text, so that text only seeds a new Document for the
+        # edits that follow; nothing is re-applied to the graph and its version, and so the saved layouts, stay
+        with self.graph.lock:
+            with self.graph.batch(draw=False), load_snapshot(path, self.graph) as snapshot:
+                self.graph.set_mode(mode)
+                text = snapshot.text()
+            self.lines = None if text is None else text.split('\n')
+        if text is None:
+            # Like a streamed file: the editor is read-only and new text replaces the graph (see process())
+            self.document = None
+            self.diagnostics = []
+        else:
+            self.document = Document()
+            self.document.update(text)
+            self.diagnostics = self.document.diagnostics()
+        with self.graph.lock:
+            return self.graph.layout()